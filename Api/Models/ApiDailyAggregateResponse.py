@@ -1,7 +1,9 @@
 
+import orjson
+
 from pydantic import BaseModel
 from typing import Dict, Self, List
-from Models.DailyAggregate import DailyAggregate
+from Models.DailyAggregate import DailyAggregate, DailyAggregateRecord
 
 class ApiDailyAggregateResponse(BaseModel):
 
@@ -26,4 +28,15 @@ class ApiDailyAggregateResponse(BaseModel):
 			ApiDailyAggregateResponseDict[DailyAggregateItem.Date][DailyAggregateItem.Type] = DailyAggregateItem.TotalAmount
 
 		return ApiDailyAggregateResponse(data = ApiDailyAggregateResponseDict)
+
+	def EncodeFromDailyAggregateList(DailyAggregateList : List[DailyAggregate] | List[DailyAggregateRecord]) -> bytes:
+
+		# Same JSON as MapFromDailyAggregateList(...).model_dump(), without building and validating the model
+		ApiDailyAggregateResponseDict = {}
+
+		for DailyAggregateItem in DailyAggregateList:
+
+			ApiDailyAggregateResponseDict.setdefault(DailyAggregateItem.Date, {})[DailyAggregateItem.Type] = DailyAggregateItem.TotalAmount
+
+		return orjson.dumps({ "data" : ApiDailyAggregateResponseDict })
 			
\ No newline at end of file
@@ -0,0 +1,29 @@
+
+from fastapi import APIRouter, Request
+from fastapi.responses import ORJSONResponse
+
+HealthRouter = APIRouter \
+(
+	prefix = "/health"
+)
+
+# Readiness probe, answers 503 while an aggregator worker process is dead and not restarted yet
+@HealthRouter.get("/ready", include_in_schema = False)
+async def GetReadiness(ApiRequest : Request):
+
+	Pool = getattr(ApiRequest.app.state, "WorkerProcessPool", None)
+
+	if Pool is None:
+
+		return ORJSONResponse({ "status" : "ready" })
+
+	IsHealthy = Pool.IsHealthy()
+
+	ReadinessDict = \
+	{
+		"status" : "ready" if IsHealthy else "unavailable",
+		"worker_processes_alive" : Pool.GetAliveCount(),
+		"worker_processes" : len(Pool.GetProcesses())
+	}
+
+	return ORJSONResponse(ReadinessDict, status_code = 200 if IsHealthy else 503)
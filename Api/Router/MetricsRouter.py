@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+from AppConfig import GetAppConfig
+from Api.Services import MetricsServices
+
+MetricsRouter = APIRouter \
+(
+	prefix = "/metrics"
+)
+
+# Served on /metrics itself, scrapers are not redirected to /metrics/
+@MetricsRouter.get("", include_in_schema = False)
+async def GetMetrics(ApiRequest : Request):
+
+	MetricsText = await MetricsServices.RenderMetrics(ApiRequest.app.state, GetAppConfig())
+
+	return Response(MetricsText, media_type = MetricsServices.MetricsContentType)
@@ -1,28 +1,44 @@
 
+import orjson
+
 from typing import List
 from redis.asyncio import Redis
 from Api.Services import StatsServices
+from Api.Services.StatsCache import StatsCache
+from Api.Services.HotDayCache import HotDayCache
+from Api.Services.StatsRequestCoalescer import StatsRequestCoalescer
 from datetime import datetime, timezone
-from Models.DailyAggregate import DailyAggregate
+from Models.DailyAggregate import DailyAggregateRecord
+from Models.AggregateRollup import StatsGranularity, StatsBreakdown
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from fastapi import APIRouter, Request, Query, Depends
-from HelperMethods import GetRedis, GetMongoDb, GetDayDateFormat
+from fastapi.responses import Response, StreamingResponse
+from AppConfig import GetAppConfig
+from HelperMethods import GetRedis, GetMongoDb, GetStatsCache, GetHotDayCache, GetStatsRequestCoalescer, GetDayDateFormat
 from Exceptions.Exceptions import InvalidQueryParameterApiException 
 from Api.Models.ApiDailyAggregateResponse import ApiDailyAggregateResponse
+from Monitoring.Metrics import PipelineMetrics, ObserveDuration, ObserveIteratorDuration
 
 StatsRouter = APIRouter \
 (
 	prefix = "/stats"
 )
 
-@StatsRouter.get("/")
+# The response model documents the schema, handlers return pre-encoded bytes that skip its validation
+@StatsRouter.get("/", response_model = ApiDailyAggregateResponse)
 async def GetStatsByDataRange \
 	(
 		ApiRequest : Request,
 		From : str = Query(..., pattern = r'^\d{4}-\d{2}-\d{2}$', description = "Start date (YYYY-MM-DD)", alias = "from_date"),
 		To : str = Query(..., pattern = r'^\d{4}-\d{2}-\d{2}$', description = "End date (YYYY-MM-DD)", alias = "to_date"),
+		Granularity : StatsGranularity = Query(StatsGranularity.Day, description = "Bucket size of the result: day, week (keyed by Monday), month (keyed by first day) or total", alias = "granularity"),
+		Breakdown : StatsBreakdown = Query(StatsBreakdown.Type, description = "Keys of a total: per type and payment method (type) or per payment method across types (payment_method)", alias = "breakdown"),
+		Stream : bool = Query(False, description = "Stream the daily result in date order while it is read, for wide ranges", alias = "stream"),
 		Redis : Redis = Depends(GetRedis),
 		MongoDb : AsyncIOMotorDatabase = Depends(GetMongoDb),
+		Cache : StatsCache = Depends(GetStatsCache),
+		HotCache : HotDayCache = Depends(GetHotDayCache),
+		Coalescer : StatsRequestCoalescer = Depends(GetStatsRequestCoalescer),
 	):
 	
 	FromDate = datetime.strptime(From, GetDayDateFormat()).replace(tzinfo = timezone.utc)
@@ -32,8 +48,35 @@ async def GetStatsByDataRange \
 
 		raise InvalidQueryParameterApiException(status_code = 400, detail = "From parameter must be before or equal to To")
 
-	Result : List[DailyAggregate]= await StatsServices.GetStats(Redis, MongoDb, FromDate, ToDate)
+	if Stream and Granularity == StatsGranularity.Day:
+
+		# Written while the MongoDb cursor and the Redis tail are read, memory does not grow with the range, the days are neither coalesced nor cached
+		StatsStream = StatsServices.StreamStats(Redis, MongoDb, FromDate, ToDate, GetAppConfig().StatsStreamBatchSize, HotCache)
+
+		return StreamingResponse(ObserveIteratorDuration(PipelineMetrics.StatsRequestDuration, StatsStream, (Granularity.value,)), media_type = "application/json")
+
+	# Only a total has another breakdown, other granularities share the coalescing key of the default one
+	if Granularity != StatsGranularity.Total:
+
+		Breakdown = StatsBreakdown.Type
+
+	async def EncodeStats() -> bytes:
+
+		if Breakdown == StatsBreakdown.PaymentMethod:
+
+			# Historical days are summed per payment method by a single MongoDb pipeline
+			return orjson.dumps({ "data" : await StatsServices.GetTotalsByPaymentMethod(Redis, MongoDb, FromDate, ToDate, HotCache) })
+
+		if Granularity != StatsGranularity.Day:
+
+			# Whole weeks and months are answered from the rollup collections, daily documents are only read at the edges
+			return orjson.dumps({ "data" : await StatsServices.GetStatsByGranularity(Redis, MongoDb, FromDate, ToDate, Granularity, HotCache) })
+
+		Result : List[DailyAggregateRecord]= await StatsServices.GetStats(Redis, MongoDb, FromDate, ToDate, Cache, HotCache)
+
+		return ApiDailyAggregateResponse.EncodeFromDailyAggregateList(Result)
 
-	ApiResponse : ApiDailyAggregateResponse = ApiDailyAggregateResponse.MapFromDailyAggregateList(Result)
+	# Identical ranges requested while one is computed wait for its encoded body instead of reading the stores again
+	ResponseBody = await ObserveDuration(PipelineMetrics.StatsRequestDuration, EncodeStats() if Coalescer is None else Coalescer.Run(Granularity, FromDate, ToDate, EncodeStats, Breakdown), (Granularity.value,))
 
-	return ApiResponse.model_dump()
+	return Response(ResponseBody, media_type = "application/json")
@@ -0,0 +1,231 @@
+
+import time
+import asyncio
+import logging
+
+from redis.asyncio import Redis
+from collections import OrderedDict
+from HelperMethods import GetRedisAggregateUpdatesChannelName
+from Models.DailyAggregate import DailyAggregateRecord
+from BackgroundTask.CancellationToken import CancellationToken
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+logger = logging.getLogger("uvicorn")
+
+class HotDayCache:
+
+	# Caches the Redis days of /stats (cutoff day onwards) for a few seconds, in front of the HGETALLs of their aggregate keys.
+	# A day written by an aggregator is served at most MaxStaleness seconds after the write, days nobody writes live TimeToLive seconds.
+
+	def __init__(self, Redis : Redis, MaxDays : int, TimeToLive : float, MaxStaleness : float):
+
+		self.Redis = Redis
+		self.MaxDays = MaxDays
+		self.TimeToLive = TimeToLive
+		self.MaxStaleness = MaxStaleness
+
+		# Day -> (Fetch start time, Expiry time, Day records), least recently used days are evicted first
+		self.Entries : OrderedDict[str, Tuple[float, float, List[DailyAggregateRecord]]] = OrderedDict()
+
+		# Day -> Task of the fetch reading it, concurrent requests for the day await the same fetch
+		self.InFlight : Dict[str, asyncio.Task] = {}
+
+		# In flight days written while they were read, their result is only kept for MaxStaleness
+		self.InvalidatedInFlight : Set[str] = set()
+
+		# Without the update channel writes are not seen, TimeToLive only applies while subscribed
+		self.IsSubscribed = False
+
+		self.Metrics : Dict[str, int] = \
+		{
+			"Hits" : 0,
+			"Misses" : 0,
+			"Coalesced" : 0,
+			"Fetches" : 0,
+			"Invalidations" : 0
+		}
+
+	async def GetDays(self, DayList : List[str], FetchDays : Callable[[List[str]], Awaitable[Dict[str, List[DailyAggregateRecord]]]]) -> Dict[str, List[DailyAggregateRecord]]:
+
+		DayRecordDict : Dict[str, List[DailyAggregateRecord]] = {}
+
+		# Day -> Fetch reading it, started by this request or by a concurrent one
+		FetchTaskDict : Dict[str, asyncio.Task] = {}
+
+		MissingDayList : List[str] = []
+
+		for Day in DayList:
+
+			DayRecordList = self.Get(Day)
+
+			if DayRecordList is not None:
+
+				self.Metrics["Hits"] += 1
+
+				DayRecordDict[Day] = DayRecordList
+
+			elif Day in self.InFlight:
+
+				self.Metrics["Coalesced"] += 1
+
+				FetchTaskDict[Day] = self.InFlight[Day]
+
+			else:
+
+				self.Metrics["Misses"] += 1
+
+				MissingDayList.append(Day)
+
+		if MissingDayList:
+
+			# Missing days of a request are read in one round trip, in a task of their own so a cancelled request does not cancel it for the others
+			FetchTask = asyncio.ensure_future(self.Fetch(MissingDayList, FetchDays))
+
+			for Day in MissingDayList:
+
+				self.InFlight[Day] = FetchTask
+
+				self.InvalidatedInFlight.discard(Day)
+
+				FetchTaskDict[Day] = FetchTask
+
+		for FetchTask in set(FetchTaskDict.values()):
+
+			FetchedDayDict = await asyncio.shield(FetchTask)
+
+			DayRecordDict.update((Day, FetchedDayDict.get(Day, [])) for Day, DayFetchTask in FetchTaskDict.items() if DayFetchTask is FetchTask)
+
+		return DayRecordDict
+
+	async def Fetch(self, DayList : List[str], FetchDays : Callable[[List[str]], Awaitable[Dict[str, List[DailyAggregateRecord]]]]) -> Dict[str, List[DailyAggregateRecord]]:
+
+		self.Metrics["Fetches"] += 1
+
+		FetchStartTime = time.monotonic()
+
+		try:
+
+			FetchedDayDict = await FetchDays(DayList)
+
+			for Day in DayList:
+
+				self.Set(Day, FetchedDayDict.setdefault(Day, []), FetchStartTime, IsInvalidated = Day in self.InvalidatedInFlight)
+
+			return FetchedDayDict
+
+		finally:
+
+			for Day in DayList:
+
+				self.InFlight.pop(Day, None)
+
+				self.InvalidatedInFlight.discard(Day)
+
+	def Get(self, Day : str) -> List[DailyAggregateRecord] | None:
+
+		Entry = self.Entries.get(Day)
+
+		if Entry is None:
+
+			return None
+
+		if Entry[1] <= time.monotonic():
+
+			del self.Entries[Day]
+
+			return None
+
+		self.Entries.move_to_end(Day)
+
+		return Entry[2]
+
+	def Set(self, Day : str, DayRecordList : List[DailyAggregateRecord], FetchStartTime : float, IsInvalidated : bool = False):
+
+		if self.MaxDays <= 0:
+
+			return
+
+		# Ages are counted from the fetch start, the read may have happened right after it
+		TimeToLive = self.TimeToLive if self.IsSubscribed and not IsInvalidated else self.MaxStaleness
+
+		self.Entries[Day] = (FetchStartTime, FetchStartTime + TimeToLive, DayRecordList)
+
+		self.Entries.move_to_end(Day)
+
+		while len(self.Entries) > self.MaxDays:
+
+			self.Entries.popitem(last = False)
+
+	def Invalidate(self, DayList : List[str]):
+
+		for Day in DayList:
+
+			self.Metrics["Invalidations"] += 1
+
+			if Day in self.InFlight:
+
+				self.InvalidatedInFlight.add(Day)
+
+			Entry = self.Entries.get(Day)
+
+			if Entry is None:
+
+				continue
+
+			# A written day stays served until MaxStaleness after its fetch, a burst of writes does not empty the cache
+			FetchStartTime, ExpiresAt, DayRecordList = Entry
+
+			self.Entries[Day] = (FetchStartTime, min(ExpiresAt, FetchStartTime + self.MaxStaleness), DayRecordList)
+
+	def Clear(self):
+
+		self.Entries.clear()
+
+		self.InvalidatedInFlight.update(self.InFlight)
+
+	async def ListenForUpdates(self, CancellationToken : CancellationToken, ReconnectInterval : float = 1):
+
+		# Days written by the aggregators of every process arrive on the update channel, comma separated per flushed batch
+		while (not CancellationToken.IsCancelled()):
+
+			try:
+
+				async with self.Redis.pubsub(ignore_subscribe_messages = True) as PubSub:
+
+					await PubSub.subscribe(GetRedisAggregateUpdatesChannelName())
+
+					# Writes made before the subscription were not seen, cached days are read again
+					self.Clear()
+
+					self.IsSubscribed = True
+
+					logger.info("✅ Hot day cache subscribed to aggregate updates.")
+
+					while (not CancellationToken.IsCancelled()):
+
+						Message = await PubSub.get_message(timeout = 1)
+
+						if Message is not None:
+
+							self.Invalidate(Message["data"].decode("utf-8").split(","))
+
+			except Exception as e:
+
+				logger.info(f"⚠️ Hot day cache lost the aggregate updates channel: {e}")
+
+			finally:
+
+				# Writes are not seen anymore, days cached until now could stay TimeToLive seconds behind
+				if self.IsSubscribed:
+
+					self.Clear()
+
+				self.IsSubscribed = False
+
+			if not CancellationToken.IsCancelled():
+
+				await asyncio.sleep(ReconnectInterval)
+
+	def GetMetrics(self) -> Dict[str, int]:
+
+		return dict(self.Metrics, Entries = len(self.Entries), InFlight = len(self.InFlight), Subscribed = int(self.IsSubscribed))
@@ -0,0 +1,97 @@
+
+from typing import Dict, List
+from AppConfig import AppConfig
+from starlette.datastructures import State
+from RedisHelper.WorkerMetrics import WorkerMetrics
+from HelperMethods import GetWorkerProcessName
+from RedisHelper.RedisPools import GetRedisPoolMetrics
+from RedisHelper.TransactionQueue import CreateTransactionQueue
+from Monitoring.Metrics import PipelineMetrics, RenderMetricsDict, MetricsSnapshotDict
+
+# Prometheus text exposition format
+MetricsContentType = "text/plain; version=0.0.4; charset=utf-8"
+
+async def RenderMetrics(AppState : State, AppConfig : AppConfig) -> str:
+
+	# Recorded metrics are only rendered here, pools, caches and the queue depth are read at scrape time
+	LineList : List[str] = PipelineMetrics.Registry.Render(await LoadWorkerMetrics(AppState, AppConfig))
+
+	LineList.extend(await RenderQueueDepth(AppState, AppConfig))
+
+	IsFirstPool = True
+
+	for Name in ("Redis", "RedisWriter", "RedisConsumer"):
+
+		Redis = getattr(AppState, Name, None)
+
+		PoolMetricsDict = GetRedisPoolMetrics(Redis) if Redis is not None else {}
+
+		if not PoolMetricsDict:
+
+			continue
+
+		LineList.extend(RenderMetricsDict("redis_pool", "Redis connection pool counters and connections", PoolMetricsDict, ("pool",), (Redis.connection_pool.PoolName,), IncludeHeader = IsFirstPool))
+
+		IsFirstPool = False
+
+	MongoDbPoolMonitor = getattr(AppState, "MongoDbPoolMonitor", None)
+
+	if MongoDbPoolMonitor is not None:
+
+		LineList.extend(RenderMetricsDict("mongodb_pool", "MongoDb connection pool counters and connections", MongoDbPoolMonitor.GetMetrics()))
+
+	StatsCache = getattr(AppState, "StatsCache", None)
+
+	if StatsCache is not None:
+
+		LineList.extend(RenderMetricsDict("stats_cache", "Hit and miss counters of the /stats result cache", StatsCache.GetMetrics()))
+
+	HotDayCache = getattr(AppState, "HotDayCache", None)
+
+	if HotDayCache is not None:
+
+		LineList.extend(RenderMetricsDict("hot_day_cache", "Hit, miss and coalesced reads of the /stats Redis days cache", HotDayCache.GetMetrics()))
+
+	WorkerProcessPool = getattr(AppState, "WorkerProcessPool", None)
+
+	if WorkerProcessPool is not None:
+
+		LineList.extend(["# HELP worker_processes_alive Live worker processes", "# TYPE worker_processes_alive gauge", f"worker_processes_alive {WorkerProcessPool.GetAliveCount()}"])
+
+		LineList.extend(["# HELP worker_processes_healthy 1 while every aggregator worker process is alive", "# TYPE worker_processes_healthy gauge", f"worker_processes_healthy {int(WorkerProcessPool.IsHealthy())}"])
+
+	return "\n".join(LineList) + "\n"
+
+async def LoadWorkerMetrics(AppState : State, AppConfig : AppConfig) -> Dict[str, MetricsSnapshotDict]:
+
+	if getattr(AppState, "WorkerProcessPool", None) is None:
+
+		return {}
+
+	ProcessNameList = [GetWorkerProcessName(ProcessIndex) for ProcessIndex in range(AppConfig.AggregatorProcessCount)]
+
+	if AppConfig.ImporterInWorkerProcess:
+
+		ProcessNameList.append(GetWorkerProcessName())
+
+	try:
+
+		return await WorkerMetrics.Load(AppState.Redis, ProcessNameList)
+
+	except Exception:
+
+		# Only the samples of the API process are rendered while Redis is unreachable
+		return {}
+
+async def RenderQueueDepth(AppState : State, AppConfig : AppConfig) -> List[str]:
+
+	try:
+
+		QueueDepth = await CreateTransactionQueue(AppState.Redis, AppConfig.QueueBackend, AppConfig.RedisTransactionQueueKeyName).GetDepth()
+
+	except Exception:
+
+		# A scrape still reports the recorded metrics while Redis is unreachable
+		return []
+
+	return ["# HELP transaction_queue_depth Transactions waiting in the queue", "# TYPE transaction_queue_depth gauge", f"transaction_queue_depth {QueueDepth}"]
@@ -0,0 +1,316 @@
+
+import time
+import asyncio
+import logging
+
+from redis.asyncio import Redis
+from pydantic import TypeAdapter
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from Models.DailyAggregate import DailyAggregateRecord
+from BackgroundTask.CancellationToken import CancellationToken
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from HelperMethods import GetDayDateFormat, CalculateCutOffDate, GetRedisDumpedDaysChannelName
+
+logger = logging.getLogger("uvicorn")
+
+DailyAggregateRecordListAdapter = TypeAdapter(List[DailyAggregateRecord])
+
+class LruCache:
+
+	# Bounded by the total weight of its entries, least recently used entries are evicted first
+
+	def __init__(self, MaxWeight : int):
+
+		self.MaxWeight = MaxWeight
+		self.Weight = 0
+		self.Entries : OrderedDict[Any, Tuple[float, int, Any]] = OrderedDict()
+
+	def Get(self, Key : Any) -> Optional[Any]:
+
+		Entry = self.Entries.get(Key)
+
+		if Entry is None:
+
+			return None
+
+		ExpiresAt, _, Value = Entry
+
+		if ExpiresAt < time.monotonic():
+
+			self.Remove(Key)
+
+			return None
+
+		self.Entries.move_to_end(Key)
+
+		return Value
+
+	def Set(self, Key : Any, Value : Any, TimeToLive : float, Weight : int = 1):
+
+		if Weight > self.MaxWeight:
+
+			return
+
+		self.Remove(Key)
+
+		self.Entries[Key] = (time.monotonic() + TimeToLive, Weight, Value)
+
+		self.Weight += Weight
+
+		while self.Weight > self.MaxWeight:
+
+			self.Remove(next(iter(self.Entries)))
+
+	def Remove(self, Key : Any):
+
+		Entry = self.Entries.pop(Key, None)
+
+		if Entry is not None:
+
+			self.Weight -= Entry[1]
+
+	def Clear(self):
+
+		self.Entries.clear()
+
+		self.Weight = 0
+
+class StatsCache:
+
+	# Caches MongoDb results of /stats, only days before the cutoff are cached, Redis days are always read live.
+	# Days upserted by the dumper are announced on the dumped days channel and dropped with every range covering them, TTLs only bound what a lost message leaves behind.
+
+	def __init__(self, MaxWeight : int, RangeTimeToLive : float, DayTimeToLive : float, SharedRedis : Optional[Redis] = None, SharedKeyPrefix : str = "statscache", RetentionCutOff : Optional[timedelta] = None):
+
+		self.Lru = LruCache(MaxWeight)
+		self.RangeTimeToLive = RangeTimeToLive
+		self.DayTimeToLive = DayTimeToLive
+		self.SharedRedis = SharedRedis
+		self.SharedKeyPrefix = SharedKeyPrefix
+
+		# Dumper retention cutoff, days from it onwards may still have keys in Redis and get their first documents later
+		self.RetentionCutOff = RetentionCutOff
+
+		# Day -> Invalidation count when it was last dumped, a fetch started before that count is not cached for the day
+		self.InvalidationCount = 0
+		self.DayInvalidations : Dict[str, int] = {}
+
+		self.Metrics : Dict[str, int] = \
+		{
+			"RangeHits" : 0,
+			"RangeMisses" : 0,
+			"DayHits" : 0,
+			"SharedDayHits" : 0,
+			"DayMisses" : 0,
+			"Invalidations" : 0
+		}
+
+	async def GetHistoricalRange(self, From : str, To : str, IsFullyHistorical : bool, FetchRange : Callable[[str, str], Awaitable[List[DailyAggregateRecord]]]) -> List[DailyAggregateRecord]:
+
+		# Same bounds as DailyAggregatesRepository.GetByDateRange, From inclusive and To exclusive
+		if From >= To:
+
+			return []
+
+		RangeKey = ("Range", From, To)
+
+		FetchInvalidationCount = self.InvalidationCount
+
+		if IsFullyHistorical:
+
+			CachedRange = self.Lru.Get(RangeKey)
+
+			if CachedRange is not None:
+
+				self.Metrics["RangeHits"] += 1
+
+				return CachedRange
+
+			self.Metrics["RangeMisses"] += 1
+
+		DayList = GetDayStringRange(From, To)
+
+		DayFragmentDict = await self.GetDayFragments(DayList)
+
+		MissingDayList = [Day for Day in DayList if Day not in DayFragmentDict]
+
+		self.Metrics["DayHits"] += len(DayList) - len(MissingDayList)
+
+		self.Metrics["DayMisses"] += len(MissingDayList)
+
+		if MissingDayList:
+
+			# One query covering every missing day, days without documents are cached as empty fragments
+			FetchTo = (datetime.strptime(MissingDayList[-1], GetDayDateFormat()) + timedelta(days = 1)).strftime(GetDayDateFormat())
+
+			FetchedFragmentDict : Dict[str, List[DailyAggregateRecord]] = { Day : [] for Day in GetDayStringRange(MissingDayList[0], FetchTo) }
+
+			for DailyAggregateItem in await FetchRange(MissingDayList[0], FetchTo):
+
+				FetchedFragmentDict.setdefault(DailyAggregateItem.Date, []).append(DailyAggregateItem)
+
+			DayFragmentDict.update(FetchedFragmentDict)
+
+			# Days dumped while they were read may be stale, an empty day that can still be dumped is only missing its documents so far
+			FetchedFragmentDict = \
+			{
+				Day : DayFragment for Day, DayFragment in FetchedFragmentDict.items()
+				if not self.IsInvalidatedSince(Day, FetchInvalidationCount) and (DayFragment or not self.IsDumpable(Day))
+			}
+
+			await self.SetDayFragments(FetchedFragmentDict)
+
+			IsFullyHistorical = IsFullyHistorical and all(Day in FetchedFragmentDict for Day in MissingDayList)
+
+		Result = [DailyAggregateItem for Day in DayList for DailyAggregateItem in DayFragmentDict[Day]]
+
+		if IsFullyHistorical and not any(self.IsInvalidatedSince(Day, FetchInvalidationCount) for Day in DayList):
+
+			self.Lru.Set(RangeKey, Result, self.RangeTimeToLive, Weight = len(Result) + 1)
+
+		return Result
+
+	async def GetDayFragments(self, DayList : List[str]) -> Dict[str, List[DailyAggregateRecord]]:
+
+		DayFragmentDict : Dict[str, List[DailyAggregateRecord]] = {}
+
+		for Day in DayList:
+
+			DayFragment = self.Lru.Get(("Day", Day))
+
+			if DayFragment is not None:
+
+				DayFragmentDict[Day] = DayFragment
+
+		SharedDayList = [Day for Day in DayList if Day not in DayFragmentDict]
+
+		if self.SharedRedis is None or not SharedDayList:
+
+			return DayFragmentDict
+
+		SharedFragmentList = await self.SharedRedis.mget([self.GetSharedKey(Day) for Day in SharedDayList])
+
+		for Day, SharedFragment in zip(SharedDayList, SharedFragmentList):
+
+			if SharedFragment is None:
+
+				continue
+
+			DayFragment = DailyAggregateRecordListAdapter.validate_json(SharedFragment)
+
+			self.Lru.Set(("Day", Day), DayFragment, self.DayTimeToLive, Weight = len(DayFragment) + 1)
+
+			DayFragmentDict[Day] = DayFragment
+
+			self.Metrics["SharedDayHits"] += 1
+
+		return DayFragmentDict
+
+	async def SetDayFragments(self, DayFragmentDict : Dict[str, List[DailyAggregateRecord]]):
+
+		for Day, DayFragment in DayFragmentDict.items():
+
+			self.Lru.Set(("Day", Day), DayFragment, self.DayTimeToLive, Weight = len(DayFragment) + 1)
+
+		if self.SharedRedis is None:
+
+			return
+
+		async with self.SharedRedis.pipeline(transaction = False) as pipe:
+
+			for Day, DayFragment in DayFragmentDict.items():
+
+				pipe.set(self.GetSharedKey(Day), DailyAggregateRecordListAdapter.dump_json(DayFragment), ex = max(int(self.DayTimeToLive), 1))
+
+			await pipe.execute()
+
+	def IsInvalidatedSince(self, Day : str, InvalidationCount : int) -> bool:
+
+		return self.DayInvalidations.get(Day, 0) > InvalidationCount
+
+	def IsDumpable(self, Day : str) -> bool:
+
+		# Without retention every day keeps its Redis keys, any of them can be dumped again
+		return self.RetentionCutOff is None or Day >= CalculateCutOffDate(self.RetentionCutOff).strftime(GetDayDateFormat())
+
+	async def Invalidate(self, DayList : List[str]):
+
+		self.InvalidationCount += 1
+
+		DaySet = set(DayList)
+
+		for Day in DaySet:
+
+			self.Metrics["Invalidations"] += 1
+
+			self.DayInvalidations[Day] = self.InvalidationCount
+
+			self.Lru.Remove(("Day", Day))
+
+		# Range keys are ("Range", From inclusive, To exclusive)
+		for Key in [Key for Key in self.Lru.Entries if Key[0] == "Range" and any(Key[1] <= Day < Key[2] for Day in DaySet)]:
+
+			self.Lru.Remove(Key)
+
+		if self.SharedRedis is not None and DaySet:
+
+			# Every API process deletes the shared fragments, deleting a key twice is harmless
+			await self.SharedRedis.delete(*[self.GetSharedKey(Day) for Day in DaySet])
+
+	async def ListenForDumpedDays(self, Redis : Redis, CancellationToken : CancellationToken, ReconnectInterval : float = 1):
+
+		# Days upserted by the dumper, comma separated per dump cycle
+		while (not CancellationToken.IsCancelled()):
+
+			try:
+
+				async with Redis.pubsub(ignore_subscribe_messages = True) as PubSub:
+
+					await PubSub.subscribe(GetRedisDumpedDaysChannelName())
+
+					# Dumps made before the subscription were not seen, local entries are read again, shared ones are left to their TTL
+					self.Lru.Clear()
+
+					logger.info("✅ Stats cache subscribed to dumped days.")
+
+					while (not CancellationToken.IsCancelled()):
+
+						Message = await PubSub.get_message(timeout = 1)
+
+						if Message is not None:
+
+							await self.Invalidate(Message["data"].decode("utf-8").split(","))
+
+			except Exception as e:
+
+				logger.info(f"⚠️ Stats cache lost the dumped days channel: {e}")
+
+			if not CancellationToken.IsCancelled():
+
+				await asyncio.sleep(ReconnectInterval)
+
+	def GetSharedKey(self, Day : str) -> str:
+
+		return f"{self.SharedKeyPrefix}:{Day}"
+
+	def GetMetrics(self) -> Dict[str, int]:
+
+		return dict(self.Metrics, Weight = self.Lru.Weight, Entries = len(self.Lru.Entries))
+
+def GetDayStringRange(From : str, To : str) -> List[str]:
+
+	# Day strings from From (inclusive) to To (exclusive)
+	DayList = []
+
+	DayIterator = datetime.strptime(From, GetDayDateFormat())
+
+	EndDate = datetime.strptime(To, GetDayDateFormat())
+
+	while DayIterator < EndDate:
+
+		DayList.append(DayIterator.strftime(GetDayDateFormat()))
+
+		DayIterator += timedelta(days = 1)
+
+	return DayList
@@ -0,0 +1,36 @@
+
+import asyncio
+
+from datetime import date, datetime
+from Models.AggregateRollup import StatsGranularity, StatsBreakdown
+from Monitoring.Metrics import PipelineMetrics
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+class StatsRequestCoalescer:
+
+	# Identical /stats requests in flight at the same time share one computation of their response
+
+	def __init__(self):
+
+		# (Granularity, Breakdown, From day, To day) -> Task computing the response, removed once it completes
+		self.InFlight : Dict[Tuple[str, str, date, date], asyncio.Task] = {}
+
+	async def Run(self, Granularity : StatsGranularity, FromDate : datetime, ToDate : datetime, CreateCoroutine : Callable[[], Awaitable[Any]], Breakdown : StatsBreakdown = StatsBreakdown.Type) -> Any:
+
+		# The query parameters are parsed to days first, any spelling of the same range gets the same key
+		Key = (Granularity.value, Breakdown.value, FromDate.date(), ToDate.date())
+
+		Task = self.InFlight.get(Key)
+
+		if Task is None:
+
+			Task = self.InFlight[Key] = asyncio.ensure_future(CreateCoroutine())
+
+			Task.add_done_callback(lambda _: self.InFlight.pop(Key, None))
+
+		else:
+
+			PipelineMetrics.StatsCoalescedRequests.Increment(LabelValues = (Granularity.value,))
+
+		# shield, a disconnected client does not cancel the response the other requests are waiting for
+		return await asyncio.shield(Task)
@@ -1,57 +1,111 @@
 
+import orjson
 import asyncio
+import logging
 
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from redis.asyncio import Redis
 from RedisHelper import RedisServices
 from AppConfig import GetAppConfig, AppConfig
-from Models.DailyAggregate import DailyAggregate
+from Models.DailyAggregate import DailyAggregateRecord
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from datetime import datetime, timedelta, date, time, timezone
-from HelperMethods import GetRedisKeyDesignPattern, GetDayDateFormat
-from Db.Repositories.DailyAggregatesRepository import DailyAggregatesRepository
+from datetime import datetime, timedelta, date
+from Api.Services.StatsCache import StatsCache
+from Api.Services.HotDayCache import HotDayCache
+from Monitoring.Metrics import PipelineMetrics, ObserveDuration
+from HelperMethods import GetRedisKeyDesign, GetTransactionTypes, GetDayDateFormat, CalculateCutOffDate
+from Db.Repositories.DailyAggregatesRepository import DailyAggregatesRepository, TotalsBucketKeyName
+from Db.Repositories.AggregateRollupsRepository import CreateAggregateRollupsRepository
+from Models.AggregateRollup import AggregateRollup, StatsGranularity, GetPeriodStart, GetPeriodEnd, ParseDay
 
-async def GetStats(AppRedisClient : Redis, AppMongoDb : AsyncIOMotorDatabase, FromDate : datetime, ToDate : datetime) -> List[DailyAggregate]:
+logger = logging.getLogger("uvicorn")
+
+# Stats bucket label -> Type -> Payment method -> Summed amount
+StatsBucketDict = Dict[str, Dict[str, Dict[str, float]]]
+
+def GetCutOffDate() -> datetime:
+
+	AppConfigSettings : AppConfig = GetAppConfig()
 	
-	async def FetchRedis(FromDate : datetime, ToDate : datetime, CutOffDate : datetime, AppRedisClient : Redis) -> List[DailyAggregate]:
+	return CalculateCutOffDate(timedelta(days = AppConfigSettings.CutOffDays, minutes = AppConfigSettings.CutOffMinutes, seconds = AppConfigSettings.CutOffSeconds))
 
-		RedisKeySearchPatternList : List[str] = []
-		
-		# if ToDate >= CutOffDate, data from redis must be utilized
-		if ToDate >= CutOffDate:
-			DayIterator = max(CutOffDate, FromDate)
+async def FetchRedis(FromDate : datetime, ToDate : datetime, CutOffDate : datetime, AppRedisClient : Redis, HotCache : Optional[HotDayCache] = None) -> List[DailyAggregateRecord]:
 
-			while (DayIterator <= ToDate):
+	StringDateList : List[str] = []
+	
+	# if ToDate >= CutOffDate, data from redis must be utilized
+	if ToDate >= CutOffDate:
+		DayIterator = max(CutOffDate, FromDate)
 
-				StringDate = DayIterator.strftime(GetDayDateFormat())
+		while (DayIterator <= ToDate):
 
-				RedisKeySearchPatternList.append(GetRedisKeyDesignPattern(Day = StringDate))
+			StringDateList.append(DayIterator.strftime(GetDayDateFormat()))
 
-				DayIterator += timedelta(days = 1)
+			DayIterator += timedelta(days = 1)
 
-		return await RedisServices.GetDailyAggregatesByRedisKeys(AppRedisClient, Pattern = RedisKeySearchPatternList)
-	
-	async def FetchMongoDb(FromDate : datetime, ToDate : datetime, CutOffDate : datetime, AppMongoDb : AsyncIOMotorDatabase) -> List[DailyAggregate]:
+	if StringDateList == []:
 
-		StringFromDate = FromDate.strftime(GetDayDateFormat())
+		return []
 
-		StringToDate = min(ToDate, CutOffDate).strftime(GetDayDateFormat())
+	if HotCache is None:
 
-		DailyAggregatesRepo : DailyAggregatesRepository = DailyAggregatesRepository(AppMongoDb)
+		return await FetchRedisDays(StringDateList, AppRedisClient)
 
-		return await DailyAggregatesRepo.GetByDateRange(From = StringFromDate, To = StringToDate)
+	# Polled days are served from the process for a few seconds, concurrent requests for a missing day share its read
+	DayRecordDict = await HotCache.GetDays(StringDateList, lambda DayList: FetchRedisDaysByDay(DayList, AppRedisClient))
 
-	NowDate = datetime.combine(date.today(), time.min, tzinfo = timezone.utc)
+	return [DailyAggregateItem for StringDate in StringDateList for DailyAggregateItem in DayRecordDict[StringDate]]
 
-	AppConfigSettings : AppConfig = GetAppConfig()
+async def FetchRedisDays(StringDateList : List[str], AppRedisClient : Redis) -> List[DailyAggregateRecord]:
+
+	# The key design is fully known, keys are built directly instead of scanning the keyspace per day
+	RedisKeyList = [GetRedisKeyDesign(StringDate, TransactionType) for StringDate in StringDateList for TransactionType in GetTransactionTypes()]
+
+	return await RedisServices.GetDailyAggregatesByRedisKeys(AppRedisClient, KeyList = RedisKeyList, AmountMode = GetAppConfig().AggregateAmountMode, AsRecords = True)
+
+async def FetchRedisDaysByDay(StringDateList : List[str], AppRedisClient : Redis) -> Dict[str, List[DailyAggregateRecord]]:
+
+	DayRecordDict : Dict[str, List[DailyAggregateRecord]] = { StringDate : [] for StringDate in StringDateList }
+
+	for DailyAggregateItem in await FetchRedisDays(StringDateList, AppRedisClient):
+
+		DayRecordDict[DailyAggregateItem.Date].append(DailyAggregateItem)
+
+	return DayRecordDict
+
+async def FetchMongoDbDays(DailyAggregatesRepo : DailyAggregatesRepository, StringFromDate : str, StringToDate : str, IsFullyHistorical : bool, Cache : Optional[StatsCache] = None) -> List[DailyAggregateRecord]:
+
+	if Cache is None:
+
+		return await DailyAggregatesRepo.GetRecordsByDateRange(From = StringFromDate, To = StringToDate)
+
+	# Days before the cutoff do not change anymore, they are served from the cache once fetched
+	return await Cache.GetHistoricalRange \
+	(
+		StringFromDate,
+		StringToDate,
+		IsFullyHistorical = IsFullyHistorical,
+		FetchRange = lambda From, To: DailyAggregatesRepo.GetRecordsByDateRange(From = From, To = To)
+	)
+
+async def GetStats(AppRedisClient : Redis, AppMongoDb : AsyncIOMotorDatabase, FromDate : datetime, ToDate : datetime, Cache : Optional[StatsCache] = None, HotCache : Optional[HotDayCache] = None) -> List[DailyAggregateRecord]:
 	
-	CutOffDate = NowDate - timedelta(days = AppConfigSettings.CutOffDays, minutes = AppConfigSettings.CutOffMinutes, seconds = AppConfigSettings.CutOffSeconds) 
+	async def FetchMongoDb(FromDate : datetime, ToDate : datetime, CutOffDate : datetime, AppMongoDb : AsyncIOMotorDatabase) -> List[DailyAggregateRecord]:
+
+		StringFromDate = FromDate.strftime(GetDayDateFormat())
+
+		# ToDate is inclusive, the MongoDb range ends the day after it or at the cutoff day where Redis takes over
+		StringToDate = min(ToDate + timedelta(days = 1), CutOffDate).strftime(GetDayDateFormat())
+
+		return await FetchMongoDbDays(DailyAggregatesRepository(AppMongoDb), StringFromDate, StringToDate, ToDate < CutOffDate, Cache)
+
+	CutOffDate = GetCutOffDate()
 
 	FetchRedisTaskResult, FetchMongoDbTask = \
 		await asyncio.gather \
 			(
-				FetchRedis(FromDate, ToDate, CutOffDate, AppRedisClient),
-				FetchMongoDb(FromDate, ToDate, CutOffDate, AppMongoDb),
+				ObserveDuration(PipelineMetrics.StatsFetchDuration, FetchRedis(FromDate, ToDate, CutOffDate, AppRedisClient, HotCache), ("redis",)),
+				ObserveDuration(PipelineMetrics.StatsFetchDuration, FetchMongoDb(FromDate, ToDate, CutOffDate, AppMongoDb), ("mongodb",)),
 				return_exceptions = True
 			)
 
@@ -62,3 +116,224 @@ async def GetStats(AppRedisClient : Redis, AppMongoDb : AsyncIOMotorDatabase, Fr
 	Result.extend([] if isinstance(FetchMongoDbTask, Exception) else FetchMongoDbTask)
 
 	return Result
+
+async def GetStatsByGranularity(AppRedisClient : Redis, AppMongoDb : AsyncIOMotorDatabase, FromDate : datetime, ToDate : datetime, Granularity : StatsGranularity, HotCache : Optional[HotDayCache] = None) -> StatsBucketDict:
+
+	CutOffDate = GetCutOffDate()
+
+	# Same split as GetStats, MongoDb answers up to the cutoff day (exclusive) and Redis from there on
+	HistoricalFromDate = FromDate.date()
+
+	HistoricalToDate = min(ToDate + timedelta(days = 1), CutOffDate).date()
+
+	DailyAggregatesRepo : DailyAggregatesRepository = DailyAggregatesRepository(AppMongoDb)
+
+	FetchTaskList = [FetchRedis(FromDate, ToDate, CutOffDate, AppRedisClient, HotCache)]
+
+	for SegmentGranularity, SegmentFromDate, SegmentToDate in PlanRollupSegments(HistoricalFromDate, HistoricalToDate, GetRollupGranularities(Granularity)):
+
+		StringFromDate = SegmentFromDate.strftime(GetDayDateFormat())
+
+		StringToDate = SegmentToDate.strftime(GetDayDateFormat())
+
+		if SegmentGranularity == StatsGranularity.Day:
+
+			# Edge days are summed per bucket by MongoDb, a whole range total comes back as one small document per type
+			FetchTaskList.append(DailyAggregatesRepo.GetTotalsByDateBucket(StringFromDate, StringToDate, Granularity))
+
+		else:
+
+			FetchTaskList.append(CreateAggregateRollupsRepository(AppMongoDb, SegmentGranularity).GetByPeriodStartRange(StringFromDate, StringToDate))
+
+	FetchTaskResultList = await asyncio.gather(*FetchTaskList, return_exceptions = True)
+
+	Result : StatsBucketDict = {}
+
+	for FetchTaskResult in FetchTaskResultList:
+
+		if isinstance(FetchTaskResult, Exception):
+
+			continue
+
+		for AggregateItem in FetchTaskResult:
+
+			if isinstance(AggregateItem, dict):
+
+				# Totals pipeline documents are already labelled by MongoDb
+				BucketLabel, TransactionType, TotalAmount = AggregateItem[TotalsBucketKeyName], AggregateItem["Type"], AggregateItem["TotalAmount"]
+
+			else:
+
+				Day = ParseDay(AggregateItem.PeriodStart if isinstance(AggregateItem, AggregateRollup) else AggregateItem.Date)
+
+				BucketLabel = StatsGranularity.Total.value if Granularity == StatsGranularity.Total else GetPeriodStart(Day, Granularity).strftime(GetDayDateFormat())
+
+				TransactionType, TotalAmount = AggregateItem.Type, AggregateItem.TotalAmount
+
+			TotalAmountPerMethodDict = Result.setdefault(BucketLabel, {}).setdefault(TransactionType, {})
+
+			for PaymentMethod, Amount in TotalAmount.items():
+
+				TotalAmountPerMethodDict[PaymentMethod] = TotalAmountPerMethodDict.get(PaymentMethod, 0.0) + Amount
+
+	return dict(sorted(Result.items()))
+
+async def GetTotalsByPaymentMethod(AppRedisClient : Redis, AppMongoDb : AsyncIOMotorDatabase, FromDate : datetime, ToDate : datetime, HotCache : Optional[HotDayCache] = None) -> StatsBucketDict:
+
+	CutOffDate = GetCutOffDate()
+
+	StringFromDate = FromDate.strftime(GetDayDateFormat())
+
+	StringToDate = min(ToDate + timedelta(days = 1), CutOffDate).strftime(GetDayDateFormat())
+
+	# Historical days come back from MongoDb as a single document, the Redis days are summed here
+	FetchRedisTaskResult, FetchMongoDbTaskResult = \
+		await asyncio.gather \
+			(
+				FetchRedis(FromDate, ToDate, CutOffDate, AppRedisClient, HotCache),
+				DailyAggregatesRepository(AppMongoDb).GetTotalsByPaymentMethod(StringFromDate, StringToDate),
+				return_exceptions = True
+			)
+
+	TotalAmountPerMethodDict : Dict[str, float] = {} if isinstance(FetchMongoDbTaskResult, Exception) else dict(FetchMongoDbTaskResult)
+
+	for DailyAggregateItem in ([] if isinstance(FetchRedisTaskResult, Exception) else FetchRedisTaskResult):
+
+		for PaymentMethod, Amount in DailyAggregateItem.TotalAmount.items():
+
+			TotalAmountPerMethodDict[PaymentMethod] = TotalAmountPerMethodDict.get(PaymentMethod, 0.0) + Amount
+
+	# Same single total bucket as granularity=total, keyed by payment method instead of type
+	return { StatsGranularity.Total.value : dict(sorted(TotalAmountPerMethodDict.items())) }
+
+def GetRollupGranularities(Granularity : StatsGranularity) -> List[StatsGranularity]:
+
+	# Coarsest first, a total is answered from months, then from weeks at the edges
+	if Granularity == StatsGranularity.Total:
+
+		return [StatsGranularity.Month, StatsGranularity.Week]
+
+	if Granularity in (StatsGranularity.Week, StatsGranularity.Month):
+
+		return [Granularity]
+
+	return []
+
+def PlanRollupSegments(FromDate : date, ToDate : date, GranularityList : List[StatsGranularity]) -> List[Tuple[StatsGranularity, date, date]]:
+
+	# Splits [FromDate, ToDate) into whole periods of the coarsest granularity and edges handled by the finer ones, daily documents last
+	if FromDate >= ToDate:
+
+		return []
+
+	if GranularityList == []:
+
+		return [(StatsGranularity.Day, FromDate, ToDate)]
+
+	Granularity = GranularityList[0]
+
+	CoveredFromDate = GetPeriodStart(FromDate, Granularity)
+
+	if CoveredFromDate < FromDate:
+
+		CoveredFromDate = GetPeriodEnd(CoveredFromDate, Granularity)
+
+	CoveredToDate = CoveredFromDate
+
+	while GetPeriodEnd(CoveredToDate, Granularity) <= ToDate:
+
+		CoveredToDate = GetPeriodEnd(CoveredToDate, Granularity)
+
+	if CoveredToDate == CoveredFromDate:
+
+		return PlanRollupSegments(FromDate, ToDate, GranularityList[1:])
+
+	return \
+	[
+		*PlanRollupSegments(FromDate, CoveredFromDate, GranularityList[1:]),
+		(Granularity, CoveredFromDate, CoveredToDate),
+		*PlanRollupSegments(CoveredToDate, ToDate, GranularityList[1:])
+	]
+
+async def StreamStats(AppRedisClient : Redis, AppMongoDb : AsyncIOMotorDatabase, FromDate : datetime, ToDate : datetime, BatchSize : int, HotCache : Optional[HotDayCache] = None) -> AsyncIterator[bytes]:
+
+	CutOffDate = GetCutOffDate()
+
+	# Same split as GetStats, but days come out in date order: the MongoDb cursor first, then the Redis tail in chunks
+	async def IterateDailyAggregates() -> AsyncIterator[Tuple[str, str, Dict[str, float]]]:
+
+		StringFromDate = FromDate.strftime(GetDayDateFormat())
+
+		StringToDate = min(ToDate + timedelta(days = 1), CutOffDate).strftime(GetDayDateFormat())
+
+		if StringFromDate < StringToDate:
+
+			async for Document in DailyAggregatesRepository(AppMongoDb).IterateByDateRange(StringFromDate, StringToDate, BatchSize):
+
+				yield Document["Date"], Document["Type"], Document["TotalAmount"]
+
+		if ToDate < CutOffDate:
+
+			return
+
+		DaysPerChunk = max(1, BatchSize // len(GetTransactionTypes()))
+
+		DayIterator = max(CutOffDate, FromDate)
+
+		while (DayIterator <= ToDate):
+
+			ChunkToDate = min(DayIterator + timedelta(days = DaysPerChunk - 1), ToDate)
+
+			for DailyAggregateItem in await FetchRedis(DayIterator, ChunkToDate, CutOffDate, AppRedisClient, HotCache):
+
+				yield DailyAggregateItem.Date, DailyAggregateItem.Type, DailyAggregateItem.TotalAmount
+
+			DayIterator = ChunkToDate + timedelta(days = 1)
+
+	# The date-keyed object of ApiDailyAggregateResponse is written incrementally, a date stays open while its types follow
+	Buffer = bytearray(b'{"data":{')
+
+	CurrentDate = None
+
+	# The 200 status is sent with the first chunk, a failure is reported by an error member closing the JSON instead of a cut off body
+	ErrorBody = b''
+
+	try:
+
+		async for StringDate, TransactionType, TotalAmount in IterateDailyAggregates():
+
+			if StringDate != CurrentDate:
+
+				if CurrentDate is not None:
+
+					Buffer += b'},'
+
+				Buffer += orjson.dumps(StringDate) + b':{'
+
+				CurrentDate = StringDate
+
+			else:
+
+				Buffer += b','
+
+			Buffer += orjson.dumps(TransactionType) + b':' + orjson.dumps(TotalAmount)
+
+			if len(Buffer) >= 65536:
+
+				yield bytes(Buffer)
+
+				Buffer.clear()
+
+	except Exception as e:
+
+		logger.info(f"⚠️ Streamed /stats response from {FromDate.date()} to {ToDate.date()} failed after {CurrentDate}: {e}")
+
+		ErrorBody = b',"error":"The response is incomplete, reading the stats failed"'
+
+	if CurrentDate is not None:
+
+		Buffer += b'}'
+
+	Buffer += b'}' + ErrorBody + b'}'
+
+	yield bytes(Buffer)
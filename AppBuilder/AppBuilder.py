@@ -3,12 +3,16 @@ import sys
 import asyncio
 import logging
 
+from typing import List
 from fastapi import FastAPI
 from AppConfig import AppConfig
 from redis.asyncio import Redis
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from AppBuilder.AppStateBuilder import AppStateBuilder
+from Api.Router.MetricsRouter import MetricsRouter
+from Api.Router.HealthRouter import HealthRouter
 from BackgroundTask.CancellationToken import CancellationToken
+from BackgroundTask.WorkerProcessPool import WorkerProcessPool
 
 logger = logging.getLogger("uvicorn")
 
@@ -17,7 +21,11 @@ class AppBuilder():
 	@staticmethod
 	async def Initialize(App : FastAPI, AppConfig : AppConfig, CancellationToken : CancellationToken):
 
-		AppStateBuilder().BuildAppState(App, AppConfig = AppConfig, CancellationToken = CancellationToken)
+		await AppStateBuilder().BuildAppState(App, AppConfig = AppConfig, CancellationToken = CancellationToken)
+
+		App.include_router(MetricsRouter)
+
+		App.include_router(HealthRouter)
 
 
 	@staticmethod
@@ -26,6 +34,7 @@ class AppBuilder():
 		await asyncio.gather \
 		(
 			AppBuilder.GracefulBackGroundTasksShutDown(App, AppConfig),
+			AppBuilder.GracefulWorkerProcessesShutDown(App, AppConfig),
 			AppBuilder.GracefulRedisShutDown(App, AppConfig),
 			AppBuilder.GracefulMongoDbShutDown(App, AppConfig)
 		)
@@ -36,6 +45,7 @@ class AppBuilder():
 
 		await asyncio.gather \
 		(
+			AppBuilder.ForceWorkerProcessesShutDown(App, AppConfig),
 			AppBuilder.ForceBackGroundTasksShutDown(App, AppConfig),
 			AppBuilder.ForceRedisShutDown(App, AppConfig),
 			AppBuilder.ForceMongoDbShutDown(App, AppConfig)
@@ -84,23 +94,30 @@ class AppBuilder():
 			return
 
 	@staticmethod
-	async def GracefulRedisShutDown(App : FastAPI, AppConfig : AppConfig):
+	async def GracefulWorkerProcessesShutDown(App : FastAPI, AppConfig : AppConfig):
 
-		Redis : Redis = App.state.Redis
+		Pool : WorkerProcessPool = App.state.WorkerProcessPool
 
-		if Redis is None:
+		if Pool is None:
 
 			return
 
-		try:
-		
-			await asyncio.wait_for(Redis.close(), timeout = AppConfig.GracefulShutDownTimeout)
+		await Pool.Stop(AppConfig.GracefulShutDownTimeout)
+
+	@staticmethod
+	async def GracefulRedisShutDown(App : FastAPI, AppConfig : AppConfig):
+
+		for Redis in AppBuilder.GetRedisClients(App):
+
+			try:
 			
-			logger.info("✅ Redis connection closed")
-		
-		except Exception as e:
+				await asyncio.wait_for(Redis.close(), timeout = AppConfig.GracefulShutDownTimeout)
+				
+				logger.info("✅ Redis connection closed")
 			
-			logger.info(f"⚠️ Error closing Redis: {e}")
+			except Exception as e:
+				
+				logger.info(f"⚠️ Error closing Redis: {e}")
 
 	@staticmethod
 	async def GracefulMongoDbShutDown(App : FastAPI, AppConfig : AppConfig):
@@ -134,24 +151,39 @@ class AppBuilder():
 		sys.exit(1)
 
 	@staticmethod
-	async def ForceRedisShutDown(App : FastAPI, AppConfig : AppConfig):
+	async def ForceWorkerProcessesShutDown(App : FastAPI, AppConfig : AppConfig):
 
-		Redis : Redis = App.state.Redis
+		Pool : WorkerProcessPool = App.state.WorkerProcessPool
 
-		if Redis is None:
+		if Pool is None:
 
 			return
 
-		try:
-		
-			await Redis.close()
+		Pool.Terminate()
+
+	@staticmethod
+	async def ForceRedisShutDown(App : FastAPI, AppConfig : AppConfig):
+
+		for Redis in AppBuilder.GetRedisClients(App):
+
+			try:
 			
-			logger.info("✅ Redis connection closed")
-		
-		except Exception as e:
+				await Redis.close()
+				
+				logger.info("✅ Redis connection closed")
 			
-			logger.info(f"⚠️ Error closing Redis: {e}")
-			sys.exit(1)
+			except Exception as e:
+				
+				logger.info(f"⚠️ Error closing Redis: {e}")
+				sys.exit(1)
+
+	@staticmethod
+	def GetRedisClients(App : FastAPI) -> List[Redis]:
+
+		# Reader, writer and consumer clients, each one closing its own connection pool
+		RedisClientList = [getattr(App.state, Name, None) for Name in ("Redis", "RedisWriter", "RedisConsumer")]
+
+		return [Redis for Redis in RedisClientList if Redis is not None]
 
 	@staticmethod
 	async def ForceMongoDbShutDown(App : FastAPI, AppConfig : AppConfig):
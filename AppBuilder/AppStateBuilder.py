@@ -3,66 +3,245 @@ import sys
 import logging
 import asyncio
 
+from typing import List, Optional
 from fastapi import FastAPI
+from datetime import timedelta
 from redis.asyncio import Redis
 from AppConfig import AppConfig
+from HelperMethods import GetStreamConsumerName
+from Db.ConnectionPoolMonitor import ConnectionPoolMonitor
+from Api.Services.StatsCache import StatsCache
+from Api.Services.HotDayCache import HotDayCache
+from Api.Services.StatsRequestCoalescer import StatsRequestCoalescer
 from BackgroundTask.DataDumper import DataDumper
 from BackgroundTask.DataImporter import DataImporter
 from BackgroundTask.DataAggregator import DataAggregator
+from BackgroundTask.WorkerProcessPool import WorkerProcessPool
 from BackgroundTask.CancellationToken import CancellationToken
+from RedisHelper.TransactionQueue import TransactionQueue, CreateTransactionQueue
+from RedisHelper.AggregateBatchScript import AggregateBatchScript
+from RedisHelper.RetireAggregateKeysScript import RetireAggregateKeysScript
+from RedisHelper.RedisPools import CreateReaderRedisClient, CreateWriterRedisClient, CreateConsumerRedisClient
 from motor.motor_asyncio import AsyncIOMotorDatabase as MongoDb
 from motor.motor_asyncio import AsyncIOMotorClient as MongoDbClient
 
 class AppStateBuilder:
 
-	def BuildAppState(self, App : FastAPI,  AppConfig : AppConfig, CancellationToken : CancellationToken):
+	async def BuildAppState(self, App : FastAPI,  AppConfig : AppConfig, CancellationToken : CancellationToken):
 
 		self.BuildRedis(App, AppConfig)
 
+		await self.LoadRedisScripts(App)
+
 		self.BuildMongoDb(App, AppConfig)
 
+		self.BuildStatsCache(App, AppConfig)
+
+		self.BuildHotDayCache(App, AppConfig)
+
+		App.state.StatsRequestCoalescer = StatsRequestCoalescer() if AppConfig.StatsRequestCoalescingEnabled else None
+
 		self.BuildBackgroundTasks(App, AppConfig, CancellationToken)
 
 	def BuildRedis(self, App : FastAPI, AppConfig : AppConfig):
 
-		App.state.Redis = Redis(host = AppConfig.RedisHost, port = AppConfig.RedisPort)
+		# Separate pools so a burst of /stats requests never starves the ingest path and blocking pops never starve the readers
+		App.state.Redis = CreateReaderRedisClient(AppConfig)
+
+		App.state.RedisWriter = CreateWriterRedisClient(AppConfig)
+
+		App.state.RedisConsumer = CreateConsumerRedisClient(AppConfig)
+
+	async def LoadRedisScripts(self, App : FastAPI):
+
+		# Before any background task starts, every batch is then sent as a single EVALSHA
+		await AggregateBatchScript.Load(App.state.RedisWriter)
+
+		await RetireAggregateKeysScript.Load(App.state.RedisWriter)
 
 	def BuildMongoDb(self, App : FastAPI, AppConfig : AppConfig):
 
-		App.state.MongoDb = MongoDb(MongoDbClient(AppConfig.MongoDbUri), name = AppConfig.MongoDbName)
+		App.state.MongoDbPoolMonitor = ConnectionPoolMonitor()
+
+		Client = MongoDbClient \
+		(
+			AppConfig.MongoDbUri,
+			maxPoolSize = AppConfig.MongoDbMaxPoolSize,
+			minPoolSize = AppConfig.MongoDbMinPoolSize,
+			waitQueueTimeoutMS = int(AppConfig.MongoDbWaitQueueTimeout * 1000),
+			socketTimeoutMS = int(AppConfig.MongoDbSocketTimeout * 1000),
+			event_listeners = [App.state.MongoDbPoolMonitor]
+		)
+
+		App.state.MongoDb = MongoDb(Client, name = AppConfig.MongoDbName)
+
+	def BuildStatsCache(self, App : FastAPI, AppConfig : AppConfig):
+
+		App.state.StatsCache = None
+
+		if AppConfig.StatsCacheEnabled:
+
+			App.state.StatsCache = StatsCache \
+			(
+				AppConfig.StatsCacheMaxWeight,
+				AppConfig.StatsCacheRangeTimeToLive,
+				AppConfig.StatsCacheDayTimeToLive,
+				App.state.Redis if AppConfig.StatsCacheSharedTierEnabled else None,
+				RetentionCutOff = self.BuildRetentionCutOff(AppConfig)
+			)
+
+	def BuildHotDayCache(self, App : FastAPI, AppConfig : AppConfig):
+
+		App.state.HotDayCache = None
+
+		if AppConfig.HotDayCacheEnabled:
+
+			App.state.HotDayCache = HotDayCache \
+			(
+				App.state.Redis,
+				AppConfig.HotDayCacheMaxDays,
+				AppConfig.HotDayCacheTimeToLive,
+				AppConfig.HotDayCacheMaxStaleness
+			)
+
+	def BuildTransactionQueue(self, App : FastAPI, AppConfig : AppConfig, Redis : Redis, ConsumerName : str = "") -> TransactionQueue:
+
+		return CreateTransactionQueue \
+		(
+			Redis,
+			AppConfig.QueueBackend,
+			AppConfig.RedisTransactionQueueKeyName,
+			AppConfig.StreamConsumerGroupName,
+			ConsumerName,
+			AppConfig.StreamPendingReclaimIdleTime
+		)
 
 	def BuildBackgroundTasks(self, App : FastAPI, AppConfig : AppConfig, CancellationToken : CancellationToken):
 
+		self.BuildWorkerProcessPool(App, AppConfig)
+
 		App.state.BackgroundTasks = \
 		[
+			*self.BuildImporterTasks(App, AppConfig),
+			*self.BuildAggregatorTasks(App, AppConfig, CancellationToken),
 			asyncio.create_task \
 			(
-				DataImporter.ImportData \
+				DataDumper.DumpData \
 				(
-					App.state.Redis,
-					AppConfig.CsvFilePath,
-					AppConfig.RedisTransactionQueueKeyName
+					App.state.RedisWriter,
+					App.state.MongoDb,
+					AppConfig.DumperTaskScheduleInterval,
+					CancellationToken,
+					AppConfig.AggregateAmountMode,
+					self.BuildRetentionCutOff(AppConfig),
+					AppConfig.DumperRetentionBatchSize
 				)
 			),
+			*self.BuildHotDayCacheTasks(App, CancellationToken),
+			*self.BuildStatsCacheTasks(App, CancellationToken)
+		]
+
+	def BuildRetentionCutOff(self, AppConfig : AppConfig) -> Optional[timedelta]:
+
+		if not AppConfig.DumperRetentionEnabled:
+
+			return None
+
+		# Grace days past the /stats cutoff, a request computing its cutoff just before midnight still finds its first day in Redis
+		return timedelta(days = AppConfig.CutOffDays + max(AppConfig.DumperRetentionGraceDays, 0), minutes = AppConfig.CutOffMinutes, seconds = AppConfig.CutOffSeconds)
+
+	def BuildHotDayCacheTasks(self, App : FastAPI, CancellationToken : CancellationToken) -> List[asyncio.Task]:
+
+		if App.state.HotDayCache is None:
+
+			return []
+
+		# Holds one reader connection for the subscription, written days are dropped from the cache as they are flushed
+		return [asyncio.create_task(App.state.HotDayCache.ListenForUpdates(CancellationToken))]
+
+	def BuildStatsCacheTasks(self, App : FastAPI, CancellationToken : CancellationToken) -> List[asyncio.Task]:
+
+		if App.state.StatsCache is None:
+
+			return []
+
+		# Holds one reader connection for the subscription, days upserted by the dumper are dropped from the cache
+		return [asyncio.create_task(App.state.StatsCache.ListenForDumpedDays(App.state.Redis, CancellationToken))]
+
+	def BuildWorkerProcessPool(self, App : FastAPI, AppConfig : AppConfig):
+
+		App.state.WorkerProcessPool = None
+
+		if AppConfig.AggregatorProcessCount > 0 or AppConfig.ImporterInWorkerProcess:
+
+			App.state.WorkerProcessPool = WorkerProcessPool(AppConfig)
+
+			App.state.WorkerProcessPool.Start(RunImporter = AppConfig.ImporterInWorkerProcess)
+
+	def BuildImporterTasks(self, App : FastAPI, AppConfig : AppConfig) -> List[asyncio.Task]:
+
+		if AppConfig.ImporterInWorkerProcess:
+
+			return []
+
+		return \
+		[
 			asyncio.create_task \
 			(
-				DataAggregator.AggregateData \
+				DataImporter.ImportData \
 				(
-					App.state.Redis,
-					AppConfig.RedisTransactionQueueKeyName,
-					AppConfig.TransactionCkeckTimeout,
-					CancellationToken
+					App.state.RedisWriter,
+					AppConfig.CsvFilePath,
+					self.BuildTransactionQueue(App, AppConfig, App.state.RedisWriter),
+					AppConfig.ImporterMode,
+					AppConfig.ImporterBulkBatchSize,
+					AppConfig.ImporterBulkChunkSize,
+					AppConfig.QueueWireFormat,
+					AppConfig.AggregateAmountMode,
+					AppConfig.ImporterQueueHighWatermark,
+					AppConfig.ImporterQueueLowWatermark,
+					AppConfig.ImporterBackpressurePollInterval,
+					AppConfig.ImporterFileConcurrency,
+					AppConfig.ImporterCheckpointsEnabled,
+					AppConfig.ImporterReaderBackend,
+					AppConfig.TransactionIdsEnabled,
+					AppConfig.ImporterQueueLagRefreshInterval
 				)
-			),
+			)
+		]
+
+	def BuildAggregatorTasks(self, App : FastAPI, AppConfig : AppConfig, CancellationToken : CancellationToken) -> List[asyncio.Task]:
+
+		AggregatorTaskList = []
+
+		if App.state.WorkerProcessPool is not None:
+
+			# Worker processes are restarted by their supervisor task when they die
+			AggregatorTaskList.append(asyncio.create_task(App.state.WorkerProcessPool.Supervise(AppConfig.WorkerProcessHealthCheckInterval)))
+
+		if AppConfig.AggregatorProcessCount > 0:
+
+			return AggregatorTaskList
+
+		AggregatorTaskList.extend \
+		(
 			asyncio.create_task \
 			(
-				DataDumper.DumpData \
+				DataAggregator.AggregateData \
 				(
-					App.state.Redis,
-					App.state.MongoDb,
-					AppConfig.DumperTaskScheduleInterval,
-					CancellationToken
+					App.state.RedisWriter,
+					# Each worker is its own consumer of the stream consumer group, popping through the consumer pool
+					self.BuildTransactionQueue(App, AppConfig, App.state.RedisConsumer, ConsumerName = GetStreamConsumerName(WorkerIndex)),
+					AppConfig.TransactionCkeckTimeout,
+					CancellationToken,
+					AppConfig.AggregatorBatchSize,
+					AppConfig.AggregatorBatchLingerTime,
+					AppConfig.QueueWireFormat,
+					AppConfig.AggregateAmountMode,
+					AppConfig.TransactionDedupTimeToLive
 				)
 			)
-		]
+			for WorkerIndex in range(AppConfig.AggregatorWorkerCount)
+		)
 
+		return AggregatorTaskList
@@ -1,7 +1,51 @@
 
+from enum import Enum
 from functools import lru_cache
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+class DataImporterMode(str, Enum):
+
+	# Replays the CSV file respecting sleep_ms between rows
+	Replay = "Replay"
+
+	# Backfills the CSV file in large chunks with pipelined multi-value LPUSH, sleep_ms is ignored
+	Bulk = "Bulk"
+
+	# Folds the CSV file into daily sums and writes them straight into the aggregate hashes, bypassing the queue
+	PreAggregate = "PreAggregate"
+
+class TransactionWireFormat(str, Enum):
+
+	# Transaction.model_dump_json() payloads, validated with pydantic by the consumer
+	Json = "Json"
+
+	# Packed struct with epoch seconds and interned type/payment method codes, decoded without pydantic
+	Compact = "Compact"
+
+class TransactionQueueBackend(str, Enum):
+
+	# Redis list consumed with BRPOP, popped transactions are lost if the consumer crashes
+	List = "List"
+
+	# Redis stream consumed by a consumer group, pending entries of crashed consumers are reclaimed
+	Stream = "Stream"
+
+class CsvReaderBackend(str, Enum):
+
+	# Chunks read through aiofiles, rows validated by the Transaction model
+	Aiofiles = "Aiofiles"
+
+	# Memory-mapped file scanned for row boundaries on the raw bytes, only the needed fields are decoded
+	Mmap = "Mmap"
+
+class AmountAccumulationMode(str, Enum):
+
+	# HINCRBYFLOAT on decimal amounts
+	Float = "Float"
+
+	# HINCRBY on integer minor units (cents), converted back to decimals at read and dump time
+	Cents = "Cents"
+
 class AppConfig(BaseSettings):
     
 	model_config = SettingsConfigDict \
@@ -34,8 +78,106 @@ class AppConfig(BaseSettings):
 
 	DumperTaskScheduleInterval : int
 
+	DumperRetentionEnabled : bool = True
+
+	DumperRetentionGraceDays : int = 1
+
+	DumperRetentionBatchSize : int = 500
+
+	AggregatorBatchSize : int = 1
+
+	AggregatorBatchLingerTime : float = 0
+
+	ImporterMode : DataImporterMode = DataImporterMode.Replay
+
+	ImporterBulkBatchSize : int = 5000
+
+	ImporterBulkChunkSize : int = 4194304
+
+	ImporterQueueHighWatermark : int = 500000
+
+	ImporterQueueLowWatermark : int = 250000
+
+	ImporterBackpressurePollInterval : float = 0.05
+
+	ImporterQueueLagRefreshInterval : float = 1
+
+	ImporterFileConcurrency : int = 4
+
+	ImporterCheckpointsEnabled : bool = True
+
+	ImporterReaderBackend : CsvReaderBackend = CsvReaderBackend.Aiofiles
+
+	TransactionIdsEnabled : bool = True
+
+	TransactionDedupTimeToLive : int = 604800
+
+	QueueWireFormat : TransactionWireFormat = TransactionWireFormat.Json
+
+	AggregateAmountMode : AmountAccumulationMode = AmountAccumulationMode.Float
+
+	QueueBackend : TransactionQueueBackend = TransactionQueueBackend.List
+
+	AggregatorWorkerCount : int = 1
+
+	StreamConsumerGroupName : str = "DataAggregators"
+
+	StreamPendingReclaimIdleTime : int = 30000
+
+	AggregatorProcessCount : int = 0
+
+	ImporterInWorkerProcess : bool = False
+
+	WorkerProcessHealthCheckInterval : float = 5
+
+	WorkerMetricsPublishInterval : float = 5
+
+	StatsCacheEnabled : bool = True
+
+	StatsCacheMaxWeight : int = 100000
+
+	StatsCacheRangeTimeToLive : float = 3600
+
+	StatsCacheDayTimeToLive : float = 600
+
+	StatsCacheSharedTierEnabled : bool = False
+
+	HotDayCacheEnabled : bool = True
+
+	HotDayCacheMaxDays : int = 64
+
+	HotDayCacheTimeToLive : float = 30
+
+	HotDayCacheMaxStaleness : float = 1
+
+	StatsRequestCoalescingEnabled : bool = True
+
+	StatsStreamBatchSize : int = 1000
+
 	MongoDbName : str = "TransactionsDb"
 
+	RedisReaderPoolSize : int = 32
+
+	RedisWriterPoolSize : int = 16
+
+	RedisConsumerPoolSize : int = 0
+
+	RedisPoolTimeout : float = 5
+
+	RedisSocketTimeout : float = 5
+
+	RedisSocketConnectTimeout : float = 5
+
+	RedisHealthCheckInterval : int = 30
+
+	MongoDbMaxPoolSize : int = 100
+
+	MongoDbMinPoolSize : int = 0
+
+	MongoDbWaitQueueTimeout : float = 5
+
+	MongoDbSocketTimeout : float = 30
+
 @lru_cache()
 def GetAppConfig() -> AppConfig:
 	return AppConfig()
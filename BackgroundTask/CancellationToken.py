@@ -1,4 +1,6 @@
 
+import multiprocessing
+
 class CancellationToken:
 
 	def __init__(self):
@@ -11,4 +13,22 @@ class CancellationToken:
 	
 	def Cancel(self):
 
-		self.__IsCancelled = True
\ No newline at end of file
+		self.__IsCancelled = True
+
+class ProcessCancellationToken(CancellationToken):
+
+	# Shared with worker processes, cancelling it in the API process stops the loops of every worker
+
+	def __init__(self, Context : multiprocessing.context.BaseContext):
+
+		super().__init__()
+
+		self.__CancelledEvent = Context.Event()
+
+	def IsCancelled(self):
+
+		return self.__CancelledEvent.is_set()
+
+	def Cancel(self):
+
+		self.__CancelledEvent.set()
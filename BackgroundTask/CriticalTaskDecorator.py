@@ -1,15 +1,22 @@
 
 import sys
 from typing import Callable, Any
-from tenacity import retry, stop_after_attempt, wait_exponential
+from Monitoring.Metrics import PipelineMetrics
+from tenacity import retry, stop_after_attempt, wait_exponential, RetryCallState
 
 def CriticalTask(StopAttemptCount: int = 3, ExponentialWaitMultiplier: float = 1.0, MinWaitTimeSeconds: float = 1.0, MaxWaitTimeSeconds: float = 10.0):
 
 	def decorator(func: Callable):
+
+		def CountRetry(RetryState : RetryCallState):
+
+			PipelineMetrics.CriticalTaskRetries.Increment(LabelValues = (func.__qualname__,))
+
 		@retry \
 		(
 			stop = stop_after_attempt(StopAttemptCount),
 			wait = wait_exponential(multiplier = ExponentialWaitMultiplier, min = MinWaitTimeSeconds, max = MaxWaitTimeSeconds),
+			before_sleep = CountRetry,
 			reraise = True
 		)
 		async def AsyncWrapper(*args: Any, **kwargs: Any):
@@ -1,32 +1,110 @@
 
+import time
+
 from redis.asyncio import Redis
-from Models.Transaction import Transaction
-from HelperMethods import GetRedisKeyDesign, GetDayDateFormat
+from AppConfig import TransactionWireFormat, AmountAccumulationMode
+from HelperMethods import GetRedisKeyDesign, GetAmountMinorUnitScale
+from typing import Dict, List, Tuple, Any, Optional
+from Models.TransactionCodec import DecodeTransaction
+from RedisHelper.TransactionQueue import TransactionQueue
+from RedisHelper.ImportCheckpoints import ImportCheckpoint
+from RedisHelper.AggregateBatchScript import AggregateBatchScript, IdentifiedAmountsDict
 from BackgroundTask.CriticalTaskDecorator import CriticalTask
 from BackgroundTask.CancellationToken import CancellationToken
+from Monitoring.Metrics import PipelineMetrics
 
 class DataAggregator:
 
 	@staticmethod
 	@CriticalTask()
-	async def AggregateData(Redis : Redis, TransactionQueueKey : str, TransactionCkeckTimeout : float, CancellationToken : CancellationToken):
+	async def AggregateData(Redis : Redis, Queue : TransactionQueue, TransactionCkeckTimeout : float, CancellationToken : CancellationToken, BatchSize : int = 1, BatchLingerTime : float = 0, WireFormat : TransactionWireFormat = TransactionWireFormat.Json, AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float, DedupTimeToLive : int = 604800):
+
+		await Queue.Initialize()
 
 		while (not CancellationToken.IsCancelled()):
-				
-			RedisStoredTransaction = await Redis.brpop(TransactionQueueKey, timeout = TransactionCkeckTimeout)
-			
-			if RedisStoredTransaction is None:
-				
+
+			TransactionPayloadList, AcknowledgeIdList = await Queue.PopBatch(TransactionCkeckTimeout, BatchSize, BatchLingerTime)
+
+			if not TransactionPayloadList and not AcknowledgeIdList:
+
+				continue
+
+			StartTime = time.perf_counter()
+
+			AggregatedAmountsDict, IdentifiedAmounts = DataAggregator.FoldTransactions(TransactionPayloadList, WireFormat, AmountMode)
+
+			await DataAggregator.FlushAggregatedAmounts(Redis, AggregatedAmountsDict, Queue, AcknowledgeIdList, AmountMode, IdentifiedAmounts = IdentifiedAmounts, DedupTimeToLive = DedupTimeToLive)
+
+			DataAggregator.RecordBatchMetrics(time.perf_counter() - StartTime, len(TransactionPayloadList))
+
+	@staticmethod
+	def RecordBatchMetrics(BatchDuration : float, EventCount : int):
+
+		PipelineMetrics.AggregatorEvents.Increment(EventCount)
+
+		PipelineMetrics.AggregatorBatchDuration.Observe(BatchDuration)
+
+		if EventCount:
+
+			# One observation per event at O(1), events of a batch share its fold and flush time
+			PipelineMetrics.AggregatorEventLatency.Observe(BatchDuration / EventCount, Count = EventCount)
+
+	@staticmethod
+	def FoldTransactions(TransactionPayloadList : List[bytes], WireFormat : TransactionWireFormat = TransactionWireFormat.Json, AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float) -> Tuple[Dict[Tuple[str, str], float | int], IdentifiedAmountsDict]:
+
+		# (RedisKey, PaymentMethod) -> Summed amount of the batch, in integer minor units for the Cents mode
+		AggregatedAmountsDict : Dict[Tuple[str, str], float | int] = {}
+
+		# Transactions carrying an id are kept one by one, each is checked against the ids already aggregated
+		IdentifiedAmounts : IdentifiedAmountsDict = {}
+
+		IsCentsMode = AmountMode == AmountAccumulationMode.Cents
+
+		MinorUnitScale = GetAmountMinorUnitScale()
+
+		for TransactionPayload in TransactionPayloadList:
+
+			Day, TransactionType, PaymentMethod, Amount, TransactionId = DecodeTransaction(TransactionPayload, WireFormat)
+
+			AggregateKey = (GetRedisKeyDesign(Day, TransactionType), PaymentMethod)
+
+			if IsCentsMode:
+
+				# Rounded per transaction, sums of integer cents are exact
+				Amount = round(Amount * MinorUnitScale)
+
+			if TransactionId is not None:
+
+				IdentifiedAmounts.setdefault(AggregateKey, []).append((TransactionId, Amount))
+
 				continue
-			
-			_, TransactionJson = RedisStoredTransaction
-			TransactionModel : Transaction = Transaction.model_validate_json(TransactionJson)
-			
-			Day = TransactionModel.Timestamp.strftime(GetDayDateFormat())
-			TransactionType = TransactionModel.Type
-			PaymentMethod = TransactionModel.PaymentMethod
-			Amount = float(TransactionModel.Amount)
-
-			RedisKey = GetRedisKeyDesign(Day, TransactionType)
-			
-			await Redis.hincrbyfloat(RedisKey, PaymentMethod, Amount)
+
+			AggregatedAmountsDict[AggregateKey] = AggregatedAmountsDict.get(AggregateKey, 0) + Amount
+
+		return AggregatedAmountsDict, IdentifiedAmounts
+
+	@staticmethod
+	async def FlushAggregatedAmounts(Redis : Redis, AggregatedAmountsDict : Dict[Tuple[str, str], float | int], Queue : Optional[TransactionQueue] = None, AcknowledgeIdList : Optional[List[Any]] = None, AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float, Checkpoint : Optional[ImportCheckpoint] = None, CheckpointOffset : int = 0, IdentifiedAmounts : Optional[IdentifiedAmountsDict] = None, DedupTimeToLive : int = 604800):
+
+		# One script call applies and acknowledges a batch completely or not at all, in a single round trip
+		CommandList = []
+
+		if Queue is not None:
+
+			CommandList.extend(Queue.GetAcknowledgeCommands(AcknowledgeIdList or []))
+
+		if Checkpoint is not None:
+
+			# Pre-aggregated chunks of the importer commit the file offset after them with their sums
+			CommandList.extend(Checkpoint.GetSaveCommands(CheckpointOffset))
+
+		if not AggregatedAmountsDict and not IdentifiedAmounts and not CommandList:
+
+			return
+
+		# Keys are marked dirty for the DataDumper and the written days are published to the hot day caches by the script
+		AppliedEventCount = await AggregateBatchScript.Apply(Redis, AggregatedAmountsDict, IdentifiedAmounts or {}, AmountMode, DedupTimeToLive, CommandList)
+
+		if IdentifiedAmounts:
+
+			PipelineMetrics.AggregatorDuplicateEvents.Increment(sum(len(EventList) for EventList in IdentifiedAmounts.values()) - AppliedEventCount)
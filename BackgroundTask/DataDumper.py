@@ -1,18 +1,25 @@
 
+import time
 import asyncio
 import logging
 
-from typing import List
 from redis.asyncio import Redis
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from AppConfig import AmountAccumulationMode
 from pymongo.results import BulkWriteResult
 from Models.DailyAggregate import DailyAggregate
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from RedisHelper import RedisServices
-from HelperMethods import GetRedisKeyDesignPattern
+from HelperMethods import GetRedisKeyDesignPattern, GetDayDateFormat, GetRedisRetiredAggregateKeysSetName, GetAmountMinorUnitScale, CalculateCutOffDate, GetRedisDumpedDaysChannelName
+from RedisHelper.RetireAggregateKeysScript import RetireAggregateKeysScript
 from BackgroundTask.CriticalTaskDecorator import CriticalTask
 from BackgroundTask.CancellationToken import CancellationToken
+from Monitoring.Metrics import PipelineMetrics
 from Db.Repositories.DailyAggregatesRepository import DailyAggregatesRepository
+from Models.AggregateRollup import BuildAggregateRollups, GetPeriodStart, GetPeriodEnd, ParseDay
+from Db.Repositories.AggregateRollupsRepository import AggregateRollupsRepository, WeeklyAggregatesRepository, MonthlyAggregatesRepository
 
 logger = logging.getLogger("uvicorn")
 
@@ -20,31 +27,277 @@ class DataDumper:
 
 	@staticmethod
 	@CriticalTask()
-	async def DumpData(Redis : Redis, MongoDb : AsyncIOMotorDatabase, DumperTaskScheduleInterval : int, CancellationToken : CancellationToken):
+	async def DumpData(Redis : Redis, MongoDb : AsyncIOMotorDatabase, DumperTaskScheduleInterval : int, CancellationToken : CancellationToken, AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float, RetentionCutOff : Optional[timedelta] = None, RetentionBatchSize : int = 500):
 		
 		DailyAggregatesRepo : DailyAggregatesRepository = DailyAggregatesRepository(MongoDb)
 
 		await DailyAggregatesRepo.Initialize()
 
+		AggregateRollupsRepoList : List[AggregateRollupsRepository] = [WeeklyAggregatesRepository(MongoDb), MonthlyAggregatesRepository(MongoDb)]
+
+		for AggregateRollupsRepo in AggregateRollupsRepoList:
+
+			await AggregateRollupsRepo.Initialize()
+
+		# Rollups are rebuilt once for every stored day, daily documents may predate the rollup collections
+		await DataDumper.RollupDays(DailyAggregatesRepo, AggregateRollupsRepoList, await DailyAggregatesRepo.GetAllDates())
+
+		# Every aggregate key seen by this dumper, used to report how many unchanged keys a cycle skipped
+		KnownRedisKeySet : Set[bytes] = set()
+
+		# The first cycle dumps every key, aggregates written before the dumper started may not be marked dirty
+		IsFirstCycle = True
+
 		while(not CancellationToken.IsCancelled()):
 
-			RedisKeysList = await RedisServices.ScanRedisKeys(Redis = Redis, Pattern = GetRedisKeyDesignPattern())
-			
-			if RedisKeysList == []:
+			await DataDumper.DumpCycle(Redis, DailyAggregatesRepo, KnownRedisKeySet, FullScan = IsFirstCycle, AmountMode = AmountMode, AggregateRollupsRepoList = AggregateRollupsRepoList)
+
+			IsFirstCycle = False
+
+			if RetentionCutOff is not None:
+
+				await DataDumper.RetireCycle(Redis, DailyAggregatesRepo, KnownRedisKeySet, RetentionCutOff, RetentionBatchSize, AmountMode)
+
+			await asyncio.sleep(DumperTaskScheduleInterval)
+
+	@staticmethod
+	async def DumpCycle(Redis : Redis, DailyAggregatesRepo : DailyAggregatesRepository, KnownRedisKeySet : Set[bytes], FullScan : bool = False, AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float, AggregateRollupsRepoList : Optional[List[AggregateRollupsRepository]] = None) -> int:
+
+		StartTime = time.perf_counter()
+
+		RedisKeysList = await RedisServices.TakeDirtyAggregateKeys(Redis)
+
+		if FullScan:
+
+			RedisKeysList = list(set(RedisKeysList) | set(await RedisServices.ScanRedisKeys(Redis = Redis, Pattern = [GetRedisKeyDesignPattern()])))
+
+		KnownRedisKeySet.update(RedisKeysList)
+
+		if RedisKeysList == []:
+
+			return 0
+
+		await DataDumper.RestoreRetiredKeys(Redis, DailyAggregatesRepo, RedisKeysList, AmountMode)
+
+		RedisDailyAggregateList : List[DailyAggregate] = await RedisServices.GetDailyAggregatesByRedisKeys(Redis, KeyList = RedisKeysList, AmountMode = AmountMode)
+
+		if RedisDailyAggregateList == []:
+
+			await RedisServices.ReleaseDumpedAggregateKeys(Redis)
+
+			return 0
+
+		DumpOperationResult : BulkWriteResult =  await DailyAggregatesRepo.BulkUpsertDailyAggreates(RedisDailyAggregateList, Upsert = True)
+
+		RollupCount = 0
+
+		if AggregateRollupsRepoList:
+
+			RollupCount = await DataDumper.RollupDays(DailyAggregatesRepo, AggregateRollupsRepoList, { DailyAggregateItem.Date for DailyAggregateItem in RedisDailyAggregateList })
+
+		# Cached /stats results of the dumped days are dropped, published before the release so a failed publish is sent again with the retried keys
+		await Redis.publish(GetRedisDumpedDaysChannelName(), ",".join(sorted({ DailyAggregateItem.Date for DailyAggregateItem in RedisDailyAggregateList })))
+
+		# Dirty keys are only released once MongoDb holds them, a failed dump retries them on the next cycle
+		await RedisServices.ReleaseDumpedAggregateKeys(Redis)
+		
+		StringDumpOperationResult = '' \
+		f'Dumped {len(RedisDailyAggregateList)} record in Database:' \
+		f'  - Inserted Documents {DumpOperationResult.inserted_count}' \
+		f'  - Upserted Documents {DumpOperationResult.upserted_count}' \
+		f'  - Matched Documents {DumpOperationResult.matched_count}' \
+		f'  - Removed Documents {DumpOperationResult.deleted_count}' \
+		f'  - Skipped Unchanged Keys {len(KnownRedisKeySet) - len(RedisKeysList)}' \
+		f'  - Rebuilt Rollups {RollupCount}'
+
+		logger.info(StringDumpOperationResult)
+
+		PipelineMetrics.DumpedDocuments.Increment(DumpOperationResult.upserted_count + DumpOperationResult.modified_count)
+
+		PipelineMetrics.DumpCycleDuration.Observe(time.perf_counter() - StartTime)
+
+		return len(RedisDailyAggregateList)
+
+	@staticmethod
+	async def RetireCycle(Redis : Redis, DailyAggregatesRepo : DailyAggregatesRepository, KnownRedisKeySet : Set[bytes], RetentionCutOff : timedelta, BatchSize : int = 500, AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float) -> int:
+
+		CutOffDay = CalculateCutOffDate(RetentionCutOff).strftime(GetDayDateFormat()).encode("utf-8")
+
+		# agg:{Day}:{Type}s, days before the cutoff are only read from MongoDb by /stats
+		CandidateKeyList = sorted(Key for Key in KnownRedisKeySet if Key.count(b":") == 2 and Key.split(b":")[1] < CutOffDay)
+
+		BatchSize = max(BatchSize, 1)
+
+		RetiredCount = 0
+
+		for BatchStart in range(0, len(CandidateKeyList), BatchSize):
+
+			RetiredKeyList = await DataDumper.RetireKeys(Redis, DailyAggregatesRepo, CandidateKeyList[BatchStart : BatchStart + BatchSize], AmountMode)
+
+			# Keys left in Redis (not persisted yet, written meanwhile) stay known and are tried again on the next cycle
+			KnownRedisKeySet.difference_update(RetiredKeyList)
+
+			RetiredCount += len(RetiredKeyList)
+
+		if RetiredCount > 0:
+
+			logger.info(f"Retired {RetiredCount} Redis aggregate keys of days before {CutOffDay.decode('utf-8')}, {len(CandidateKeyList) - RetiredCount} kept until persisted")
+
+			PipelineMetrics.DumperRetiredKeys.Increment(RetiredCount)
+
+		return RetiredCount
+
+	@staticmethod
+	async def RetireKeys(Redis : Redis, DailyAggregatesRepo : DailyAggregatesRepository, KeyList : List[bytes], AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float) -> List[bytes]:
+
+		# Server time before the read, the script keeps every key an aggregator wrote after it
+		Seconds, Microseconds = await Redis.time()
+
+		ComparedAt = Seconds * 1000 + Microseconds // 1000
+
+		# (Day, Type) -> Aggregate key
+		RedisKeyDict : Dict[Tuple[str, str], bytes] = { tuple(Key.decode("utf-8").split(":")[1:]) : Key for Key in KeyList }
+
+		RedisDailyAggregateList : List[DailyAggregate] = await RedisServices.GetDailyAggregatesByRedisKeys(Redis, KeyList = KeyList, AmountMode = AmountMode)
+
+		PersistedAmountsDict = \
+		{
+			(DailyAggregateItem.Date, DailyAggregateItem.Type) : DataDumper.GetStoredAmounts(DailyAggregateItem, AmountMode)
+			for DailyAggregateItem in await DailyAggregatesRepo.GetByDates(sorted({ DailyAggregateItem.Date for DailyAggregateItem in RedisDailyAggregateList }))
+		}
+
+		# Only keys whose MongoDb document holds exactly their amounts are retired
+		PersistedKeyList = \
+		[
+			RedisKeyDict[(DailyAggregateItem.Date, DailyAggregateItem.Type)].decode("utf-8")
+			for DailyAggregateItem in RedisDailyAggregateList
+			if PersistedAmountsDict.get((DailyAggregateItem.Date, DailyAggregateItem.Type)) == DataDumper.GetStoredAmounts(DailyAggregateItem, AmountMode)
+		]
+
+		RetiredKeyList : List[bytes] = await RetireAggregateKeysScript.Retire(Redis, PersistedKeyList, ComparedAt) if PersistedKeyList else []
+
+		# Keys gone from Redis have nothing to retire, they are forgotten as well
+		ExistingKeySet = { RedisKeyDict[(DailyAggregateItem.Date, DailyAggregateItem.Type)] for DailyAggregateItem in RedisDailyAggregateList }
+
+		return RetiredKeyList + [Key for Key in KeyList if Key not in ExistingKeySet]
+
+	@staticmethod
+	async def RestoreRetiredKeys(Redis : Redis, DailyAggregatesRepo : DailyAggregatesRepository, RedisKeysList : List[bytes], AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float) -> int:
+
+		RetiredFlagList = await Redis.smismember(GetRedisRetiredAggregateKeysSetName(), RedisKeysList)
+
+		RetiredKeyList = [Key.decode("utf-8") if isinstance(Key, bytes) else Key for Key, IsRetired in zip(RedisKeysList, RetiredFlagList) if IsRetired]
+
+		if RetiredKeyList == []:
+
+			return 0
+
+		StoredDailyAggregateDict : Dict[Tuple[str, str], DailyAggregate] = \
+		{
+			(DailyAggregateItem.Date, DailyAggregateItem.Type) : DailyAggregateItem
+			for DailyAggregateItem in await DailyAggregatesRepo.GetByDates(sorted({ Key.split(":")[1] for Key in RetiredKeyList }))
+		}
+
+		# A retired key written again only holds the late increments, its MongoDb amounts are added back once before it is dumped
+		async with Redis.pipeline(transaction = True) as Pipe:
+
+			for Key in RetiredKeyList:
+
+				StoredDailyAggregate = StoredDailyAggregateDict.get(tuple(Key.split(":")[1:]))
+
+				if StoredDailyAggregate is not None:
+
+					for PaymentMethod, Amount in DataDumper.GetStoredAmounts(StoredDailyAggregate, AmountMode).items():
+
+						if AmountMode == AmountAccumulationMode.Cents:
+
+							Pipe.hincrby(Key, PaymentMethod, Amount)
+
+						else:
+
+							Pipe.hincrbyfloat(Key, PaymentMethod, Amount)
+
+				Pipe.srem(GetRedisRetiredAggregateKeysSetName(), Key)
+
+			await Pipe.execute()
+
+		logger.info(f"Restored {len(RetiredKeyList)} retired Redis aggregate keys written again")
+
+		PipelineMetrics.DumperRestoredKeys.Increment(len(RetiredKeyList))
+
+		return len(RetiredKeyList)
+
+	@staticmethod
+	def GetStoredAmounts(DailyAggregateItem : DailyAggregate, AmountMode : AmountAccumulationMode) -> Dict[str, float | int]:
+
+		if AmountMode == AmountAccumulationMode.Float:
+
+			return DailyAggregateItem.TotalAmount
+
+		if DailyAggregateItem.TotalAmountCents is not None:
+
+			return dict(DailyAggregateItem.TotalAmountCents)
+
+		# Documents dumped in Float mode hold no cents
+		return { PaymentMethod : round(Amount * GetAmountMinorUnitScale()) for PaymentMethod, Amount in DailyAggregateItem.TotalAmount.items() }
+
+	@staticmethod
+	async def RollupDays(DailyAggregatesRepo : DailyAggregatesRepository, AggregateRollupsRepoList : List[AggregateRollupsRepository], DayList : Iterable[str]) -> int:
+
+		# Every week and month containing one of the days is rebuilt from its daily documents, so rebuilding is idempotent
+		PeriodStartSetList = \
+		[
+			{ GetPeriodStart(ParseDay(Day), AggregateRollupsRepo.Granularity) for Day in DayList }
+			for AggregateRollupsRepo in AggregateRollupsRepoList
+		]
+
+		PeriodRangeList = \
+		[
+			(PeriodStart, GetPeriodEnd(PeriodStart, AggregateRollupsRepo.Granularity))
+			for AggregateRollupsRepo, PeriodStartSet in zip(AggregateRollupsRepoList, PeriodStartSetList)
+			for PeriodStart in PeriodStartSet
+		]
+
+		if PeriodRangeList == []:
+
+			return 0
+
+		# Overlapping weeks and months are read with a single query per contiguous day range
+		DailyAggregateList : List[DailyAggregate] = []
+
+		for RangeStart, RangeEnd in DataDumper.MergeDayRanges(PeriodRangeList):
+
+			DailyAggregateList.extend(await DailyAggregatesRepo.GetByDateRange(From = RangeStart.strftime(GetDayDateFormat()), To = RangeEnd.strftime(GetDayDateFormat())))
+
+		RollupCount = 0
+
+		for AggregateRollupsRepo, PeriodStartSet in zip(AggregateRollupsRepoList, PeriodStartSetList):
+
+			AggregateRollupList = BuildAggregateRollups(DailyAggregateList, AggregateRollupsRepo.Granularity, PeriodStartSet)
+
+			if AggregateRollupList == []:
 
 				continue
 
-			RedisDailyAggregateList : List[DailyAggregate] = await RedisServices.GetDailyAggregatesByRedisKeys(Redis, KeyList = RedisKeysList)
+			await AggregateRollupsRepo.BulkUpsertAggregateRollups(AggregateRollupList, Upsert = True)
 
-			DumpOperationResult : BulkWriteResult =  await DailyAggregatesRepo.BulkUpsertDailyAggreates(RedisDailyAggregateList, Upsert = True)
-			
-			StringDumpOperationResult = '' \
-			f'Dumped {len(RedisDailyAggregateList)} record in Database:' \
-			f'  - Inserted Documents {DumpOperationResult.inserted_count}' \
-			f'  - Upserted Documents {DumpOperationResult.upserted_count}' \
-			f'  - Matched Documents {DumpOperationResult.matched_count}' \
-			f'  - Removed Documents {DumpOperationResult.deleted_count}'
+			RollupCount += len(AggregateRollupList)
 
-			logger.info(StringDumpOperationResult)
+		return RollupCount
 
-			await asyncio.sleep(DumperTaskScheduleInterval)
+	@staticmethod
+	def MergeDayRanges(DayRangeList : List[Tuple[date, date]]) -> List[Tuple[date, date]]:
+
+		MergedDayRangeList : List[Tuple[date, date]] = []
+
+		for RangeStart, RangeEnd in sorted(DayRangeList):
+
+			if MergedDayRangeList and RangeStart <= MergedDayRangeList[-1][1]:
+
+				MergedDayRangeList[-1] = (MergedDayRangeList[-1][0], max(MergedDayRangeList[-1][1], RangeEnd))
+
+				continue
+
+			MergedDayRangeList.append((RangeStart, RangeEnd))
+
+		return MergedDayRangeList
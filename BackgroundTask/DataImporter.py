@@ -1,11 +1,28 @@
 
+import os
+import csv
+import glob
+import time
 import asyncio
 import logging
 import aiofiles
+import functools
 
 from redis.asyncio import Redis
+from datetime import datetime
 from Models.Transaction import Transaction
+from Models.TransactionCodec import EncodeTransaction, EncodeTransactionFields, CreateTransactionIdPrefix
+from RedisHelper.TransactionQueue import TransactionQueue
+from RedisHelper.ImportCheckpoints import ImportCheckpoint
+from AppConfig import DataImporterMode, TransactionWireFormat, AmountAccumulationMode, CsvReaderBackend
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from BackgroundTask.DataAggregator import DataAggregator
+from HelperMethods import GetRedisKeyDesign, GetDayDateFormat, GetAmountMinorUnitScale
+from Exceptions.Exceptions import CsvFileParsingException
 from BackgroundTask.CriticalTaskDecorator import CriticalTask
+from BackgroundTask.QueueBackpressure import QueueBackpressure
+from BackgroundTask.MmapCsvReader import MmapCsvReader, CsvTransactionRow
+from Monitoring.Metrics import PipelineMetrics
 
 logger = logging.getLogger('uvicorn')
 
@@ -13,15 +30,101 @@ class DataImporter:
 
 	@staticmethod
 	@CriticalTask()
-	async def ImportData(Redis : Redis, FilePath : str, QueueListKey : str):
+	async def ImportData(Redis : Redis, FilePath : str, Queue : TransactionQueue, Mode : DataImporterMode = DataImporterMode.Replay, BulkBatchSize : int = 5000, BulkChunkSize : int = 4194304, WireFormat : TransactionWireFormat = TransactionWireFormat.Json, AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float, QueueHighWatermark : int = 0, QueueLowWatermark : int = 0, BackpressurePollInterval : float = 0.05, FileConcurrency : int = 1, CheckpointsEnabled : bool = True, ReaderBackend : CsvReaderBackend = CsvReaderBackend.Aiofiles, TransactionIdsEnabled : bool = False, QueueLagRefreshInterval : float = 1):
+
+		# Flow control of the queue modes, a high watermark of 0 pushes without checking the queue depth
+		Backpressure = QueueBackpressure(Queue, QueueHighWatermark, QueueLowWatermark, BackpressurePollInterval, QueueLagRefreshInterval)
+
+		FilePathList = DataImporter.ResolveFilePaths(FilePath)
+
+		if FilePathList == []:
+
+			logger.info(f"⚠️ No CSV File matches {FilePath}")
+
+			return
+
+		# Bounded number of files read and pushed at the same time
+		FileSemaphore = asyncio.Semaphore(max(FileConcurrency, 1))
+
+		async def ImportFileWithinLimit(CsvFilePath : str):
+
+			async with FileSemaphore:
+
+				Checkpoint = ImportCheckpoint(Redis, CsvFilePath) if CheckpointsEnabled else None
+
+				# Queued rows carry their file and byte offset, the aggregators count a row replayed after a failure once
+				TransactionIdPrefix = CreateTransactionIdPrefix(CsvFilePath) if TransactionIdsEnabled else None
+
+				await DataImporter.ImportFile(Redis, CsvFilePath, Queue, Mode, BulkBatchSize, BulkChunkSize, WireFormat, AmountMode, Backpressure, Checkpoint, ReaderBackend, TransactionIdPrefix)
+
+		# A failed file cancels the others, the retry resumes every file from its checkpoint
+		async with asyncio.TaskGroup() as ImportTaskGroup:
+
+			for CsvFilePath in FilePathList:
+
+				ImportTaskGroup.create_task(ImportFileWithinLimit(CsvFilePath))
+
+	@staticmethod
+	def ResolveFilePaths(FilePath : str) -> List[str]:
+
+		# A single file, every *.csv file of a directory, or a glob pattern
+		if os.path.isdir(FilePath):
+
+			return sorted(glob.glob(os.path.join(FilePath, "*.csv")))
+
+		if glob.has_magic(FilePath):
+
+			return sorted(MatchedPath for MatchedPath in glob.glob(FilePath) if os.path.isfile(MatchedPath))
+
+		return [FilePath]
+
+	@staticmethod
+	async def ImportFile(Redis : Redis, FilePath : str, Queue : TransactionQueue, Mode : DataImporterMode, BulkBatchSize : int, BulkChunkSize : int, WireFormat : TransactionWireFormat, AmountMode : AmountAccumulationMode, Backpressure : QueueBackpressure, Checkpoint : Optional[ImportCheckpoint] = None, ReaderBackend : CsvReaderBackend = CsvReaderBackend.Aiofiles, TransactionIdPrefix : Optional[str] = None):
+
+		StartOffset = await Checkpoint.Load() if Checkpoint is not None else 0
+
+		FileSize = os.path.getsize(FilePath)
+
+		if StartOffset > FileSize:
+
+			logger.info(f"⚠️ Checkpoint of {FilePath} is past its end, the file was replaced and is imported from its first row")
+
+			StartOffset = 0
+
+		elif StartOffset > 0 and StartOffset == FileSize:
+
+			logger.info(f"✅ {FilePath} was already imported, skipped")
+
+			return
+
+		elif StartOffset > 0:
+
+			logger.info(f"⚠️ Resuming {FilePath} import from byte {StartOffset}")
+
+		if Mode == DataImporterMode.Bulk:
+
+			await DataImporter.BulkImportData(FilePath, Queue, BulkBatchSize, BulkChunkSize, WireFormat, Backpressure, Checkpoint, StartOffset, ReaderBackend, TransactionIdPrefix)
+
+			return
+
+		if Mode == DataImporterMode.PreAggregate:
+
+			await DataImporter.PreAggregateData(Redis, FilePath, BulkChunkSize, AmountMode, Checkpoint, StartOffset, ReaderBackend)
+
+			return
+
+		# Replayed rows wait sleep_ms each, the reader backend does not matter there
+		await DataImporter.ReplayData(FilePath, Queue, WireFormat, Backpressure, Checkpoint, StartOffset, TransactionIdPrefix)
+
+	@staticmethod
+	async def ReplayData(FilePath : str, Queue : TransactionQueue, WireFormat : TransactionWireFormat, Backpressure : QueueBackpressure, Checkpoint : Optional[ImportCheckpoint] = None, StartOffset : int = 0, TransactionIdPrefix : Optional[str] = None):
 
 		Line = None
 
-		async with aiofiles.open(FilePath, "r") as CsvTransactionsFile:
+		async with aiofiles.open(FilePath, "rb") as CsvTransactionsFile:
+
+			Offset = await DataImporter.SeekStartOffset(CsvTransactionsFile, StartOffset)
 
-			# Skip first line of csv file (Column Names)
-			await CsvTransactionsFile.readline()
-			
 			while(True):
 
 				Line = await CsvTransactionsFile.readline()
@@ -30,12 +133,279 @@ class DataImporter:
 
 					break
 
-				TransactionString = Line.split(',')
-				
+				TransactionId = f"{TransactionIdPrefix}{Offset}" if TransactionIdPrefix is not None else None
+
+				Offset += len(Line)
+
+				TransactionString = Line.decode("utf-8").split(',')
+
 				TransactionData, SleepTime = Transaction.CreateFromStringList(TransactionString)
 
-				await Redis.lpush(QueueListKey, TransactionData.model_dump_json())
+				await Backpressure.WaitForCapacity(1)
+
+				await DataImporter.PushPayloads(Queue, [EncodeTransaction(TransactionData, WireFormat, TransactionId)], 1, Checkpoint, Offset)
+
+				PipelineMetrics.ImporterRows.Increment(LabelValues = (DataImporterMode.Replay.value,))
 
 				await asyncio.sleep(SleepTime / 1000)
 
-		logger("✅ Data Imported Successfully from CSV File")
+		logger.info(f"✅ Data Imported Successfully from CSV File {FilePath}")
+
+	@staticmethod
+	async def SeekStartOffset(CsvTransactionsFile, StartOffset : int) -> int:
+
+		if StartOffset > 0:
+
+			await CsvTransactionsFile.seek(StartOffset)
+
+			return StartOffset
+
+		# Skip first line of csv file (Column Names)
+		return len(await CsvTransactionsFile.readline())
+
+	@staticmethod
+	async def BulkImportData(FilePath : str, Queue : TransactionQueue, BulkBatchSize : int, BulkChunkSize : int, WireFormat : TransactionWireFormat, Backpressure : Optional[QueueBackpressure] = None, Checkpoint : Optional[ImportCheckpoint] = None, StartOffset : int = 0, ReaderBackend : CsvReaderBackend = CsvReaderBackend.Aiofiles, TransactionIdPrefix : Optional[str] = None):
+
+		# Backfill mode, sleep_ms is ignored and rows are pushed as fast as Redis accepts them
+		StartTime = time.perf_counter()
+
+		RowCount = 0
+
+		async for TransactionPayloadList, EndOffset in DataImporter.ReadPayloadChunks(FilePath, BulkChunkSize, StartOffset, WireFormat, ReaderBackend, TransactionIdPrefix):
+
+			ChunkRowCount = await DataImporter.PushChunk(Queue, TransactionPayloadList, BulkBatchSize, Backpressure, Checkpoint, EndOffset)
+
+			PipelineMetrics.ImporterRows.Increment(ChunkRowCount, (DataImporterMode.Bulk.value,))
+
+			RowCount += ChunkRowCount
+
+		ElapsedTime = time.perf_counter() - StartTime
+
+		logger.info(f"✅ Data Bulk Imported Successfully from CSV File {FilePath}: {RowCount} rows in {ElapsedTime:.2f}s ({RowCount / max(ElapsedTime, 1e-9):.0f} rows/sec)")
+
+	@staticmethod
+	async def PreAggregateData(Redis : Redis, FilePath : str, BulkChunkSize : int, AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float, Checkpoint : Optional[ImportCheckpoint] = None, StartOffset : int = 0, ReaderBackend : CsvReaderBackend = CsvReaderBackend.Aiofiles):
+
+		# Historical files skip the queue, every chunk is folded into per-(day, type, method) sums and
+		# written straight into the aggregate hashes, so memory is bounded by the chunk size
+		StartTime = time.perf_counter()
+
+		RowCount = 0
+
+		async for (AggregatedAmountsDict, ChunkRowCount), EndOffset in DataImporter.ReadFoldedChunks(FilePath, BulkChunkSize, StartOffset, AmountMode, ReaderBackend):
+
+			if AggregatedAmountsDict:
+
+				await DataAggregator.FlushAggregatedAmounts(Redis, AggregatedAmountsDict, AmountMode = AmountMode, Checkpoint = Checkpoint, CheckpointOffset = EndOffset)
+
+			PipelineMetrics.ImporterRows.Increment(ChunkRowCount, (DataImporterMode.PreAggregate.value,))
+
+			RowCount += ChunkRowCount
+
+		ElapsedTime = time.perf_counter() - StartTime
+
+		logger.info(f"✅ Data Pre-Aggregated Successfully from CSV File {FilePath}: {RowCount} rows in {ElapsedTime:.2f}s ({RowCount / max(ElapsedTime, 1e-9):.0f} rows/sec)")
+
+	@staticmethod
+	async def ReadPayloadChunks(FilePath : str, ChunkSize : int, StartOffset : int, WireFormat : TransactionWireFormat, ReaderBackend : CsvReaderBackend, TransactionIdPrefix : Optional[str] = None) -> AsyncIterator[Tuple[List[bytes | str], int]]:
+
+		if ReaderBackend == CsvReaderBackend.Mmap:
+
+			# Rows are encoded in the reader thread together with their parsing
+			async for TransactionPayloadList, EndOffset in MmapCsvReader.ReadRowBatches(FilePath, ChunkSize, StartOffset, functools.partial(DataImporter.EncodeRows, WireFormat = WireFormat, TransactionIdPrefix = TransactionIdPrefix)):
+
+				yield TransactionPayloadList, EndOffset
+
+			return
+
+		async for LineList, ChunkOffset, EndOffset in DataImporter.ReadLineChunks(FilePath, ChunkSize, StartOffset):
+
+			yield DataImporter.EncodeLines(LineList, WireFormat, TransactionIdPrefix, ChunkOffset), EndOffset
+
+	@staticmethod
+	async def ReadFoldedChunks(FilePath : str, ChunkSize : int, StartOffset : int, AmountMode : AmountAccumulationMode, ReaderBackend : CsvReaderBackend) -> AsyncIterator[Tuple[Tuple[Dict[Tuple[str, str], float | int], int], int]]:
+
+		if ReaderBackend == CsvReaderBackend.Mmap:
+
+			async for FoldedChunk, EndOffset in MmapCsvReader.ReadRowBatches(FilePath, ChunkSize, StartOffset, functools.partial(DataImporter.FoldRows, AmountMode = AmountMode)):
+
+				yield FoldedChunk, EndOffset
+
+			return
+
+		async for LineList, _, EndOffset in DataImporter.ReadLineChunks(FilePath, ChunkSize, StartOffset):
+
+			yield DataImporter.FoldLines(LineList, AmountMode), EndOffset
+
+	@staticmethod
+	async def ReadLineChunks(FilePath : str, ChunkSize : int, StartOffset : int = 0) -> AsyncIterator[Tuple[List[str], int, int]]:
+
+		# Yields the complete lines of each chunk with the byte offsets of their first line and right after them
+		async with aiofiles.open(FilePath, "rb") as CsvTransactionsFile:
+
+			ReadOffset = await DataImporter.SeekStartOffset(CsvTransactionsFile, StartOffset)
+
+			PartialLine = b""
+
+			while(True):
+
+				Chunk = await CsvTransactionsFile.read(ChunkSize)
+
+				if (not Chunk):
+
+					break
+
+				ReadOffset += len(Chunk)
+
+				Buffer = PartialLine + Chunk
+
+				# Bytes after the last newline are a line cut in the middle by the chunk boundary
+				LineEnd = Buffer.rfind(b'\n') + 1
+
+				PartialLine = Buffer[LineEnd:]
+
+				# Decoded at newline boundaries, a multi-byte character is never split
+				yield Buffer[:LineEnd].decode("utf-8").split('\n'), ReadOffset - len(Buffer), ReadOffset - len(PartialLine)
+
+			if PartialLine:
+
+				yield [PartialLine.decode("utf-8")], ReadOffset - len(PartialLine), ReadOffset
+
+	@staticmethod
+	def FoldLines(LineList : List[str], AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float) -> Tuple[Dict[Tuple[str, str], float | int], int]:
+
+		# (RedisKey, PaymentMethod) -> Summed amount of the chunk, same keys and units as DataAggregator.FoldTransactions
+		AggregatedAmountsDict : Dict[Tuple[str, str], float | int] = {}
+
+		IsCentsMode = AmountMode == AmountAccumulationMode.Cents
+
+		MinorUnitScale = GetAmountMinorUnitScale()
+
+		RowCount = 0
+
+		for Row in csv.reader(Line for Line in LineList if Line.strip()):
+
+			try:
+
+				Day = datetime.fromisoformat(Row[0].strip()).strftime(GetDayDateFormat())
+
+				AggregateKey = (GetRedisKeyDesign(Day, Row[1].strip()), Row[2].strip())
+
+				Amount = float(Row[3])
+
+			except Exception as e:
+
+				raise CsvFileParsingException()
+
+			if IsCentsMode:
+
+				Amount = round(Amount * MinorUnitScale)
+
+			AggregatedAmountsDict[AggregateKey] = AggregatedAmountsDict.get(AggregateKey, 0) + Amount
+
+			RowCount += 1
+
+		return AggregatedAmountsDict, RowCount
+
+	@staticmethod
+	def EncodeRows(RowList : List[CsvTransactionRow], WireFormat : TransactionWireFormat, TransactionIdPrefix : Optional[str] = None) -> List[bytes | str]:
+
+		return \
+		[
+			EncodeTransactionFields(Timestamp, TransactionType, PaymentMethod, Amount, WireFormat, f"{TransactionIdPrefix}{RowOffset}" if TransactionIdPrefix is not None else None)
+			for Timestamp, TransactionType, PaymentMethod, Amount, _, RowOffset in RowList
+		]
+
+	@staticmethod
+	def FoldRows(RowList : List[CsvTransactionRow], AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float) -> Tuple[Dict[Tuple[str, str], float | int], int]:
+
+		# Same sums as FoldLines for rows already parsed by the memory-mapped reader
+		AggregatedAmountsDict : Dict[Tuple[str, str], float | int] = {}
+
+		IsCentsMode = AmountMode == AmountAccumulationMode.Cents
+
+		MinorUnitScale = GetAmountMinorUnitScale()
+
+		# Day ordinal -> Day string, a chunk only spans a handful of days
+		DayStringDict : Dict[int, str] = {}
+
+		for Timestamp, TransactionType, PaymentMethod, Amount, *_ in RowList:
+
+			DayOrdinal = Timestamp.toordinal()
+
+			Day = DayStringDict.get(DayOrdinal)
+
+			if Day is None:
+
+				Day = DayStringDict[DayOrdinal] = Timestamp.strftime(GetDayDateFormat())
+
+			AggregateKey = (GetRedisKeyDesign(Day, TransactionType), PaymentMethod)
+
+			if IsCentsMode:
+
+				Amount = round(Amount * MinorUnitScale)
+
+			AggregatedAmountsDict[AggregateKey] = AggregatedAmountsDict.get(AggregateKey, 0) + Amount
+
+		return AggregatedAmountsDict, len(RowList)
+
+	@staticmethod
+	def EncodeLines(LineList : List[str], WireFormat : TransactionWireFormat, TransactionIdPrefix : Optional[str] = None, ChunkOffset : int = 0) -> List[bytes | str]:
+
+		if TransactionIdPrefix is None:
+
+			return \
+			[
+				EncodeTransaction(Transaction.CreateFromStringList(Line.split(','))[0], WireFormat)
+				for Line in LineList
+				if Line.strip()
+			]
+
+		TransactionPayloadList : List[bytes | str] = []
+
+		LineOffset = ChunkOffset
+
+		for Line in LineList:
+
+			if Line.strip():
+
+				TransactionPayloadList.append(EncodeTransaction(Transaction.CreateFromStringList(Line.split(','))[0], WireFormat, f"{TransactionIdPrefix}{LineOffset}"))
+
+			# Byte offsets, the newline removed by split included
+			LineOffset += (len(Line) if Line.isascii() else len(Line.encode("utf-8"))) + 1
+
+		return TransactionPayloadList
+
+	@staticmethod
+	async def PushChunk(Queue : TransactionQueue, TransactionPayloadList : List[bytes | str], BulkBatchSize : int, Backpressure : Optional[QueueBackpressure] = None, Checkpoint : Optional[ImportCheckpoint] = None, EndOffset : int = 0) -> int:
+
+		if not TransactionPayloadList:
+
+			return 0
+
+		if Backpressure is not None:
+
+			# Checked per chunk, the queue can overshoot the high watermark by at most one chunk
+			await Backpressure.WaitForCapacity(len(TransactionPayloadList))
+
+		await DataImporter.PushPayloads(Queue, TransactionPayloadList, BulkBatchSize, Checkpoint, EndOffset)
+
+		return len(TransactionPayloadList)
+
+	@staticmethod
+	async def PushPayloads(Queue : TransactionQueue, TransactionPayloadList : List[bytes | str], BatchSize : int, Checkpoint : Optional[ImportCheckpoint] = None, EndOffset : int = 0):
+
+		if Checkpoint is None:
+
+			await Queue.Push(TransactionPayloadList, BatchSize)
+
+			return
+
+		# The rows and the offset after them are committed in one MULTI/EXEC, a restart neither skips nor replays rows
+		async with Queue.Redis.pipeline(transaction = True) as pipe:
+
+			Queue.AddPushCommands(pipe, TransactionPayloadList, BatchSize)
+
+			Checkpoint.AddSaveCommands(pipe, EndOffset)
+
+			await pipe.execute()
@@ -0,0 +1,121 @@
+
+import os
+import mmap
+import asyncio
+
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+from Exceptions.Exceptions import CsvFileParsingException
+
+# Parsed CSV row: (Timestamp, Type, PaymentMethod, Amount, SleepTime, Row byte offset), plain tuples are cheaper to build than models
+CsvTransactionRow = Tuple[datetime, str, str, float, int, int]
+
+# Distinct raw values kept decoded, types and payment methods only take a handful of values
+MaxDecodedValueCount = 1024
+
+class MmapCsvReader:
+
+	@staticmethod
+	async def ReadRowBatches(FilePath : str, ChunkSize : int, StartOffset : int = 0, ConvertRows : Callable[[List[CsvTransactionRow]], Any] = list) -> AsyncIterator[Tuple[Any, int]]:
+
+		# Yields the rows of about ChunkSize bytes at a time, converted by ConvertRows, with the byte offset right after them
+		with open(FilePath, "rb") as CsvTransactionsFile:
+
+			if os.fstat(CsvTransactionsFile.fileno()).st_size == 0:
+
+				return
+
+			with mmap.mmap(CsvTransactionsFile.fileno(), 0, access = mmap.ACCESS_READ) as Buffer:
+
+				BufferSize = len(Buffer)
+
+				# Skip first line of csv file (Column Names)
+				Offset = StartOffset if StartOffset > 0 else Buffer.find(b'\n') + 1
+
+				if Offset == 0:
+
+					return
+
+				DecodedValueDict : Dict[bytes, str] = {}
+
+				while Offset < BufferSize:
+
+					# Scanned, parsed and converted in a thread, the event loop keeps serving /stats while a chunk is processed
+					ConvertedRows, ChunkEnd = await asyncio.to_thread(MmapCsvReader.ReadChunk, Buffer, Offset, ChunkSize, DecodedValueDict, ConvertRows)
+
+					yield ConvertedRows, ChunkEnd
+
+					Offset = ChunkEnd
+
+	@staticmethod
+	def ReadChunk(Buffer : mmap.mmap, Offset : int, ChunkSize : int, DecodedValueDict : Dict[bytes, str], ConvertRows : Callable[[List[CsvTransactionRow]], Any]) -> Tuple[Any, int]:
+
+		BufferSize = len(Buffer)
+
+		# Row boundaries are found on the mapped pages, a chunk always ends after a newline or at the end of the file
+		ChunkEnd = Buffer.find(b'\n', min(Offset + ChunkSize, BufferSize) - 1)
+
+		ChunkEnd = BufferSize if ChunkEnd == -1 else ChunkEnd + 1
+
+		return ConvertRows(MmapCsvReader.ParseRows(Buffer[Offset:ChunkEnd], DecodedValueDict, Offset)), ChunkEnd
+
+	@staticmethod
+	def ParseRows(Chunk : bytes, DecodedValueDict : Dict[bytes, str], ChunkOffset : int = 0) -> List[CsvTransactionRow]:
+
+		RowList : List[CsvTransactionRow] = []
+
+		RowOffset = ChunkOffset
+
+		for Line in Chunk.split(b'\n'):
+
+			LineOffset = RowOffset
+
+			# Newline included, the next row starts right after it
+			RowOffset += len(Line) + 1
+
+			FieldList = Line.split(b',')
+
+			if len(FieldList) < 5:
+
+				# Empty lines are skipped like in the other readers, anything else is a malformed row
+				if Line.strip():
+
+					raise CsvFileParsingException()
+
+				continue
+
+			try:
+
+				RowList.append \
+				(
+					(
+						datetime.fromisoformat(FieldList[0].strip().decode("ascii")),
+						MmapCsvReader.DecodeValue(FieldList[1], DecodedValueDict),
+						MmapCsvReader.DecodeValue(FieldList[2], DecodedValueDict),
+						# float and int accept bytes and ignore the surrounding whitespace, \r included
+						float(FieldList[3]),
+						int(FieldList[4]),
+						LineOffset
+					)
+				)
+
+			except (ValueError, UnicodeDecodeError) as e:
+
+				raise CsvFileParsingException()
+
+		return RowList
+
+	@staticmethod
+	def DecodeValue(RawValue : bytes, DecodedValueDict : Dict[bytes, str]) -> str:
+
+		Value = DecodedValueDict.get(RawValue)
+
+		if Value is None:
+
+			Value = RawValue.strip().decode("utf-8")
+
+			if len(DecodedValueDict) < MaxDecodedValueCount:
+
+				DecodedValueDict[RawValue] = Value
+
+		return Value
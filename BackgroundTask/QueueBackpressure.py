@@ -0,0 +1,94 @@
+
+import time
+import asyncio
+import logging
+
+from Monitoring.Metrics import PipelineMetrics
+from RedisHelper.TransactionQueue import TransactionQueue
+
+logger = logging.getLogger("uvicorn")
+
+class QueueBackpressure:
+
+	# Pauses the importer once the queue holds HighWatermark transactions, until the aggregators drain it to LowWatermark
+
+	def __init__(self, Queue : TransactionQueue, HighWatermark : int, LowWatermark : int, PollInterval : float, LagRefreshInterval : float = 1):
+
+		self.Queue = Queue
+		self.HighWatermark = HighWatermark
+		self.LowWatermark = min(LowWatermark, HighWatermark)
+		self.PollInterval = PollInterval
+		self.LagRefreshInterval = LagRefreshInterval
+
+		# Last measured queue depth, when it was measured, and transactions pushed since then
+		self.Depth = 0
+		self.MeasuredAt = float("-inf")
+		self.PushedCount = 0
+
+		# Shared by the files imported concurrently, one of them measures or waits for the drain while the others wait for it
+		self.Lock = asyncio.Lock()
+
+	def IsEnabled(self) -> bool:
+
+		return self.HighWatermark > 0
+
+	def IsMeasureDue(self, PushCount : int) -> bool:
+
+		# The depth is read once the pushes since the last read could have reached the high watermark,
+		# and every LagRefreshInterval seconds for importer_queue_lag, so a queue far below it costs one round trip per interval
+		IsNearHighWatermark = self.IsEnabled() and self.Depth + self.PushedCount + PushCount >= self.HighWatermark
+
+		return IsNearHighWatermark or time.monotonic() - self.MeasuredAt >= self.LagRefreshInterval
+
+	async def WaitForCapacity(self, PushCount : int):
+
+		if not self.Lock.locked() and not self.IsMeasureDue(PushCount):
+
+			self.PushedCount += PushCount
+
+			return
+
+		async with self.Lock:
+
+			# Checked again, a file that held the lock may have measured the depth or waited for the drain meanwhile
+			if self.IsMeasureDue(PushCount):
+
+				await self.MeasureDepth()
+
+			if self.IsEnabled() and self.Depth + self.PushedCount + PushCount >= self.HighWatermark:
+
+				await self.WaitForDrain()
+
+			self.PushedCount += PushCount
+
+	async def WaitForDrain(self):
+
+		logger.info(f"⚠️ Transaction queue depth {self.Depth} over the high watermark {self.HighWatermark}, importer paused.")
+
+		PipelineMetrics.ImporterPaused.Set(1)
+
+		StartTime = time.perf_counter()
+
+		while self.Depth > self.LowWatermark:
+
+			await asyncio.sleep(self.PollInterval)
+
+			await self.MeasureDepth()
+
+		PausedTime = time.perf_counter() - StartTime
+
+		PipelineMetrics.ImporterPaused.Set(0)
+
+		PipelineMetrics.ImporterPausedTime.Increment(PausedTime)
+
+		logger.info(f"✅ Transaction queue drained to {self.Depth} after {PausedTime:.2f}s, importer resumed.")
+
+	async def MeasureDepth(self):
+
+		self.Depth = await self.Queue.GetDepth()
+
+		self.MeasuredAt = time.monotonic()
+
+		self.PushedCount = 0
+
+		PipelineMetrics.ImporterQueueLag.Set(self.Depth)
@@ -0,0 +1,229 @@
+
+import time
+import signal
+import asyncio
+import logging
+import multiprocessing
+
+from typing import Callable, List, Optional
+from AppConfig import AppConfig
+from HelperMethods import GetStreamConsumerName, GetWorkerProcessName
+from multiprocessing.process import BaseProcess
+from BackgroundTask.DataImporter import DataImporter
+from BackgroundTask.DataAggregator import DataAggregator
+from RedisHelper.WorkerMetrics import WorkerMetrics
+from RedisHelper.TransactionQueue import CreateTransactionQueue
+from RedisHelper.AggregateBatchScript import AggregateBatchScript
+from RedisHelper.RedisPools import CreateWriterRedisClient, CreateConsumerRedisClient
+from BackgroundTask.CancellationToken import ProcessCancellationToken
+
+logger = logging.getLogger("uvicorn")
+
+def RunAggregatorWorkerProcess(AppConfig : AppConfig, ProcessIndex : int, CancellationToken : ProcessCancellationToken):
+
+	# Shutdown is driven by the API process through the cancellation token, not by Ctrl+C on the process group
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+	asyncio.run(AggregateInWorkerProcess(AppConfig, ProcessIndex, CancellationToken))
+
+def RunImporterWorkerProcess(AppConfig : AppConfig, ProcessIndex : int, CancellationToken : ProcessCancellationToken):
+
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+	asyncio.run(ImportInWorkerProcess(AppConfig))
+
+async def AggregateInWorkerProcess(AppConfig : AppConfig, ProcessIndex : int, CancellationToken : ProcessCancellationToken):
+
+	# Every worker process owns its event loop and Redis connection pools
+	WorkerRedis = CreateWriterRedisClient(AppConfig)
+
+	WorkerConsumerRedis = CreateConsumerRedisClient(AppConfig)
+
+	PublishMetricsTask = asyncio.create_task(WorkerMetrics.PublishPeriodically(WorkerRedis, GetWorkerProcessName(ProcessIndex), AppConfig.WorkerMetricsPublishInterval))
+
+	try:
+
+		# Script caches are per server, loading again from every process is harmless
+		await AggregateBatchScript.Load(WorkerRedis)
+
+		await asyncio.gather \
+		(
+			*[
+				DataAggregator.AggregateData \
+				(
+					WorkerRedis,
+					CreateTransactionQueue \
+					(
+						WorkerConsumerRedis,
+						AppConfig.QueueBackend,
+						AppConfig.RedisTransactionQueueKeyName,
+						AppConfig.StreamConsumerGroupName,
+						GetStreamConsumerName(WorkerIndex, ProcessIndex),
+						AppConfig.StreamPendingReclaimIdleTime
+					),
+					AppConfig.TransactionCkeckTimeout,
+					CancellationToken,
+					AppConfig.AggregatorBatchSize,
+					AppConfig.AggregatorBatchLingerTime,
+					AppConfig.QueueWireFormat,
+					AppConfig.AggregateAmountMode,
+					AppConfig.TransactionDedupTimeToLive
+				)
+				for WorkerIndex in range(AppConfig.AggregatorWorkerCount)
+			]
+		)
+
+	finally:
+
+		PublishMetricsTask.cancel()
+
+		await WorkerMetrics.Publish(WorkerRedis, GetWorkerProcessName(ProcessIndex))
+
+		await WorkerRedis.close()
+
+		await WorkerConsumerRedis.close()
+
+async def ImportInWorkerProcess(AppConfig : AppConfig):
+
+	WorkerRedis = CreateWriterRedisClient(AppConfig)
+
+	PublishMetricsTask = asyncio.create_task(WorkerMetrics.PublishPeriodically(WorkerRedis, GetWorkerProcessName(), AppConfig.WorkerMetricsPublishInterval))
+
+	try:
+
+		await AggregateBatchScript.Load(WorkerRedis)
+
+		await DataImporter.ImportData \
+		(
+			WorkerRedis,
+			AppConfig.CsvFilePath,
+			CreateTransactionQueue(WorkerRedis, AppConfig.QueueBackend, AppConfig.RedisTransactionQueueKeyName),
+			AppConfig.ImporterMode,
+			AppConfig.ImporterBulkBatchSize,
+			AppConfig.ImporterBulkChunkSize,
+			AppConfig.QueueWireFormat,
+			AppConfig.AggregateAmountMode,
+			AppConfig.ImporterQueueHighWatermark,
+			AppConfig.ImporterQueueLowWatermark,
+			AppConfig.ImporterBackpressurePollInterval,
+			AppConfig.ImporterFileConcurrency,
+			AppConfig.ImporterCheckpointsEnabled,
+			AppConfig.ImporterReaderBackend,
+			AppConfig.TransactionIdsEnabled,
+			AppConfig.ImporterQueueLagRefreshInterval
+		)
+
+	finally:
+
+		PublishMetricsTask.cancel()
+
+		# The importer exits once its files are imported, its last snapshot keeps the totals on /metrics
+		await WorkerMetrics.Publish(WorkerRedis, GetWorkerProcessName())
+
+		await WorkerRedis.close()
+
+class WorkerProcessPool:
+
+	def __init__(self, AppConfig : AppConfig):
+
+		# Spawned, not forked, a fork would copy the running uvicorn event loop and its open sockets
+		self.Context = multiprocessing.get_context("spawn")
+		self.AppConfig = AppConfig
+		self.CancellationToken = ProcessCancellationToken(self.Context)
+		self.AggregatorProcesses : List[BaseProcess] = []
+		self.ImporterProcess : Optional[BaseProcess] = None
+
+	def Start(self, RunImporter : bool):
+
+		self.AggregatorProcesses = \
+		[
+			self.StartProcess(RunAggregatorWorkerProcess, ProcessIndex)
+			for ProcessIndex in range(self.AppConfig.AggregatorProcessCount)
+		]
+
+		if RunImporter:
+
+			self.ImporterProcess = self.StartProcess(RunImporterWorkerProcess, 0)
+
+	def StartProcess(self, Target : Callable, ProcessIndex : int) -> BaseProcess:
+
+		WorkerProcess = self.Context.Process \
+		(
+			target = Target,
+			args = (self.AppConfig, ProcessIndex, self.CancellationToken),
+			name = f"{Target.__name__}-{ProcessIndex}",
+			daemon = True
+		)
+
+		WorkerProcess.start()
+
+		return WorkerProcess
+
+	def IsHealthy(self) -> bool:
+
+		# A dead aggregator process is restarted by Supervise, until then the queue is drained by fewer consumers
+		return (not self.CancellationToken.IsCancelled()) and all(WorkerProcess.is_alive() for WorkerProcess in self.AggregatorProcesses)
+
+	def GetAliveCount(self) -> int:
+
+		return sum(WorkerProcess.is_alive() for WorkerProcess in self.GetProcesses())
+
+	async def Supervise(self, HealthCheckInterval : float):
+
+		while (not self.CancellationToken.IsCancelled()):
+
+			for ProcessIndex, WorkerProcess in enumerate(self.AggregatorProcesses):
+
+				if WorkerProcess.is_alive() or self.CancellationToken.IsCancelled():
+
+					continue
+
+				logger.info(f"⚠️ {WorkerProcess.name} exited with code {WorkerProcess.exitcode}, restarting it.")
+
+				self.AggregatorProcesses[ProcessIndex] = self.StartProcess(RunAggregatorWorkerProcess, ProcessIndex)
+
+			# The importer runs once, a failed import is reported but not replayed
+			if self.ImporterProcess is not None and not self.ImporterProcess.is_alive():
+
+				if self.ImporterProcess.exitcode != 0:
+
+					logger.info(f"⚠️ {self.ImporterProcess.name} exited with code {self.ImporterProcess.exitcode}.")
+
+				self.ImporterProcess = None
+
+			await asyncio.sleep(HealthCheckInterval)
+
+	def GetProcesses(self) -> List[BaseProcess]:
+
+		return self.AggregatorProcesses + ([self.ImporterProcess] if self.ImporterProcess is not None else [])
+
+	async def Stop(self, Timeout : float):
+
+		self.CancellationToken.Cancel()
+
+		StopDeadline = time.monotonic() + Timeout
+
+		for WorkerProcess in self.GetProcesses():
+
+			# join blocks, it is moved out of the event loop
+			await asyncio.to_thread(WorkerProcess.join, max(StopDeadline - time.monotonic(), 0))
+
+			if WorkerProcess.is_alive():
+
+				WorkerProcess.terminate()
+
+				logger.info(f"⚠️ {WorkerProcess.name} did not stop in time and was terminated.")
+
+			else:
+
+				logger.info(f"✅ {WorkerProcess.name} Finished and shutdown completely.")
+
+	def Terminate(self):
+
+		self.CancellationToken.Cancel()
+
+		for WorkerProcess in self.GetProcesses():
+
+			if WorkerProcess.is_alive():
+
+				WorkerProcess.kill()
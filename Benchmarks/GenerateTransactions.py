@@ -0,0 +1,63 @@
+
+import csv
+import random
+import argparse
+
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+TransactionTypes = ["deposit", "withdrawal"]
+
+PaymentMethods = ["apple_pay", "crypto", "paypal", "visa", "wire", "mastercard", "bank_transfer", "skrill", "neteller", "paysafecard"]
+
+def GenerateTransactionsCsv(FilePath : str, Rows : int, Days : int, Methods : int, EndDate : Optional[date] = None, Seed : int = 42) -> List[str]:
+
+	# Same layout as transactions_1_month.csv, rows are shuffled across the day range like the sample file
+	Random = random.Random(Seed)
+
+	EndDate = EndDate or date.today()
+
+	StartDate = datetime.combine(EndDate - timedelta(days = Days - 1), datetime.min.time())
+
+	MethodList = (PaymentMethods * (Methods // len(PaymentMethods) + 1))[:Methods]
+
+	# Methods past the named list get a numbered suffix so every method is distinct
+	MethodList = [Method if Index < len(PaymentMethods) else f"{Method}_{Index}" for Index, Method in enumerate(MethodList)]
+
+	with open(FilePath, "w", newline = "") as CsvFile:
+
+		Writer = csv.writer(CsvFile)
+
+		Writer.writerow(["timestamp", "type", "payment_method", "amount", "sleep_ms"])
+
+		for _ in range(Rows):
+
+			Timestamp = StartDate + timedelta(seconds = Random.randrange(Days * 86400))
+
+			Writer.writerow \
+			(
+				[
+					Timestamp.strftime("%Y-%m-%dT%H:%M:%S"),
+					Random.choice(TransactionTypes),
+					Random.choice(MethodList),
+					f"{Random.uniform(5, 2000):.2f}",
+					Random.randint(5, 20)
+				]
+			)
+
+	return [(StartDate + timedelta(days = Offset)).strftime("%Y-%m-%d") for Offset in range(Days)]
+
+if __name__ == "__main__":
+
+	Parser = argparse.ArgumentParser(description = "Generate a synthetic transactions CSV in the format of transactions_1_month.csv")
+
+	Parser.add_argument("--output", default = "transactions_synthetic.csv")
+	Parser.add_argument("--rows", type = int, default = 100000)
+	Parser.add_argument("--days", type = int, default = 30)
+	Parser.add_argument("--methods", type = int, default = 5)
+	Parser.add_argument("--end-date", type = date.fromisoformat, default = None, help = "Last day of the generated range (YYYY-MM-DD), defaults to today")
+	Parser.add_argument("--seed", type = int, default = 42)
+
+	Arguments = Parser.parse_args()
+
+	GenerateTransactionsCsv(Arguments.output, Arguments.rows, Arguments.days, Arguments.methods, Arguments.end_date, Arguments.seed)
@@ -0,0 +1,308 @@
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+from typing import Dict, List
+
+# Only the settings /stats reads through GetAppConfig are needed, real values still win over these
+for SettingName, SettingValue in \
+{
+	"RedisHost" : "localhost", "RedisPort" : "6379", "RedisTransactionQueueKeyName" : "BenchmarkTransactionQueue", "CsvFilePath" : "",
+	"MongoDbUri" : "", "TransactionCkeckTimeout" : "0.05", "GracefulShutDownTimeout" : "1", "ForceShutDownTimeout" : "1",
+	"CutOffSeconds" : "0", "CutOffMinutes" : "0", "CutOffDays" : "7", "DumperTaskScheduleInterval" : "1"
+}.items():
+
+	os.environ.setdefault(SettingName, SettingValue)
+
+import httpx
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from redis.asyncio import Redis
+from Benchmarks import StandIns
+from Api.Router.StatsRouter import StatsRouter
+from Api.Services.StatsCache import StatsCache
+from BackgroundTask.DataDumper import DataDumper
+from BackgroundTask.DataImporter import DataImporter
+from BackgroundTask.DataAggregator import DataAggregator
+from Benchmarks.GenerateTransactions import GenerateTransactionsCsv
+from BackgroundTask.CancellationToken import CancellationToken
+from RedisHelper.TransactionQueue import TransactionQueue, CreateTransactionQueue
+from AppConfig import GetAppConfig, TransactionQueueBackend, TransactionWireFormat, AmountAccumulationMode, CsvReaderBackend
+from Db.Repositories.DailyAggregatesRepository import DailyAggregatesRepository
+from Models.DailyAggregate import DailyAggregate, DailyAggregateRecord
+from Api.Models.ApiDailyAggregateResponse import ApiDailyAggregateResponse
+
+async def BenchmarkIngest(FilePath : str, Queue : TransactionQueue, Rows : int, WireFormat : TransactionWireFormat, ReaderBackend : CsvReaderBackend) -> Dict[str, float]:
+
+	StartTime = time.perf_counter()
+
+	await DataImporter.BulkImportData(FilePath, Queue, 5000, 4194304, WireFormat, ReaderBackend = ReaderBackend)
+
+	ElapsedTime = time.perf_counter() - StartTime
+
+	return { "rows" : Rows, "seconds" : ElapsedTime, "events_per_sec" : Rows / ElapsedTime }
+
+async def GetQueueLength(BenchmarkRedis : Redis, Backend : TransactionQueueBackend, QueueKey : str) -> int:
+
+	if Backend == TransactionQueueBackend.Stream:
+
+		return await BenchmarkRedis.xlen(QueueKey)
+
+	return await BenchmarkRedis.llen(QueueKey)
+
+async def BenchmarkAggregate(BenchmarkRedis : Redis, Arguments : argparse.Namespace, Rows : int) -> Dict[str, float]:
+
+	Token = CancellationToken()
+
+	QueueKey = GetAppConfig().RedisTransactionQueueKeyName
+
+	StartTime = time.perf_counter()
+
+	WorkerTaskList = \
+	[
+		asyncio.create_task \
+		(
+			DataAggregator.AggregateData \
+			(
+				BenchmarkRedis,
+				CreateTransactionQueue(BenchmarkRedis, Arguments.queue_backend, QueueKey, "BenchmarkAggregators", f"benchmark-{WorkerIndex}", 30000),
+				GetAppConfig().TransactionCkeckTimeout,
+				Token,
+				Arguments.batch_size,
+				0,
+				Arguments.wire_format,
+				GetAppConfig().AggregateAmountMode
+			)
+		)
+		for WorkerIndex in range(Arguments.aggregator_workers)
+	]
+
+	# Stream entries are deleted once acknowledged, both backends are drained when the key is empty
+	while await GetQueueLength(BenchmarkRedis, Arguments.queue_backend, QueueKey) > 0:
+
+		await asyncio.sleep(0.01)
+
+	ElapsedTime = time.perf_counter() - StartTime
+
+	Token.Cancel()
+
+	await asyncio.gather(*WorkerTaskList)
+
+	return { "events" : Rows, "workers" : Arguments.aggregator_workers, "seconds" : ElapsedTime, "events_per_sec" : Rows / ElapsedTime }
+
+async def BenchmarkDump(BenchmarkRedis : Redis, DailyAggregatesRepo : DailyAggregatesRepository, LastDay : str) -> Dict[str, float]:
+
+	await DailyAggregatesRepo.Initialize()
+
+	KnownRedisKeySet = set()
+
+	StartTime = time.perf_counter()
+
+	AmountMode = GetAppConfig().AggregateAmountMode
+
+	FullDumpedCount = await DataDumper.DumpCycle(BenchmarkRedis, DailyAggregatesRepo, KnownRedisKeySet, FullScan = True, AmountMode = AmountMode)
+
+	FullCycleTime = time.perf_counter() - StartTime
+
+	# A steady state cycle after a single aggregate key changed
+	ChangedAmount = 100 if AmountMode == AmountAccumulationMode.Cents else 1.0
+
+	await DataAggregator.FlushAggregatedAmounts(BenchmarkRedis, { (f"agg:{LastDay}:deposits", "visa") : ChangedAmount }, AmountMode = AmountMode)
+
+	StartTime = time.perf_counter()
+
+	IncrementalDumpedCount = await DataDumper.DumpCycle(BenchmarkRedis, DailyAggregatesRepo, KnownRedisKeySet, AmountMode = AmountMode)
+
+	IncrementalCycleTime = time.perf_counter() - StartTime
+
+	return \
+	{
+		"full_cycle_seconds" : FullCycleTime,
+		"full_cycle_docs" : FullDumpedCount,
+		"incremental_cycle_seconds" : IncrementalCycleTime,
+		"incremental_cycle_docs" : IncrementalDumpedCount
+	}
+
+def GetLatencyPercentiles(LatencyList : List[float]) -> Dict[str, float]:
+
+	Percentiles = statistics.quantiles(LatencyList, n = 100, method = "inclusive")
+
+	return \
+	{
+		"requests" : len(LatencyList),
+		"p50_ms" : Percentiles[49] * 1000,
+		"p95_ms" : Percentiles[94] * 1000,
+		"p99_ms" : Percentiles[98] * 1000
+	}
+
+async def BenchmarkStats(BenchmarkRedis : Redis, BenchmarkMongoDb, DayList : List[str], Arguments : argparse.Namespace) -> Dict[str, Dict[str, float]]:
+
+	App = FastAPI()
+
+	App.include_router(StatsRouter)
+
+	App.state.Redis = BenchmarkRedis
+	App.state.MongoDb = BenchmarkMongoDb
+	App.state.StatsCache = StatsCache(100000, 3600, 600) if Arguments.stats_cache else None
+	App.state.HotDayCache = None
+	App.state.StatsRequestCoalescer = None
+
+	Random = random.Random(Arguments.seed)
+
+	Results = {}
+
+	async with httpx.AsyncClient(transport = httpx.ASGITransport(app = App), base_url = "http://benchmark") as Client:
+
+		for RangeWidth in Arguments.range_widths:
+
+			RangeWidth = min(RangeWidth, len(DayList))
+
+			LatencyList = []
+
+			for _ in range(Arguments.stats_requests):
+
+				StartIndex = Random.randrange(len(DayList) - RangeWidth + 1)
+
+				StartTime = time.perf_counter()
+
+				Response = await Client.get("/stats/", params = { "from_date" : DayList[StartIndex], "to_date" : DayList[StartIndex + RangeWidth - 1] })
+
+				LatencyList.append(time.perf_counter() - StartTime)
+
+				Response.raise_for_status()
+
+			Results[f"{RangeWidth}d"] = GetLatencyPercentiles(LatencyList)
+
+	return Results
+
+async def BenchmarkSerialization(BenchmarkMongoDb, DayList : List[str], Rounds : int) -> Dict[str, float]:
+
+	# CPU cost of turning the MongoDb documents of the widest range into the /stats body, the query itself is excluded
+	DocumentList = await DailyAggregatesRepository(BenchmarkMongoDb).GetRange(Filter = { "Date" : { "$gte" : DayList[0], "$lte" : DayList[-1] } })
+
+	def EncodeWithPydantic() -> bytes:
+
+		DailyAggregateList = [DailyAggregate.CreateFromDict(Document) for Document in DocumentList]
+
+		return JSONResponse(jsonable_encoder(ApiDailyAggregateResponse.MapFromDailyAggregateList(DailyAggregateList).model_dump())).body
+
+	def EncodeWithRecords() -> bytes:
+
+		DailyAggregateRecordList = [DailyAggregateRecord(Document["Date"], Document["Type"], Document["TotalAmount"]) for Document in DocumentList]
+
+		return ApiDailyAggregateResponse.EncodeFromDailyAggregateList(DailyAggregateRecordList)
+
+	Results = { "documents" : len(DocumentList), "rounds" : Rounds }
+
+	for PathName, Encode in (("pydantic", EncodeWithPydantic), ("fast_path", EncodeWithRecords)):
+
+		StartTime = time.perf_counter()
+
+		for _ in range(Rounds):
+
+			Encode()
+
+		Results[f"{PathName}_ms"] = (time.perf_counter() - StartTime) / Rounds * 1000
+
+	Results["speedup"] = Results["pydantic_ms"] / Results["fast_path_ms"]
+
+	return Results
+
+async def RunBenchmarks(Arguments : argparse.Namespace) -> dict:
+
+	BenchmarkRedis = await StandIns.BuildRedis(Arguments.redis_url)
+
+	BenchmarkMongoDb = await StandIns.BuildMongoDb(Arguments.mongodb_uri)
+
+	with tempfile.TemporaryDirectory() as TemporaryDirectory:
+
+		FilePath = os.path.join(TemporaryDirectory, "transactions_benchmark.csv")
+
+		DayList = GenerateTransactionsCsv(FilePath, Arguments.rows, Arguments.days, Arguments.methods, Seed = Arguments.seed)
+
+		Queue = CreateTransactionQueue(BenchmarkRedis, Arguments.queue_backend, GetAppConfig().RedisTransactionQueueKeyName)
+
+		IngestResult = await BenchmarkIngest(FilePath, Queue, Arguments.rows, Arguments.wire_format, Arguments.reader_backend)
+
+	AggregateResult = await BenchmarkAggregate(BenchmarkRedis, Arguments, Arguments.rows)
+
+	DumpResult = await BenchmarkDump(BenchmarkRedis, DailyAggregatesRepository(BenchmarkMongoDb), DayList[-1])
+
+	StatsResult = await BenchmarkStats(BenchmarkRedis, BenchmarkMongoDb, DayList, Arguments)
+
+	SerializationResult = await BenchmarkSerialization(BenchmarkMongoDb, DayList, Arguments.stats_requests)
+
+	await BenchmarkRedis.aclose()
+
+	return \
+	{
+		"parameters" : \
+		{
+			"rows" : Arguments.rows,
+			"days" : Arguments.days,
+			"methods" : Arguments.methods,
+			"queue_backend" : Arguments.queue_backend.value,
+			"wire_format" : Arguments.wire_format.value,
+			"reader_backend" : Arguments.reader_backend.value,
+			"amount_mode" : GetAppConfig().AggregateAmountMode.value,
+			"batch_size" : Arguments.batch_size,
+			"aggregator_workers" : Arguments.aggregator_workers,
+			"stats_cache" : Arguments.stats_cache,
+			"redis" : "fakeredis" if Arguments.redis_url is None else Arguments.redis_url,
+			"mongodb" : "mongomock" if Arguments.mongodb_uri is None else Arguments.mongodb_uri,
+			"cutoff_days" : GetAppConfig().CutOffDays,
+			"python" : sys.version.split()[0]
+		},
+		"ingest" : IngestResult,
+		"aggregate" : AggregateResult,
+		"dump" : DumpResult,
+		"stats" : StatsResult,
+		"serialization" : SerializationResult
+	}
+
+def ParseArguments() -> argparse.Namespace:
+
+	Parser = argparse.ArgumentParser(description = "Benchmark the ingest -> aggregate -> dump -> query pipeline")
+
+	Parser.add_argument("--rows", type = int, default = 100000)
+	Parser.add_argument("--days", type = int, default = 30)
+	Parser.add_argument("--methods", type = int, default = 5)
+	Parser.add_argument("--seed", type = int, default = 42)
+	Parser.add_argument("--queue-backend", type = TransactionQueueBackend, default = TransactionQueueBackend.List)
+	Parser.add_argument("--wire-format", type = TransactionWireFormat, default = TransactionWireFormat.Json)
+	Parser.add_argument("--reader-backend", type = CsvReaderBackend, default = CsvReaderBackend.Aiofiles)
+	Parser.add_argument("--batch-size", type = int, default = 500)
+	Parser.add_argument("--aggregator-workers", type = int, default = 1)
+	Parser.add_argument("--range-widths", type = lambda Value: [int(Width) for Width in Value.split(",")], default = [1, 7, 30])
+	Parser.add_argument("--stats-requests", type = int, default = 200)
+	Parser.add_argument("--stats-cache", action = "store_true", help = "Serve /stats with the historical result cache enabled")
+	Parser.add_argument("--redis-url", default = None, help = "Redis database reserved for benchmarks, it is flushed. Defaults to fakeredis")
+	Parser.add_argument("--mongodb-uri", default = None, help = f"MongoDb server, the {StandIns.BenchmarkMongoDbName} database is dropped. Defaults to mongomock")
+	Parser.add_argument("--output", default = None, help = "JSON result file, printed to stdout when omitted")
+
+	return Parser.parse_args()
+
+if __name__ == "__main__":
+
+	Arguments = ParseArguments()
+
+	Result = asyncio.run(RunBenchmarks(Arguments))
+
+	ResultJson = json.dumps(Result, indent = 2)
+
+	if Arguments.output:
+
+		with open(Arguments.output, "w") as OutputFile:
+
+			OutputFile.write(ResultJson)
+
+	print(ResultJson)
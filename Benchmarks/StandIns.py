@@ -0,0 +1,57 @@
+
+from typing import Optional
+from redis.asyncio import Redis
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorClient as MongoDbClient
+
+BenchmarkMongoDbName = "TransactionsBenchmarkDb"
+
+async def BuildRedis(RedisUrl : Optional[str]) -> Redis:
+
+	if RedisUrl is None:
+
+		import fakeredis.aioredis
+
+		return fakeredis.aioredis.FakeRedis()
+
+	BenchmarkRedis = Redis.from_url(RedisUrl)
+
+	# Benchmarks start from an empty database, RedisUrl must point to a database reserved for them
+	await BenchmarkRedis.flushdb()
+
+	return BenchmarkRedis
+
+async def BuildMongoDb(MongoDbUri : Optional[str]) -> AsyncIOMotorDatabase:
+
+	if MongoDbUri is None:
+
+		from mongomock_motor import AsyncMongoMockClient
+
+		PatchMongomockBulkUpdates()
+
+		return AsyncMongoMockClient()[BenchmarkMongoDbName]
+
+	BenchmarkMongoClient = MongoDbClient(MongoDbUri)
+
+	await BenchmarkMongoClient.drop_database(BenchmarkMongoDbName)
+
+	return BenchmarkMongoClient[BenchmarkMongoDbName]
+
+def PatchMongomockBulkUpdates():
+
+	# mongomock predates the sort option pymongo passes to bulk UpdateOne operations
+	import mongomock.collection
+
+	AddUpdate = mongomock.collection.BulkOperationBuilder.add_update
+
+	if getattr(AddUpdate, "IgnoresSort", False):
+
+		return
+
+	def AddUpdateIgnoringSort(self, *args, sort = None, **kwargs):
+
+		return AddUpdate(self, *args, **kwargs)
+
+	AddUpdateIgnoringSort.IgnoresSort = True
+
+	mongomock.collection.BulkOperationBuilder.add_update = AddUpdateIgnoringSort
@@ -0,0 +1,81 @@
+
+from typing import Dict
+from pymongo import monitoring
+
+class ConnectionPoolMonitor(monitoring.ConnectionPoolListener):
+
+	# Called by the driver on every check out and check in, counters only so the hot path stays cheap
+
+	def __init__(self):
+
+		self.Metrics = \
+		{
+			"CheckOuts" : 0,
+			"CheckOutFailures" : 0,
+			"CheckOutTimeouts" : 0,
+			"WaitTimeTotal" : 0.0,
+			"WaitTimeMax" : 0.0,
+			"InUse" : 0,
+			"Connections" : 0,
+			"PoolClears" : 0
+		}
+
+	def connection_checked_out(self, event : monitoring.ConnectionCheckedOutEvent):
+
+		# Duration covers the wait for a free connection plus the connection setup when the pool had to grow
+		self.Metrics["CheckOuts"] += 1
+
+		self.Metrics["InUse"] += 1
+
+		self.Metrics["WaitTimeTotal"] += event.duration
+
+		self.Metrics["WaitTimeMax"] = max(self.Metrics["WaitTimeMax"], event.duration)
+
+	def connection_check_out_failed(self, event : monitoring.ConnectionCheckOutFailedEvent):
+
+		self.Metrics["CheckOutFailures"] += 1
+
+		# Timeouts are the pool exhaustion signal, waitQueueTimeoutMS elapsed with every connection checked out
+		if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+
+			self.Metrics["CheckOutTimeouts"] += 1
+
+	def connection_checked_in(self, event : monitoring.ConnectionCheckedInEvent):
+
+		self.Metrics["InUse"] -= 1
+
+	def connection_created(self, event : monitoring.ConnectionCreatedEvent):
+
+		self.Metrics["Connections"] += 1
+
+	def connection_closed(self, event : monitoring.ConnectionClosedEvent):
+
+		self.Metrics["Connections"] -= 1
+
+	def pool_cleared(self, event : monitoring.PoolClearedEvent):
+
+		self.Metrics["PoolClears"] += 1
+
+	def connection_check_out_started(self, event : monitoring.ConnectionCheckOutStartedEvent):
+
+		pass
+
+	def connection_ready(self, event : monitoring.ConnectionReadyEvent):
+
+		pass
+
+	def pool_created(self, event : monitoring.PoolCreatedEvent):
+
+		pass
+
+	def pool_ready(self, event : monitoring.PoolReadyEvent):
+
+		pass
+
+	def pool_closed(self, event : monitoring.PoolClosedEvent):
+
+		pass
+
+	def GetMetrics(self) -> Dict[str, float]:
+
+		return dict(self.Metrics)
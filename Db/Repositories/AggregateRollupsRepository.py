@@ -0,0 +1,106 @@
+from bson import Int64
+from Db.Schema import MongoSchema
+from datetime import datetime, timezone
+from pymongo.operations import UpdateOne
+from pymongo.results import BulkWriteResult
+from typing import Dict, List, Any
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from Db.Repositories.BaseRepository import BaseRepository
+from Models.AggregateRollup import AggregateRollup, AggregateRollupDocumentKeyNames, StatsGranularity
+
+class AggregateRollupsRepository(BaseRepository[AggregateRollup]):
+
+	# Subclasses must override this together with CollectionConfig
+	Granularity : StatsGranularity = None
+
+	def __init__(self, Db : AsyncIOMotorDatabase):
+
+		super().__init__(Db)
+
+	async def BulkUpsertAggregateRollups(self, AggregateRollupList : List[AggregateRollup], Upsert : bool) -> BulkWriteResult:
+
+		Requests = \
+		[
+			UpdateOne \
+			(
+				filter = \
+				{
+					AggregateRollupDocumentKeyNames.PeriodStart.value : AggregateRollupItem.PeriodStart,
+					AggregateRollupDocumentKeyNames.Type.value: AggregateRollupItem.Type
+				},
+				update = AggregateRollupsRepository.GetUpsertUpdateDocument(AggregateRollupItem),
+				upsert = Upsert
+			)
+			for AggregateRollupItem in AggregateRollupList
+		]
+
+		return await self.BulkWrite(Requests, False)
+
+	@staticmethod
+	def GetUpsertUpdateDocument(AggregateRollupItem : AggregateRollup) -> Dict[str, Any]:
+
+		UpdateDocumentDict = \
+		{
+			"$set":
+			{
+				AggregateRollupDocumentKeyNames.PeriodEnd.value : AggregateRollupItem.PeriodEnd,
+				AggregateRollupDocumentKeyNames.TotalAmount.value : AggregateRollupItem.TotalAmount,
+				AggregateRollupDocumentKeyNames.DayCount.value : AggregateRollupItem.DayCount,
+				AggregateRollupDocumentKeyNames.LastUpdated.value : datetime.now(timezone.utc)
+			}
+		}
+
+		if AggregateRollupItem.TotalAmountCents is None:
+
+			UpdateDocumentDict["$unset"] = { AggregateRollupDocumentKeyNames.TotalAmountCents.value : "" }
+
+		else:
+
+			UpdateDocumentDict["$set"][AggregateRollupDocumentKeyNames.TotalAmountCents.value] = \
+			{
+				PaymentMethod : Int64(AmountCents)
+				for PaymentMethod, AmountCents in AggregateRollupItem.TotalAmountCents.items()
+			}
+
+		return UpdateDocumentDict
+
+	async def GetByPeriodStartRange(self, From : str, To : str) -> List[AggregateRollup]:
+
+		# Periods starting from From (inclusive) to To (exclusive)
+		ResultList = await self.GetRange \
+		(
+			Filter = \
+			{
+				AggregateRollupDocumentKeyNames.PeriodStart.value:
+				{
+					"$gte": From,
+					"$lt": To
+				}
+			}
+		)
+
+		return [AggregateRollup.CreateFromDict(Result) for Result in ResultList]
+
+class WeeklyAggregatesRepository(AggregateRollupsRepository):
+
+	CollectionConfig = MongoSchema.WeeklyAggregates
+
+	Granularity = StatsGranularity.Week
+
+class MonthlyAggregatesRepository(AggregateRollupsRepository):
+
+	CollectionConfig = MongoSchema.MonthlyAggregates
+
+	Granularity = StatsGranularity.Month
+
+def CreateAggregateRollupsRepository(Db : AsyncIOMotorDatabase, Granularity : StatsGranularity) -> AggregateRollupsRepository:
+
+	if Granularity == StatsGranularity.Week:
+
+		return WeeklyAggregatesRepository(Db)
+
+	if Granularity == StatsGranularity.Month:
+
+		return MonthlyAggregatesRepository(Db)
+
+	raise ValueError(f"No rollup collection for the {Granularity.value} granularity")
@@ -2,7 +2,7 @@
 from pydantic import BaseModel
 from Db.Schema import CollectionConfig
 from pymongo.results import BulkWriteResult
-from typing import Dict, List, Any, Optional, Generic, TypeVar
+from typing import AsyncIterator, Dict, List, Any, Optional, Generic, TypeVar
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
 
 DocumentType = TypeVar('DocumentType', bound = BaseModel)
@@ -61,6 +61,21 @@ class BaseRepository(Generic[DocumentType]):
 		
 		return await Cursor.to_list(length = None)
 
+	async def IterateRange(self, Filter: Dict[str, Any] = None, Projection: Optional[Dict[str, Any]] = None, Sort: Optional[List[tuple]] = None, BatchSize: int = 0) -> AsyncIterator[Dict[str, Any]]:
+		
+		# Same query as GetRange, documents are yielded one cursor batch at a time instead of being collected in a list
+		Filter = Filter or {}
+		Cursor = self.Collection.find(Filter, Projection)
+		
+		if Sort:
+			Cursor = Cursor.sort(Sort)
+		
+		if BatchSize > 0:
+			Cursor = Cursor.batch_size(BatchSize)
+		
+		async for Document in Cursor:
+			yield Document
+
 	async def Update(self, Filter: Dict[str, Any], UpdateDocumentDict: Dict[str, Any], Upsert: bool = False) -> bool:
 		
 		Result = await self.Collection.update_one(Filter, UpdateDocumentDict, upsert = Upsert)
@@ -95,6 +110,17 @@ class BaseRepository(Generic[DocumentType]):
 		
 		return await self.Collection.count_documents(Filter)
 
+	async def Aggregate(self, Pipeline: List[Dict[str, Any]], Hint: Optional[str] = None) -> List[Dict[str, Any]]:
+		
+		Options = {}
+		
+		if Hint:
+			Options['hint'] = Hint
+		
+		Cursor = self.Collection.aggregate(Pipeline, **Options)
+		
+		return await Cursor.to_list(length = None)
+
 	async def Distinct(self, Field: str, Filter: Dict[str, Any] = None) -> List[Any]:
 		
 		Filter = Filter or {}
@@ -1,13 +1,18 @@
 
-from bson import ObjectId
+from bson import ObjectId, Int64
 from Db.Schema import MongoSchema
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pymongo.operations import UpdateOne
 from pymongo.results import BulkWriteResult
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterator, Dict, List, Optional, Any
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from Db.Repositories.BaseRepository import BaseRepository
-from Models.DailyAggregate import DailyAggregate, DailyAggregateDocumentKeyNames
+from Models.DailyAggregate import DailyAggregate, DailyAggregateRecord, DailyAggregateDocumentKeyNames
+from Models.AggregateRollup import StatsGranularity, ParseDay
+from HelperMethods import GetDayDateFormat
+
+# Field holding the date bucket label in the documents returned by the totals pipelines
+TotalsBucketKeyName = "Bucket"
 
 class DailyAggregatesRepository(BaseRepository[DailyAggregate]):
 
@@ -48,14 +53,7 @@ class DailyAggregatesRepository(BaseRepository[DailyAggregate]):
 					DailyAggregateDocumentKeyNames.Date.value : DailyAggregate.Date,
 					DailyAggregateDocumentKeyNames.Type.value: DailyAggregate.Type
 				},
-				update = \
-				{
-					"$set":
-					{
-						DailyAggregateDocumentKeyNames.TotalAmount.value : DailyAggregate.TotalAmount,
-						DailyAggregateDocumentKeyNames.LastUpdated.value : datetime.now(timezone.utc)
-					}
-				},
+				update = DailyAggregatesRepository.GetUpsertUpdateDocument(DailyAggregate),
 				upsert = Upsert
 			)
 			for DailyAggregate in DailyAggregateList
@@ -63,6 +61,34 @@ class DailyAggregatesRepository(BaseRepository[DailyAggregate]):
 		
 		return await self.BulkWrite(Requests, False) 
 
+	@staticmethod
+	def GetUpsertUpdateDocument(DailyAggregate : DailyAggregate) -> Dict[str, Any]:
+
+		UpdateDocumentDict = \
+		{
+			"$set":
+			{
+				DailyAggregateDocumentKeyNames.TotalAmount.value : DailyAggregate.TotalAmount,
+				DailyAggregateDocumentKeyNames.LastUpdated.value : datetime.now(timezone.utc)
+			}
+		}
+
+		if DailyAggregate.TotalAmountCents is None:
+
+			# Aggregates accumulated as floats must not keep stale cents from an earlier Cents mode run
+			UpdateDocumentDict["$unset"] = { DailyAggregateDocumentKeyNames.TotalAmountCents.value : "" }
+
+		else:
+
+			# Stored as int64 so the exact sums survive any value range
+			UpdateDocumentDict["$set"][DailyAggregateDocumentKeyNames.TotalAmountCents.value] = \
+			{
+				PaymentMethod : Int64(AmountCents)
+				for PaymentMethod, AmountCents in DailyAggregate.TotalAmountCents.items()
+			}
+
+		return UpdateDocumentDict
+
 	async def GetDailyAggregate(self, Filter: Dict[str, Any], Projection: Optional[Dict[str, Any]] = None) -> Optional[DailyAggregate]:
 
 		Result = await self.Get(Filter = Filter, Projection = Projection)
@@ -120,6 +146,71 @@ class DailyAggregatesRepository(BaseRepository[DailyAggregate]):
 			Sort = [(DailyAggregateDocumentKeyNames.Date.value, 1), (DailyAggregateDocumentKeyNames.Type.value, 1)]
 		)
 
+	async def GetByDates(self, DayList : List[str]) -> List[DailyAggregate]:
+
+		return await self.GetDailyAggregateRange \
+		(
+			Filter = {DailyAggregateDocumentKeyNames.Date.value: {"$in": DayList}}
+		)
+
+	async def GetRecordsByDateRange(self, From : str, To : str) -> List[DailyAggregateRecord]:
+
+		# Same range as GetByDateRange without pydantic validation, only the fields of the Api response are fetched
+		ResultList = await self.GetRange \
+		(
+			Filter = \
+			{
+				DailyAggregateDocumentKeyNames.Date.value:
+				{
+					"$gte": From,
+					"$lt": To
+				}
+			},
+			Projection = \
+			{
+				DailyAggregateDocumentKeyNames.Id.value : 0,
+				DailyAggregateDocumentKeyNames.Date.value : 1,
+				DailyAggregateDocumentKeyNames.Type.value : 1,
+				DailyAggregateDocumentKeyNames.TotalAmount.value : 1
+			}
+		)
+
+		return \
+		[
+			DailyAggregateRecord \
+			(
+				Result[DailyAggregateDocumentKeyNames.Date.value],
+				Result[DailyAggregateDocumentKeyNames.Type.value],
+				Result[DailyAggregateDocumentKeyNames.TotalAmount.value]
+			)
+			for Result in ResultList
+		]
+
+	async def IterateByDateRange(self, From : str, To : str, BatchSize : int = 0) -> AsyncIterator[Dict[str, Any]]:
+
+		# Raw documents in (Date, Type) order for streaming, only the fields of the Api response are fetched
+		async for Document in self.IterateRange \
+		(
+			Filter = \
+			{
+				DailyAggregateDocumentKeyNames.Date.value:
+				{
+					"$gte": From,
+					"$lt": To
+				}
+			},
+			Projection = \
+			{
+				DailyAggregateDocumentKeyNames.Id.value : 0,
+				DailyAggregateDocumentKeyNames.Date.value : 1,
+				DailyAggregateDocumentKeyNames.Type.value : 1,
+				DailyAggregateDocumentKeyNames.TotalAmount.value : 1
+			},
+			Sort = [(DailyAggregateDocumentKeyNames.Date.value, 1), (DailyAggregateDocumentKeyNames.Type.value, 1)],
+			BatchSize = BatchSize
+		):
+			yield Document
+
 	async def DeleteBeforeDate(self, CutOffDate: str) -> int:
 		
 		DeletedCount = await self.DeleteRange(Filter = { DailyAggregateDocumentKeyNames.Date.value: {"$lt": CutOffDate} })
@@ -141,25 +232,112 @@ class DailyAggregatesRepository(BaseRepository[DailyAggregate]):
 		
 		return list(Document[DailyAggregateDocumentKeyNames.TotalAmount.value].keys())
 
-	async def GetTotalByPaymentMethod(self, PamentMethod: str, From: str, To: str, TransactionType: Optional[str] = None) -> float:
-		
+	async def GetTotalByPaymentMethod(self, PamentMethod: str, From: str, ToInclusive: str, TransactionType: Optional[str] = None) -> float:
+
+		# Unlike the other range methods its last day is included, the totals pipeline is run up to the next day
+		To = (ParseDay(ToInclusive) + timedelta(days = 1)).strftime(GetDayDateFormat())
+
+		return float((await self.GetTotalsByPaymentMethod(From, To, TransactionType)).get(PamentMethod, 0.0))
+
+	async def GetTotalsByDateBucket(self, From : str, To : str, Granularity : StatsGranularity, TransactionType : Optional[str] = None) -> List[Dict[str, Any]]:
+
+		# One { Bucket, Type, TotalAmount } document per date bucket and type for days from From (inclusive) to To (exclusive)
+		return await self.Aggregate \
+		(
+			Pipeline = DailyAggregatesRepository.BuildTotalsPipeline(From, To, TransactionType, DailyAggregatesRepository.GetDateBucketExpression(Granularity), GroupByType = True),
+			Hint = "idx_date_type"
+		)
+
+	async def GetTotalsByPaymentMethod(self, From : str, To : str, TransactionType : Optional[str] = None) -> Dict[str, float]:
+
+		# Payment method -> Summed amount across types for days from From (inclusive) to To (exclusive), in a single document
+		ResultList = await self.Aggregate \
+		(
+			Pipeline = DailyAggregatesRepository.BuildTotalsPipeline(From, To, TransactionType, { "$literal": StatsGranularity.Total.value }, GroupByType = False),
+			Hint = "idx_date_type"
+		)
+
+		return ResultList[0][DailyAggregateDocumentKeyNames.TotalAmount.value] if ResultList else {}
+
+	@staticmethod
+	def GetDateBucketExpression(Granularity : StatsGranularity) -> Any:
+
+		DateField = f"${DailyAggregateDocumentKeyNames.Date.value}"
+
+		if Granularity == StatsGranularity.Week:
+
+			# Labelled by the Monday of the week, same as the WeeklyAggregates rollups
+			return \
+			{
+				"$dateToString":
+				{
+					"format": "%Y-%m-%d",
+					"date": { "$dateTrunc": { "date": { "$dateFromString": { "dateString": DateField } }, "unit": "week", "startOfWeek": "monday" } }
+				}
+			}
+
+		if Granularity == StatsGranularity.Month:
+
+			return { "$concat": [{ "$substr": [DateField, 0, 7] }, "-01"] }
+
+		if Granularity == StatsGranularity.Total:
+
+			return { "$literal": StatsGranularity.Total.value }
+
+		return DateField
+
+	@staticmethod
+	def BuildTotalsPipeline(From : str, To : str, TransactionType : Optional[str], BucketExpression : Any, GroupByType : bool) -> List[Dict[str, Any]]:
+
 		FilterQuery = \
 		{
-			DailyAggregateDocumentKeyNames.Date.value: {"$gte": From, "$lte": To}
+			DailyAggregateDocumentKeyNames.Date.value: {"$gte": From, "$lt": To}
 		}
-		
+
 		if TransactionType:
+
 			FilterQuery[DailyAggregateDocumentKeyNames.Type.value] = TransactionType
-		
-		DocumentList = await self.GetRange(Filter = FilterQuery)
-		
-		Total = 0.0
 
-		for Document in DocumentList:
-			if PamentMethod in Document.get(DailyAggregateDocumentKeyNames.TotalAmount.value, {}):
-				Total += Document[DailyAggregateDocumentKeyNames.TotalAmount.value][PamentMethod]
-		
-		return Total
+		TypeExpression = f"${DailyAggregateDocumentKeyNames.Type.value}" if GroupByType else None
+
+		# TotalAmount maps are unwound into (method, amount) pairs, summed per bucket and folded back into one map
+		return \
+		[
+			{ "$match": FilterQuery },
+			{
+				"$project":
+				{
+					"_id": 0,
+					DailyAggregateDocumentKeyNames.Type.value: 1,
+					TotalsBucketKeyName: BucketExpression,
+					"Methods": { "$objectToArray": f"${DailyAggregateDocumentKeyNames.TotalAmount.value}" }
+				}
+			},
+			{ "$unwind": "$Methods" },
+			{
+				"$group":
+				{
+					"_id": { TotalsBucketKeyName: f"${TotalsBucketKeyName}", "Type": TypeExpression, "Method": "$Methods.k" },
+					"Total": { "$sum": "$Methods.v" }
+				}
+			},
+			{
+				"$group":
+				{
+					"_id": { TotalsBucketKeyName: f"$_id.{TotalsBucketKeyName}", "Type": "$_id.Type" },
+					"Methods": { "$push": { "k": "$_id.Method", "v": "$Total" } }
+				}
+			},
+			{
+				"$project":
+				{
+					"_id": 0,
+					TotalsBucketKeyName: f"$_id.{TotalsBucketKeyName}",
+					DailyAggregateDocumentKeyNames.Type.value: "$_id.Type",
+					DailyAggregateDocumentKeyNames.TotalAmount.value: { "$arrayToObject": "$Methods" }
+				}
+			}
+		]
 
 	async def IncrementForPaymentMethod(self, StringDate: str, TransactionType: str, PaymentMethod: str, Amount: float) -> bool:
 		
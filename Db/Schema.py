@@ -3,6 +3,7 @@ from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from Models.DailyAggregate import DailyAggregateDocumentKeyNames
+from Models.AggregateRollup import AggregateRollupDocumentKeyNames
 
 @dataclass
 class IndexConfig:
@@ -59,6 +60,82 @@ class CollectionConfig:
 			await collection.create_index(IndexKeys, **Options)
 			
 
+def CreateAggregateRollupCollectionConfig(Name : str, Description : str) -> CollectionConfig:
+
+	# Weekly and monthly rollups share one layout, a period is identified by its first day
+	return CollectionConfig \
+	(
+		Name = Name,
+		Description = Description,
+		Indices = \
+		[
+			IndexConfig \
+			(
+				Keys = [(AggregateRollupDocumentKeyNames.PeriodStart.value, 1), (AggregateRollupDocumentKeyNames.Type.value, 1)],
+				Name = "idx_periodstart_type",
+				Unique = True
+			),
+		],
+
+		Validator = \
+		{
+			"$jsonSchema":
+			{
+				"bsonType": "object",
+				"required": [AggregateRollupDocumentKeyNames.PeriodStart.value, AggregateRollupDocumentKeyNames.PeriodEnd.value, AggregateRollupDocumentKeyNames.Type.value, AggregateRollupDocumentKeyNames.TotalAmount.value],
+				"properties":
+				{
+					AggregateRollupDocumentKeyNames.PeriodStart.value:
+					{
+						"bsonType": "string",
+						"pattern": "^[0-9]{4}-[0-9]{2}-[0-9]{2}$",
+						"description": "First day of the period in YYYY-MM-DD format"
+					},
+					AggregateRollupDocumentKeyNames.PeriodEnd.value:
+					{
+						"bsonType": "string",
+						"pattern": "^[0-9]{4}-[0-9]{2}-[0-9]{2}$",
+						"description": "Day after the last day of the period in YYYY-MM-DD format"
+					},
+					AggregateRollupDocumentKeyNames.Type.value:
+					{
+						"bsonType": "string",
+						"enum": ["deposits", "withdrawals"],
+						"description": "Transaction type"
+					},
+					AggregateRollupDocumentKeyNames.TotalAmount.value:
+					{
+						"bsonType": "object",
+						"description": "Payment method -> sum mapping over the period",
+						"additionalProperties":
+						{
+							"bsonType": "double"
+						}
+					},
+					AggregateRollupDocumentKeyNames.TotalAmountCents.value:
+					{
+						"bsonType": "object",
+						"description": "Payment method -> exact sum in integer cents, only set when every day of the period has it",
+						"additionalProperties":
+						{
+							"bsonType": ["long", "int"]
+						}
+					},
+					AggregateRollupDocumentKeyNames.DayCount.value:
+					{
+						"bsonType": "int",
+						"description": "Number of daily documents summed into the rollup"
+					},
+					AggregateRollupDocumentKeyNames.LastUpdated.value:
+					{
+						"bsonType": "date",
+						"description": "When this rollup was last rebuilt"
+					}
+				}
+			}
+		}
+	)
+
 class MongoSchema:
 
 	DailyAggregates = CollectionConfig \
@@ -121,6 +198,15 @@ class MongoSchema:
 							"bsonType": "double"
 						}
 					},
+					DailyAggregateDocumentKeyNames.TotalAmountCents.value:
+					{
+						"bsonType": "object",
+						"description": "Payment method -> exact sum in integer cents, only set by the Cents accumulation mode",
+						"additionalProperties":
+						{
+							"bsonType": ["long", "int"]
+						}
+					},
 					DailyAggregateDocumentKeyNames.LastUpdated.value:
 					{
 						"bsonType": "date",
@@ -130,6 +216,10 @@ class MongoSchema:
 			}
 		}
 	)
+
+	WeeklyAggregates = CreateAggregateRollupCollectionConfig("WeeklyAggregates", "Weekly (Monday to Sunday) rollups of the daily aggregates")
+
+	MonthlyAggregates = CreateAggregateRollupCollectionConfig("MonthlyAggregates", "Monthly rollups of the daily aggregates")
     
 
 async def InitializeSchema(Db: AsyncIOMotorDatabase):
@@ -137,6 +227,8 @@ async def InitializeSchema(Db: AsyncIOMotorDatabase):
 	CollectionConfigs = \
 	[
 		MongoSchema.DailyAggregates,
+		MongoSchema.WeeklyAggregates,
+		MongoSchema.MonthlyAggregates,
 	]
 
 	for Config in CollectionConfigs:
@@ -1,17 +1,101 @@
 
-from typing import Optional
+import socket
+
+from typing import List, Optional
 from fastapi import Request
+from datetime import datetime, timedelta, date, time, timezone
 
 # Simple method to unify the redis key design usage
 def GetRedisKeyDesign(Day : str, TransactionType : str) -> str:
 
 	return f"agg:{Day}:{TransactionType}s"
 
+# Set of aggregate keys written since the last dump, kept outside the agg:* key space
+def GetRedisDirtyAggregateKeysSetName() -> str:
+
+	return "dirty:agg"
+
+# Dirty keys taken over by the dumper, kept until the dump is persisted in MongoDb
+def GetRedisDumpingAggregateKeysSetName() -> str:
+
+	return "dirty:agg:dumping"
+
+# Byte offset checkpoints of the imported CSV files, file path -> offset of the next row to import
+def GetRedisImportCheckpointsHashName() -> str:
+
+	return "import:checkpoints"
+
+# Ids of the transactions of a day already aggregated, expired a while after the day was last written
+def GetRedisDedupSetName(Day : str) -> str:
+
+	return f"dedup:{Day}"
+
+# Aggregate key -> Epoch milliseconds of its last increment, kept outside the agg:* key space
+def GetRedisAggregateLastModifiedHashName() -> str:
+
+	return "aggmeta:lastmodified"
+
+# Aggregate keys written for a day, read instead of scanning the agg:* key space
+def GetRedisDayAggregateKeysSetName(Day : str) -> str:
+
+	return f"aggidx:{Day}"
+
+# Aggregate keys deleted by the dumper retention once persisted in MongoDb, restored from MongoDb when written again
+def GetRedisRetiredAggregateKeysSetName() -> str:
+
+	return "retired:agg"
+
+# Pub/sub channel of the days written by the aggregators, one comma separated message per flushed batch
+def GetRedisAggregateUpdatesChannelName() -> str:
+
+	return "updates:agg"
+
+# Pub/sub channel of the days upserted in MongoDb by the dumper, one comma separated message per dump cycle
+def GetRedisDumpedDaysChannelName() -> str:
+
+	return "updates:dumped"
+
+# Stream consumer of an aggregator worker, stable across restarts so a restarted process takes its consumer over instead of leaving a dead one in the group
+def GetStreamConsumerName(WorkerIndex : int, ProcessIndex : Optional[int] = None) -> str:
+
+	ProcessName = "api" if ProcessIndex is None else f"p{ProcessIndex}"
+
+	return f"{socket.gethostname()}-{ProcessName}-{WorkerIndex}"
+
+# Worker process of the WorkerProcessPool, stable across restarts, names its metrics snapshot and labels its samples on /metrics
+def GetWorkerProcessName(ProcessIndex : Optional[int] = None) -> str:
+
+	ProcessName = "importer" if ProcessIndex is None else f"p{ProcessIndex}"
+
+	return f"{socket.gethostname()}-{ProcessName}"
+
+# Recorded metrics last published by a worker process
+def GetRedisWorkerMetricsKeyName(ProcessName : str) -> str:
+
+	return f"metrics:{ProcessName}"
+
+# Transaction types of the CSV files, a day has at most one aggregate key per type
+def GetTransactionTypes() -> List[str]:
+
+	return ["deposit", "withdrawal"]
+
+# Minor units per currency unit used by the Cents accumulation mode
+def GetAmountMinorUnitScale() -> int:
+
+	return 100
+
 # Simple method to unify the day date format
 def GetDayDateFormat():
 
 	return '%Y-%m-%d'
 
+# Start of the window of /stats served from Redis, days before it are read from MongoDb
+def CalculateCutOffDate(CutOff : timedelta) -> datetime:
+
+	NowDate = datetime.combine(date.today(), time.min, tzinfo = timezone.utc)
+
+	return NowDate - CutOff
+
 def GetRedisKeyDesignPattern(*, Day : Optional[str] = None, TransactionType : Optional[str] = None) -> str:
 
 	DayString = Day if Day else "*"
@@ -26,4 +110,16 @@ def GetRedis(Apirequest : Request):
 
 def GetMongoDb(Apirequest : Request):
 
-	return Apirequest.app.state.MongoDb
\ No newline at end of file
+	return Apirequest.app.state.MongoDb
+
+def GetStatsCache(Apirequest : Request):
+
+	return Apirequest.app.state.StatsCache
+
+def GetHotDayCache(Apirequest : Request):
+
+	return Apirequest.app.state.HotDayCache
+
+def GetStatsRequestCoalescer(Apirequest : Request):
+
+	return Apirequest.app.state.StatsRequestCoalescer
\ No newline at end of file
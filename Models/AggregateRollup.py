@@ -0,0 +1,131 @@
+
+from enum import Enum
+from pydantic import BaseModel
+from datetime import date, datetime, timedelta
+from HelperMethods import GetDayDateFormat, GetAmountMinorUnitScale
+from typing import Dict, List, Optional, Self, Set
+from Models.DailyAggregate import DailyAggregate
+
+class StatsGranularity(str, Enum):
+
+	Day = "day"
+	Week = "week"
+	Month = "month"
+	Total = "total"
+
+class StatsBreakdown(str, Enum):
+
+	Type = "type"
+	PaymentMethod = "payment_method"
+
+class AggregateRollup(BaseModel):
+
+	PeriodStart: str
+	PeriodEnd: str
+	Type: str
+	TotalAmount: Dict[str, float]
+	TotalAmountCents: Optional[Dict[str, int]] = None
+	DayCount: int
+	LastUpdated : datetime | None = None
+
+	def CreateFromDict(Dict : dict) -> Self:
+
+		return AggregateRollup(**Dict)
+
+class AggregateRollupDocumentKeyNames(Enum):
+
+	Id = "_id"
+	PeriodStart = "PeriodStart"
+	PeriodEnd = "PeriodEnd"
+	Type = "Type"
+	TotalAmount = "TotalAmount"
+	TotalAmountCents = "TotalAmountCents"
+	DayCount = "DayCount"
+	LastUpdated = "LastUpdated"
+
+def ParseDay(StringDate : str) -> date:
+
+	return datetime.strptime(StringDate, GetDayDateFormat()).date()
+
+# Weeks start on Monday, months on their first day
+def GetPeriodStart(Day : date, Granularity : StatsGranularity) -> date:
+
+	if Granularity == StatsGranularity.Week:
+
+		return Day - timedelta(days = Day.weekday())
+
+	if Granularity == StatsGranularity.Month:
+
+		return Day.replace(day = 1)
+
+	return Day
+
+# Exclusive end of the period starting at PeriodStart
+def GetPeriodEnd(PeriodStart : date, Granularity : StatsGranularity) -> date:
+
+	if Granularity == StatsGranularity.Week:
+
+		return PeriodStart + timedelta(days = 7)
+
+	if Granularity == StatsGranularity.Month:
+
+		return (PeriodStart.replace(day = 28) + timedelta(days = 4)).replace(day = 1)
+
+	return PeriodStart + timedelta(days = 1)
+
+def BuildAggregateRollups(DailyAggregateList : List[DailyAggregate], Granularity : StatsGranularity, PeriodStartSet : Set[date]) -> List[AggregateRollup]:
+
+	# (PeriodStart, Type) -> Rollup, only for the requested periods so callers can pass a wider day range
+	AggregateRollupDict : Dict[tuple, AggregateRollup] = {}
+
+	for DailyAggregateItem in DailyAggregateList:
+
+		PeriodStart = GetPeriodStart(ParseDay(DailyAggregateItem.Date), Granularity)
+
+		if PeriodStart not in PeriodStartSet:
+
+			continue
+
+		AggregateRollupItem = AggregateRollupDict.get((PeriodStart, DailyAggregateItem.Type))
+
+		if AggregateRollupItem is None:
+
+			AggregateRollupItem = AggregateRollupDict[(PeriodStart, DailyAggregateItem.Type)] = AggregateRollup \
+			(
+				PeriodStart = PeriodStart.strftime(GetDayDateFormat()),
+				PeriodEnd = GetPeriodEnd(PeriodStart, Granularity).strftime(GetDayDateFormat()),
+				Type = DailyAggregateItem.Type,
+				TotalAmount = {},
+				TotalAmountCents = {},
+				DayCount = 0
+			)
+
+		for PaymentMethod, Amount in DailyAggregateItem.TotalAmount.items():
+
+			AggregateRollupItem.TotalAmount[PaymentMethod] = AggregateRollupItem.TotalAmount.get(PaymentMethod, 0.0) + Amount
+
+		# Exact cents are only kept while every day of the period has them
+		if AggregateRollupItem.TotalAmountCents is not None and DailyAggregateItem.TotalAmountCents is not None:
+
+			for PaymentMethod, AmountCents in DailyAggregateItem.TotalAmountCents.items():
+
+				AggregateRollupItem.TotalAmountCents[PaymentMethod] = AggregateRollupItem.TotalAmountCents.get(PaymentMethod, 0) + AmountCents
+
+		else:
+
+			AggregateRollupItem.TotalAmountCents = None
+
+		AggregateRollupItem.DayCount += 1
+
+	for AggregateRollupItem in AggregateRollupDict.values():
+
+		if AggregateRollupItem.TotalAmountCents is not None:
+
+			# Decimal sums of exact cents do not carry the drift of summed floats
+			AggregateRollupItem.TotalAmount = \
+			{
+				PaymentMethod : AmountCents / GetAmountMinorUnitScale()
+				for PaymentMethod, AmountCents in AggregateRollupItem.TotalAmountCents.items()
+			}
+
+	return list(AggregateRollupDict.values())
@@ -1,7 +1,7 @@
 
 from enum import Enum
 from bson import ObjectId
-from typing import Dict, Self
+from typing import Dict, NamedTuple, Optional, Self
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -11,6 +11,7 @@ class RedisDailyAggregate(BaseModel):
 	Date: str
 	Type: str
 	TotalAmount: Dict[str, float]
+	TotalAmountCents: Optional[Dict[str, int]] = None
 
 	def CreateFromDict(Dict : dict) -> Self:
 
@@ -24,10 +25,18 @@ class DailyAggregate(RedisDailyAggregate):
 
 		return DailyAggregate(**Dict)
 
+class DailyAggregateRecord(NamedTuple):
+
+	# Unvalidated read record of the /stats hot path, built from trusted MongoDb and Redis data
+	Date: str
+	Type: str
+	TotalAmount: Dict[str, float]
+
 class DailyAggregateDocumentKeyNames(Enum):
     
 	Id = "_id"
 	Date = "Date"
 	Type = "Type"
 	TotalAmount = "TotalAmount"
+	TotalAmountCents = "TotalAmountCents"
 	LastUpdated = "LastUpdated"
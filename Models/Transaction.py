@@ -1,5 +1,5 @@
 
-from typing import Self
+from typing import Self, Optional
 from datetime import datetime
 from pydantic import BaseModel
 from Exceptions.Exceptions import CsvFileParsingException
@@ -10,6 +10,8 @@ class Transaction(BaseModel):
 	Type : str
 	PaymentMethod : str
 	Amount : float
+	# Deterministic id of the imported row, duplicates of an id are aggregated once
+	Id : Optional[str] = None
 
 	@classmethod
 	def CreateFromStringList(self, StringList : list[str]) -> tuple[Self, int]:
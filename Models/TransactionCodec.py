@@ -0,0 +1,179 @@
+
+import os
+import orjson
+import struct
+import hashlib
+import calendar
+
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timedelta
+from AppConfig import TransactionWireFormat
+from Models.Transaction import Transaction
+from HelperMethods import GetDayDateFormat
+from Exceptions.Exceptions import CsvFileParsingException
+
+# Interned codes of the compact wire format, append only so queued payloads stay decodable
+TransactionTypeCodes = ("deposit", "withdrawal")
+PaymentMethodCodes = ("apple_pay", "crypto", "paypal", "visa", "wire")
+
+# Code used for values missing from the tables above, the raw value is appended to the payload
+UnknownValueCode = 255
+
+TransactionTypeCodeDict = { TransactionType : Code for Code, TransactionType in enumerate(TransactionTypeCodes) }
+PaymentMethodCodeDict = { PaymentMethod : Code for Code, PaymentMethod in enumerate(PaymentMethodCodes) }
+
+# Wall clock epoch seconds, type code, payment method code, amount
+CompactTransactionStruct = struct.Struct("<qBBd")
+
+# Length prefix of appended values: one byte below this marker, else the marker followed by a two byte length,
+# payloads queued with the one byte prefix only stay decodable
+LongValueLengthMarker = 255
+
+LongValueLengthStruct = struct.Struct("<H")
+
+EpochDate = datetime(1970, 1, 1)
+
+# Leading bytes of a CSV file read for its transaction id prefix, header and first row are hashed
+TransactionIdPrefixBlockSize = 4096
+
+# Day index since epoch -> Day string, a queue only ever spans a handful of days
+DayStringCache : Dict[int, str] = {}
+
+# Decoded transaction: (Day, Type, PaymentMethod, Amount, Id), Id is None for payloads pushed without one
+DecodedTransaction = Tuple[str, str, str, float, Optional[str]]
+
+def CreateTransactionIdPrefix(FilePath : str) -> str:
+
+	# Ids are the file prefix followed by the byte offset of the row, a replayed row gets the same id again.
+	# The prefix hashes the file identity, not only its path: appending rows keeps it, a file replaced or rewritten at the same path gets new ids.
+	FileStat = os.stat(FilePath)
+
+	with open(FilePath, "rb") as File:
+
+		FirstBlock = File.read(TransactionIdPrefixBlockSize)
+
+	FileHash = hashlib.blake2b(os.path.abspath(FilePath).encode('utf-8'), digest_size = 8)
+
+	FileHash.update(f"{FileStat.st_dev}:{FileStat.st_ino}:".encode('utf-8'))
+
+	# Header and first row only, the rest of the block changes when rows are appended to a small file
+	FileHash.update(b"\n".join(FirstBlock.split(b"\n", 2)[:2]))
+
+	return FileHash.hexdigest() + ":"
+
+def EncodeTransaction(TransactionModel : Transaction, WireFormat : TransactionWireFormat, TransactionId : Optional[str] = None) -> bytes | str:
+
+	if WireFormat == TransactionWireFormat.Json and TransactionId is None:
+
+		return TransactionModel.model_dump_json(exclude_none = True)
+
+	return EncodeTransactionFields(TransactionModel.Timestamp, TransactionModel.Type, TransactionModel.PaymentMethod, TransactionModel.Amount, WireFormat, TransactionId)
+
+def EncodeTransactionFields(Timestamp : datetime, TransactionType : str, PaymentMethod : str, Amount : float, WireFormat : TransactionWireFormat, TransactionId : Optional[str] = None) -> bytes | str:
+
+	# Rows parsed without a Transaction model, e.g. by the memory-mapped reader
+	if WireFormat == TransactionWireFormat.Json:
+
+		# Same document as Transaction.model_dump_json(exclude_none = True), validated by the consumer
+		Document = { "Timestamp" : Timestamp, "Type" : TransactionType, "PaymentMethod" : PaymentMethod, "Amount" : Amount }
+
+		if TransactionId is not None:
+
+			Document["Id"] = TransactionId
+
+		return orjson.dumps(Document)
+
+	TypeCode = TransactionTypeCodeDict.get(TransactionType, UnknownValueCode)
+
+	MethodCode = PaymentMethodCodeDict.get(PaymentMethod, UnknownValueCode)
+
+	# timetuple ignores tzinfo, the day must stay the wall clock day used by the Json format
+	Payload = CompactTransactionStruct.pack(calendar.timegm(Timestamp.timetuple()), TypeCode, MethodCode, Amount)
+
+	if TypeCode == UnknownValueCode:
+
+		Payload += EncodeUnknownValue(TransactionType)
+
+	if MethodCode == UnknownValueCode:
+
+		Payload += EncodeUnknownValue(PaymentMethod)
+
+	if TransactionId is not None:
+
+		# Trailing length prefixed id, payloads without one simply end after the fields
+		Payload += EncodeUnknownValue(TransactionId)
+
+	return Payload
+
+def DecodeTransaction(Payload : bytes, WireFormat : TransactionWireFormat) -> DecodedTransaction:
+
+	if WireFormat == TransactionWireFormat.Json:
+
+		TransactionModel : Transaction = Transaction.model_validate_json(Payload)
+
+		return TransactionModel.Timestamp.strftime(GetDayDateFormat()), TransactionModel.Type, TransactionModel.PaymentMethod, float(TransactionModel.Amount), TransactionModel.Id
+
+	# Fast path, no pydantic validation for payloads produced by EncodeTransaction
+	EpochSeconds, TypeCode, MethodCode, Amount = CompactTransactionStruct.unpack_from(Payload)
+
+	Offset = CompactTransactionStruct.size
+
+	if TypeCode == UnknownValueCode:
+
+		TransactionType, Offset = DecodeUnknownValue(Payload, Offset)
+
+	else:
+
+		TransactionType = TransactionTypeCodes[TypeCode]
+
+	if MethodCode == UnknownValueCode:
+
+		PaymentMethod, Offset = DecodeUnknownValue(Payload, Offset)
+
+	else:
+
+		PaymentMethod = PaymentMethodCodes[MethodCode]
+
+	TransactionId = None
+
+	if Offset < len(Payload):
+
+		TransactionId, Offset = DecodeUnknownValue(Payload, Offset)
+
+	DayIndex = EpochSeconds // 86400
+
+	Day = DayStringCache.get(DayIndex)
+
+	if Day is None:
+
+		Day = DayStringCache[DayIndex] = (EpochDate + timedelta(days = DayIndex)).strftime(GetDayDateFormat())
+
+	return Day, TransactionType, PaymentMethod, Amount, TransactionId
+
+def EncodeUnknownValue(Value : str) -> bytes:
+
+	EncodedValue = Value.encode('utf-8')
+
+	if len(EncodedValue) < LongValueLengthMarker:
+
+		return bytes([len(EncodedValue)]) + EncodedValue
+
+	if len(EncodedValue) > 0xFFFF:
+
+		raise CsvFileParsingException(f"Value of {len(EncodedValue)} bytes exceeds the 65535 bytes of the compact wire format")
+
+	return bytes([LongValueLengthMarker]) + LongValueLengthStruct.pack(len(EncodedValue)) + EncodedValue
+
+def DecodeUnknownValue(Payload : bytes, Offset : int) -> Tuple[str, int]:
+
+	ValueLength = Payload[Offset]
+
+	Offset += 1
+
+	if ValueLength == LongValueLengthMarker:
+
+		ValueLength, = LongValueLengthStruct.unpack_from(Payload, Offset)
+
+		Offset += LongValueLengthStruct.size
+
+	return Payload[Offset : Offset + ValueLength].decode('utf-8'), Offset + ValueLength
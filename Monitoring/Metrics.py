@@ -0,0 +1,225 @@
+
+import time
+
+from bisect import bisect_left
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterable, List, Optional, Tuple
+
+# Label values of a metric sample, in the order of its label names
+LabelValueTuple = Tuple[str, ...]
+
+# Metric name -> [[Label values, Value], ...], the recorded samples of a worker process as published to Redis
+MetricsSnapshotDict = Dict[str, List[List[Any]]]
+
+DefaultLatencyBuckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def FormatLabels(LabelNames : Tuple[str, ...], LabelValues : LabelValueTuple, ExtraLabel : str = "") -> str:
+
+	LabelList = [f'{LabelName}="{LabelValue}"' for LabelName, LabelValue in zip(LabelNames, LabelValues)]
+
+	if ExtraLabel:
+
+		LabelList.append(ExtraLabel)
+
+	return "{" + ",".join(LabelList) + "}" if LabelList else ""
+
+class Metric:
+
+	# Samples live in plain dicts keyed by label values, recording is a dict update on the event loop thread
+
+	Type = "untyped"
+
+	def __init__(self, Name : str, Description : str, LabelNames : Tuple[str, ...] = ()):
+
+		self.Name = Name
+		self.Description = Description
+		self.LabelNames = LabelNames
+
+		self.Values : Dict[LabelValueTuple, Any] = {}
+
+	def RenderSamples(self, Values : Dict[LabelValueTuple, Any], LabelNames : Tuple[str, ...]) -> List[str]:
+
+		raise NotImplementedError()
+
+	def Render(self, ProcessSnapshots : Optional[Dict[str, MetricsSnapshotDict]] = None) -> List[str]:
+
+		LineList = [f"# HELP {self.Name} {self.Description}", f"# TYPE {self.Name} {self.Type}", *self.RenderSamples(self.Values, self.LabelNames)]
+
+		# Samples of the worker processes are rendered as is with a process label, summing them is left to the queries
+		for ProcessName, Snapshot in (ProcessSnapshots or {}).items():
+
+			ProcessValues = {(*LabelValues, ProcessName) : Value for LabelValues, Value in Snapshot.get(self.Name, [])}
+
+			LineList.extend(self.RenderSamples(ProcessValues, (*self.LabelNames, "process")))
+
+		return LineList
+
+	def Snapshot(self) -> List[List[Any]]:
+
+		return [[list(LabelValues), Value] for LabelValues, Value in self.Values.items()]
+
+class Counter(Metric):
+
+	Type = "counter"
+
+	def Increment(self, Amount : float = 1, LabelValues : LabelValueTuple = ()):
+
+		self.Values[LabelValues] = self.Values.get(LabelValues, 0) + Amount
+
+	def RenderSamples(self, Values : Dict[LabelValueTuple, Any], LabelNames : Tuple[str, ...]) -> List[str]:
+
+		return [f"{self.Name}{FormatLabels(LabelNames, LabelValues)} {Value}" for LabelValues, Value in Values.items()]
+
+class Gauge(Counter):
+
+	Type = "gauge"
+
+	def Set(self, Value : float, LabelValues : LabelValueTuple = ()):
+
+		self.Values[LabelValues] = Value
+
+class Histogram(Metric):
+
+	Type = "histogram"
+
+	def __init__(self, Name : str, Description : str, LabelNames : Tuple[str, ...] = (), Buckets : Iterable[float] = DefaultLatencyBuckets):
+
+		super().__init__(Name, Description, LabelNames)
+
+		self.Buckets = tuple(sorted(Buckets))
+
+		# Label values -> [Per bucket counts (last one is +Inf), Sum, Count], made cumulative only when rendered
+
+	def Observe(self, Value : float, LabelValues : LabelValueTuple = (), Count : int = 1):
+
+		# Count records the same value several times at once, e.g. the per-event share of a batch
+		Sample = self.Values.get(LabelValues)
+
+		if Sample is None:
+
+			Sample = self.Values[LabelValues] = [[0] * (len(self.Buckets) + 1), 0.0, 0]
+
+		Sample[0][bisect_left(self.Buckets, Value)] += Count
+
+		Sample[1] += Value * Count
+
+		Sample[2] += Count
+
+	def RenderSamples(self, Values : Dict[LabelValueTuple, Any], LabelNames : Tuple[str, ...]) -> List[str]:
+
+		SampleLineList = []
+
+		for LabelValues, (BucketCountList, SampleSum, SampleCount) in Values.items():
+
+			CumulativeCount = 0
+
+			for UpperBound, BucketCount in zip((*self.Buckets, "+Inf"), BucketCountList):
+
+				CumulativeCount += BucketCount
+
+				BucketLabel = f'le="{UpperBound}"'
+
+				SampleLineList.append(f"{self.Name}_bucket{FormatLabels(LabelNames, LabelValues, BucketLabel)} {CumulativeCount}")
+
+			SampleLineList.append(f"{self.Name}_sum{FormatLabels(LabelNames, LabelValues)} {SampleSum}")
+
+			SampleLineList.append(f"{self.Name}_count{FormatLabels(LabelNames, LabelValues)} {SampleCount}")
+
+		return SampleLineList
+
+class MetricsRegistry:
+
+	def __init__(self):
+
+		self.MetricList : List[Metric] = []
+
+	def Register(self, MetricItem : Metric) -> Metric:
+
+		self.MetricList.append(MetricItem)
+
+		return MetricItem
+
+	def Render(self, ProcessSnapshots : Optional[Dict[str, MetricsSnapshotDict]] = None) -> List[str]:
+
+		return [Line for MetricItem in self.MetricList for Line in MetricItem.Render(ProcessSnapshots)]
+
+	def Snapshot(self) -> MetricsSnapshotDict:
+
+		return {MetricItem.Name : MetricItem.Snapshot() for MetricItem in self.MetricList if MetricItem.Values}
+
+async def ObserveDuration(HistogramItem : Histogram, Coroutine : Awaitable, LabelValues : LabelValueTuple = ()) -> Any:
+
+	StartTime = time.perf_counter()
+
+	try:
+
+		return await Coroutine
+
+	finally:
+
+		HistogramItem.Observe(time.perf_counter() - StartTime, LabelValues)
+
+async def ObserveIteratorDuration(HistogramItem : Histogram, Iterator : AsyncIterator, LabelValues : LabelValueTuple = ()) -> AsyncIterator:
+
+	# Streamed responses, observed once the last chunk is written, the iterator failed or the client disconnected
+	StartTime = time.perf_counter()
+
+	try:
+
+		async for Item in Iterator:
+
+			yield Item
+
+	finally:
+
+		HistogramItem.Observe(time.perf_counter() - StartTime, LabelValues)
+
+def RenderMetricsDict(Name : str, Description : str, MetricsDict : Dict[str, float], LabelNames : Tuple[str, ...] = (), LabelValues : LabelValueTuple = (), IncludeHeader : bool = True) -> List[str]:
+
+	# GetMetrics() dicts of pools and caches, read at scrape time, one gauge sample per key
+	HeaderLineList = [f"# HELP {Name} {Description}", f"# TYPE {Name} gauge"] if IncludeHeader else []
+
+	return HeaderLineList + \
+	[
+		f'{Name}{FormatLabels((*LabelNames, "metric"), (*LabelValues, MetricName))} {Value}'
+		for MetricName, Value in MetricsDict.items()
+	]
+
+class PipelineMetrics:
+
+	# Process wide metrics of the ingest pipeline and the API, rendered by /metrics
+
+	Registry = MetricsRegistry()
+
+	ImporterRows = Registry.Register(Counter("importer_rows_total", "CSV rows pushed or folded by the importer", ("mode",)))
+
+	ImporterQueueLag = Registry.Register(Gauge("importer_queue_lag", "Queue depth last measured by the importer backpressure"))
+
+	ImporterPaused = Registry.Register(Gauge("importer_paused", "1 while the importer waits for the queue to drain"))
+
+	ImporterPausedTime = Registry.Register(Counter("importer_paused_seconds_total", "Time the importer spent waiting for the queue to drain"))
+
+	AggregatorEvents = Registry.Register(Counter("aggregator_events_total", "Transactions folded into the aggregate hashes"))
+
+	AggregatorDuplicateEvents = Registry.Register(Counter("aggregator_duplicate_events_total", "Transactions skipped because their id was already aggregated"))
+
+	AggregatorScriptReloads = Registry.Register(Counter("aggregator_script_reloads_total", "Aggregate batch script loads after a NOSCRIPT reply"))
+
+	AggregatorBatchDuration = Registry.Register(Histogram("aggregator_batch_duration_seconds", "Fold and flush time of an aggregator batch"))
+
+	AggregatorEventLatency = Registry.Register(Histogram("aggregator_event_latency_seconds", "Per-event share of the fold and flush time of its batch"))
+
+	DumpCycleDuration = Registry.Register(Histogram("dumper_cycle_duration_seconds", "Duration of a dump cycle that found dirty keys", Buckets = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)))
+
+	DumpedDocuments = Registry.Register(Counter("dumper_documents_written_total", "Daily aggregate documents upserted by the dumper"))
+
+	DumperRetiredKeys = Registry.Register(Counter("dumper_retired_keys_total", "Aggregate keys deleted from Redis once persisted in MongoDb past the cutoff"))
+
+	DumperRestoredKeys = Registry.Register(Counter("dumper_restored_keys_total", "Retired aggregate keys written again and restored from MongoDb before their dump"))
+
+	StatsRequestDuration = Registry.Register(Histogram("stats_request_duration_seconds", "Duration of /stats requests, streamed ones until their last chunk", ("granularity",)))
+
+	StatsCoalescedRequests = Registry.Register(Counter("stats_coalesced_requests_total", "/stats requests answered by an identical request already in flight", ("granularity",)))
+
+	StatsFetchDuration = Registry.Register(Histogram("stats_fetch_duration_seconds", "Fetch time of the daily /stats path per data source", ("source",)))
+
+	CriticalTaskRetries = Registry.Register(Counter("critical_task_retries_total", "Retries of critical background tasks", ("task",)))
@@ -0,0 +1,181 @@
+
+import hashlib
+import logging
+
+from redis.asyncio import Redis
+from redis.exceptions import NoScriptError
+from AppConfig import AmountAccumulationMode
+from Monitoring.Metrics import PipelineMetrics
+from typing import Any, Dict, List, Tuple
+from HelperMethods import GetRedisDirtyAggregateKeysSetName, GetRedisDedupSetName, GetRedisAggregateLastModifiedHashName, GetRedisDayAggregateKeysSetName, GetRedisAggregateUpdatesChannelName
+
+logger = logging.getLogger("uvicorn")
+
+# (RedisKey, PaymentMethod) -> (Transaction id, Amount) of every identified event of a batch
+IdentifiedAmountsDict = Dict[Tuple[str, str], List[Tuple[str, float | int]]]
+
+# Redis command queued after the increments, its key must be its first argument: (Command, Key, Arguments...)
+RedisCommand = Tuple[Any, ...]
+
+# Bumped on every change of the script, processes running different versions each load and call their own SHA
+AggregateBatchScriptVersion = 1
+
+# KEYS: dirty set, last modified hash, then (aggregate key, dedup set, day key index) per group, then the keys of the trailing commands
+# ARGV: amount mode, dedup time to live, group count, written days, then per group: payment method, pre-summed amount ('' when none),
+# identified event count, (id, amount) per identified event, then per trailing command: command, argument count, arguments
+AggregateBatchScriptSource = f"-- AggregateBatch v{AggregateBatchScriptVersion}" + """
+local IsCentsMode = ARGV[1] == 'cents'
+local DedupTimeToLive = tonumber(ARGV[2])
+local GroupCount = tonumber(ARGV[3])
+local ArgumentIndex = 5
+local AppliedEventCount = 0
+local IsWritten = false
+
+local Time = redis.call('TIME')
+local Now = Time[1] * 1000 + math.floor(Time[2] / 1000)
+
+for GroupIndex = 0, GroupCount - 1 do
+
+	local AggregateKey, DedupKey, DayIndexKey = KEYS[3 + GroupIndex * 3], KEYS[4 + GroupIndex * 3], KEYS[5 + GroupIndex * 3]
+	local PaymentMethod, PreSummedAmount = ARGV[ArgumentIndex], ARGV[ArgumentIndex + 1]
+	local EventCount = tonumber(ARGV[ArgumentIndex + 2])
+	local IsGroupWritten = PreSummedAmount ~= ''
+	local Amount = IsGroupWritten and tonumber(PreSummedAmount) or 0
+
+	ArgumentIndex = ArgumentIndex + 3
+
+	for EventIndex = 1, EventCount do
+
+		-- SADD answers 0 for an id already aggregated, its amount is skipped
+		if redis.call('SADD', DedupKey, ARGV[ArgumentIndex]) == 1 then
+
+			Amount = Amount + tonumber(ARGV[ArgumentIndex + 1])
+			AppliedEventCount = AppliedEventCount + 1
+			IsGroupWritten = true
+
+		end
+
+		ArgumentIndex = ArgumentIndex + 2
+
+	end
+
+	if EventCount > 0 then
+
+		redis.call('EXPIRE', DedupKey, DedupTimeToLive)
+
+	end
+
+	if IsGroupWritten then
+
+		if IsCentsMode then
+
+			redis.call('HINCRBY', AggregateKey, PaymentMethod, string.format('%d', Amount))
+
+		else
+
+			redis.call('HINCRBYFLOAT', AggregateKey, PaymentMethod, string.format('%.17g', Amount))
+
+		end
+
+		redis.call('SADD', KEYS[1], AggregateKey)
+		redis.call('HSET', KEYS[2], AggregateKey, string.format('%d', Now))
+		redis.call('SADD', DayIndexKey, AggregateKey)
+
+		IsWritten = true
+
+	end
+
+end
+
+if IsWritten and ARGV[4] ~= '' then
+
+	redis.call('PUBLISH', '""" + GetRedisAggregateUpdatesChannelName() + """', ARGV[4])
+
+end
+
+while ArgumentIndex <= #ARGV do
+
+	local ArgumentCount = tonumber(ARGV[ArgumentIndex + 1])
+
+	redis.call(ARGV[ArgumentIndex], unpack(ARGV, ArgumentIndex + 2, ArgumentIndex + 1 + ArgumentCount))
+
+	ArgumentIndex = ArgumentIndex + 2 + ArgumentCount
+
+end
+
+return AppliedEventCount
+"""
+
+AggregateBatchScriptSha = hashlib.sha1(AggregateBatchScriptSource.encode("utf-8")).hexdigest()
+
+class AggregateBatchScript:
+
+	# Applies a whole batch in one EVALSHA: increments, dedup of identified transactions, last modified times, day key index,
+	# dirty marking, the update message and the queue acknowledgement or import checkpoint, atomically
+
+	@staticmethod
+	async def Load(Redis : Redis):
+
+		# Loaded at startup, a server that lost its script cache (restart, failover, SCRIPT FLUSH) gets it again on NOSCRIPT
+		Sha = await Redis.script_load(AggregateBatchScriptSource)
+
+		logger.info(f"✅ Aggregate batch script v{AggregateBatchScriptVersion} loaded ({Sha})")
+
+	@staticmethod
+	async def Apply(Redis : Redis, AggregatedAmountsDict : Dict[Tuple[str, str], float | int], IdentifiedAmounts : IdentifiedAmountsDict, AmountMode : AmountAccumulationMode, DedupTimeToLive : int, CommandList : List[RedisCommand]) -> int:
+
+		KeyList, ArgumentList = AggregateBatchScript.BuildArguments(AggregatedAmountsDict, IdentifiedAmounts, AmountMode, DedupTimeToLive, CommandList)
+
+		try:
+
+			return await Redis.evalsha(AggregateBatchScriptSha, len(KeyList), *KeyList, *ArgumentList)
+
+		except NoScriptError:
+
+			# Nothing of the batch was applied, it is safe to load the script and send it again
+			PipelineMetrics.AggregatorScriptReloads.Increment()
+
+			await AggregateBatchScript.Load(Redis)
+
+			return await Redis.evalsha(AggregateBatchScriptSha, len(KeyList), *KeyList, *ArgumentList)
+
+	@staticmethod
+	def BuildArguments(AggregatedAmountsDict : Dict[Tuple[str, str], float | int], IdentifiedAmounts : IdentifiedAmountsDict, AmountMode : AmountAccumulationMode, DedupTimeToLive : int, CommandList : List[RedisCommand]) -> Tuple[List[str], List[Any]]:
+
+		KeyList : List[str] = [GetRedisDirtyAggregateKeysSetName(), GetRedisAggregateLastModifiedHashName()]
+
+		GroupArgumentList : List[Any] = []
+
+		DaySet = set()
+
+		for AggregateKey in AggregatedAmountsDict.keys() | IdentifiedAmounts.keys():
+
+			RedisKey, PaymentMethod = AggregateKey
+
+			# agg:{Day}:{Type}s
+			Day = RedisKey.split(":")[1]
+
+			DaySet.add(Day)
+
+			KeyList.extend((RedisKey, GetRedisDedupSetName(Day), GetRedisDayAggregateKeysSetName(Day)))
+
+			# repr of a float round trips exactly through tonumber
+			PreSummedAmount = repr(AggregatedAmountsDict[AggregateKey]) if AggregateKey in AggregatedAmountsDict else ""
+
+			EventList = IdentifiedAmounts.get(AggregateKey, [])
+
+			GroupArgumentList.extend((PaymentMethod, PreSummedAmount, len(EventList)))
+
+			for TransactionId, Amount in EventList:
+
+				GroupArgumentList.extend((TransactionId, repr(Amount)))
+
+		ArgumentList : List[Any] = [AmountMode.value.lower(), max(int(DedupTimeToLive), 1), (len(KeyList) - 2) // 3, ",".join(sorted(DaySet)), *GroupArgumentList]
+
+		for Command in CommandList:
+
+			KeyList.append(Command[1])
+
+			ArgumentList.extend((Command[0], len(Command) - 1, *Command[1:]))
+
+		return KeyList, ArgumentList
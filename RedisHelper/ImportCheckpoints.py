@@ -0,0 +1,37 @@
+
+import os
+
+from redis.asyncio import Redis
+from typing import Any, List, Tuple
+from redis.asyncio.client import Pipeline
+from HelperMethods import GetRedisImportCheckpointsHashName
+
+class ImportCheckpoint:
+
+	# Byte offset of the first row of a CSV file that is not imported yet, keyed by the absolute file path
+
+	def __init__(self, Redis : Redis, FilePath : str):
+
+		self.Redis = Redis
+		self.FilePath = os.path.abspath(FilePath)
+		self.Offset = 0
+
+	async def Load(self) -> int:
+
+		Offset = await self.Redis.hget(GetRedisImportCheckpointsHashName(), self.FilePath)
+
+		self.Offset = int(Offset) if Offset is not None else 0
+
+		return self.Offset
+
+	def AddSaveCommands(self, Pipe : Pipeline, Offset : int):
+
+		# Queued in the MULTI/EXEC of the rows before Offset, the rows and their checkpoint are committed together
+		for Command in self.GetSaveCommands(Offset):
+
+			Pipe.execute_command(*Command)
+
+	def GetSaveCommands(self, Offset : int) -> List[Tuple[Any, ...]]:
+
+		# Also run by the aggregate batch script after the pre-aggregated sums of the rows before Offset
+		return [("HSET", GetRedisImportCheckpointsHashName(), self.FilePath, Offset)]
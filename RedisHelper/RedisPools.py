@@ -0,0 +1,108 @@
+
+import time
+import asyncio
+
+from typing import Dict
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError
+from redis.asyncio.connection import BlockingConnectionPool
+from AppConfig import AppConfig
+
+class MeteredConnectionPool(BlockingConnectionPool):
+
+	# Bounded pool, callers wait up to the pool timeout for a connection once every connection is checked out
+
+	def __init__(self, PoolName : str, **PoolOptions):
+
+		super().__init__(**PoolOptions)
+
+		self.PoolName = PoolName
+
+		self.Metrics = \
+		{
+			"Acquisitions" : 0,
+			"ExhaustedWaits" : 0,
+			"ExhaustedTimeouts" : 0,
+			"WaitTimeTotal" : 0.0,
+			"WaitTimeMax" : 0.0
+		}
+
+	async def get_connection(self, command_name = None, *keys, **options):
+
+		IsExhausted = not self.can_get_connection()
+
+		StartTime = time.perf_counter()
+
+		try:
+
+			Connection = await super().get_connection()
+
+		except ConnectionError as e:
+
+			# Only the wait for a free connection timing out, connection errors of ensure_connection are raised from other causes
+			if isinstance(e.__cause__, asyncio.TimeoutError):
+
+				self.Metrics["ExhaustedTimeouts"] += 1
+
+			raise
+
+		self.Metrics["Acquisitions"] += 1
+
+		if IsExhausted:
+
+			WaitTime = time.perf_counter() - StartTime
+
+			self.Metrics["ExhaustedWaits"] += 1
+
+			self.Metrics["WaitTimeTotal"] += WaitTime
+
+			self.Metrics["WaitTimeMax"] = max(self.Metrics["WaitTimeMax"], WaitTime)
+
+		return Connection
+
+	def GetMetrics(self) -> Dict[str, float]:
+
+		return dict(self.Metrics, MaxConnections = self.max_connections, InUse = len(self._in_use_connections), Idle = len(self._available_connections))
+
+def CreateRedisClient(AppConfig : AppConfig, PoolName : str, MaxConnections : int, SocketTimeout : float) -> Redis:
+
+	ConnectionPool = MeteredConnectionPool \
+	(
+		PoolName,
+		host = AppConfig.RedisHost,
+		port = AppConfig.RedisPort,
+		max_connections = MaxConnections,
+		timeout = AppConfig.RedisPoolTimeout,
+		socket_timeout = SocketTimeout,
+		socket_connect_timeout = AppConfig.RedisSocketConnectTimeout,
+		health_check_interval = AppConfig.RedisHealthCheckInterval
+	)
+
+	# The client owns its pool, closing the client disconnects the pool
+	return Redis.from_pool(ConnectionPool)
+
+# API readers, short commands and pipelines of /stats
+def CreateReaderRedisClient(AppConfig : AppConfig) -> Redis:
+
+	return CreateRedisClient(AppConfig, "Reader", AppConfig.RedisReaderPoolSize, AppConfig.RedisSocketTimeout)
+
+# Pipeline writers, importer pushes, aggregator increments and dumper reads
+def CreateWriterRedisClient(AppConfig : AppConfig) -> Redis:
+
+	return CreateRedisClient(AppConfig, "Writer", AppConfig.RedisWriterPoolSize, AppConfig.RedisSocketTimeout)
+
+# Blocking queue consumers, every aggregator worker holds a connection for the whole blocking pop
+def CreateConsumerRedisClient(AppConfig : AppConfig) -> Redis:
+
+	MaxConnections = AppConfig.RedisConsumerPoolSize if AppConfig.RedisConsumerPoolSize > 0 else AppConfig.AggregatorWorkerCount
+
+	# A blocking pop must not be cut by the socket timeout, it may wait for the check timeout and the batch linger time
+	SocketTimeout = AppConfig.RedisSocketTimeout + AppConfig.TransactionCkeckTimeout + AppConfig.AggregatorBatchLingerTime
+
+	return CreateRedisClient(AppConfig, "Consumer", MaxConnections, SocketTimeout)
+
+def GetRedisPoolMetrics(Redis : Redis) -> Dict[str, float]:
+
+	ConnectionPool = Redis.connection_pool
+
+	return ConnectionPool.GetMetrics() if isinstance(ConnectionPool, MeteredConnectionPool) else {}
@@ -2,7 +2,9 @@
 from redis.asyncio import Redis
 from typing import List, Optional
 from datetime import datetime, timezone
-from Models.DailyAggregate import DailyAggregate
+from Models.DailyAggregate import DailyAggregate, DailyAggregateRecord
+from AppConfig import AmountAccumulationMode
+from HelperMethods import GetRedisDirtyAggregateKeysSetName, GetRedisDumpingAggregateKeysSetName, GetAmountMinorUnitScale
 
 async def ScanRedisKeys(Redis : Redis, Pattern : List[str]) -> List[bytes]:
 
@@ -32,7 +34,24 @@ async def ScanRedisKeys(Redis : Redis, Pattern : List[str]) -> List[bytes]:
 
 	return KeysList
 
-async def GetDailyAggregatesByRedisKeys(Redis : Redis, *, KeyList : Optional[List[bytes]] = None, Pattern : Optional[List[str]] = None) -> List[DailyAggregate]:
+async def TakeDirtyAggregateKeys(Redis : Redis) -> List[bytes]:
+
+	# Atomically moves the dirty keys into the dumping set, keys left there by a failed dump are merged back in
+	async with Redis.pipeline(transaction = True) as pipe:
+
+		pipe.sunionstore(GetRedisDumpingAggregateKeysSetName(), [GetRedisDumpingAggregateKeysSetName(), GetRedisDirtyAggregateKeysSetName()])
+		pipe.delete(GetRedisDirtyAggregateKeysSetName())
+		pipe.smembers(GetRedisDumpingAggregateKeysSetName())
+
+		_, _, DirtyKeySet = await pipe.execute()
+
+	return list(DirtyKeySet)
+
+async def ReleaseDumpedAggregateKeys(Redis : Redis):
+
+	await Redis.delete(GetRedisDumpingAggregateKeysSetName())
+
+async def GetDailyAggregatesByRedisKeys(Redis : Redis, *, KeyList : Optional[List[bytes | str]] = None, Pattern : Optional[List[str]] = None, AmountMode : AmountAccumulationMode = AmountAccumulationMode.Float, AsRecords : bool = False) -> List[DailyAggregate] | List[DailyAggregateRecord]:
 
 	if (KeyList is None) and (Pattern is None):
 
@@ -44,7 +63,7 @@ async def GetDailyAggregatesByRedisKeys(Redis : Redis, *, KeyList : Optional[Lis
 
 		return []
 
-	RedisKeyList = [Key.decode('utf-8') for Key in RedisKeyList]
+	RedisKeyList = [Key.decode('utf-8') if isinstance(Key, bytes) else Key for Key in RedisKeyList]
 
 	DailyAggregateList = []
 
@@ -70,11 +89,37 @@ async def GetDailyAggregatesByRedisKeys(Redis : Redis, *, KeyList : Optional[Lis
 
 			continue
 		
-		TotalAmountPerMethodDict = \
-		{
-			PaymentMethod.decode('utf-8') : float(Amount.decode('utf-8'))
-			for PaymentMethod, Amount in DailyAggregateDict.items()
-		}
+		TotalAmountCentsPerMethodDict = None
+
+		if AmountMode == AmountAccumulationMode.Cents:
+
+			# Exact integer minor units, converted to decimals only here
+			TotalAmountCentsPerMethodDict = \
+			{
+				PaymentMethod.decode('utf-8') : int(Amount)
+				for PaymentMethod, Amount in DailyAggregateDict.items()
+			}
+
+			TotalAmountPerMethodDict = \
+			{
+				PaymentMethod : AmountCents / GetAmountMinorUnitScale()
+				for PaymentMethod, AmountCents in TotalAmountCentsPerMethodDict.items()
+			}
+
+		else:
+
+			TotalAmountPerMethodDict = \
+			{
+				PaymentMethod.decode('utf-8') : float(Amount.decode('utf-8'))
+				for PaymentMethod, Amount in DailyAggregateDict.items()
+			}
+
+		if AsRecords:
+
+			# Read path of /stats, no model validation for values parsed right above
+			DailyAggregateList.append(DailyAggregateRecord(StringDate, TransactionType, TotalAmountPerMethodDict))
+
+			continue
 
 		DailyAggregateList.append \
 		(
@@ -83,6 +128,7 @@ async def GetDailyAggregatesByRedisKeys(Redis : Redis, *, KeyList : Optional[Lis
 				Date = StringDate,
 				Type = TransactionType,
 				TotalAmount = TotalAmountPerMethodDict,
+				TotalAmountCents = TotalAmountCentsPerMethodDict,
 				LastUpdated = datetime.now(timezone.utc)
 			)
 		)
@@ -0,0 +1,81 @@
+
+import hashlib
+import logging
+
+from typing import List
+from redis.asyncio import Redis
+from redis.exceptions import NoScriptError
+from HelperMethods import GetRedisDirtyAggregateKeysSetName, GetRedisDumpingAggregateKeysSetName, GetRedisAggregateLastModifiedHashName, GetRedisRetiredAggregateKeysSetName, GetRedisDayAggregateKeysSetName
+
+logger = logging.getLogger("uvicorn")
+
+# Bumped on every change of the script, processes running different versions each load and call their own SHA
+RetireAggregateKeysScriptVersion = 1
+
+# KEYS: dirty set, dumping set, last modified hash, retired set, then (aggregate key, day key index) per key
+# ARGV: server time in milliseconds before the keys were compared with MongoDb
+RetireAggregateKeysScriptSource = f"-- RetireAggregateKeys v{RetireAggregateKeysScriptVersion}" + """
+local ComparedAt = tonumber(ARGV[1])
+local RetiredKeyList = {}
+
+for KeyIndex = 5, #KEYS, 2 do
+
+	local AggregateKey, DayIndexKey = KEYS[KeyIndex], KEYS[KeyIndex + 1]
+	local LastModified = tonumber(redis.call('HGET', KEYS[3], AggregateKey) or '0')
+
+	-- A key written since it was compared is not what MongoDb holds, it is dumped again and retired by a later pass
+	if LastModified < ComparedAt and redis.call('SISMEMBER', KEYS[1], AggregateKey) == 0 and redis.call('SISMEMBER', KEYS[2], AggregateKey) == 0 then
+
+		redis.call('UNLINK', AggregateKey)
+		redis.call('HDEL', KEYS[3], AggregateKey)
+		redis.call('SREM', DayIndexKey, AggregateKey)
+		redis.call('SADD', KEYS[4], AggregateKey)
+
+		table.insert(RetiredKeyList, AggregateKey)
+
+	end
+
+end
+
+return RetiredKeyList
+"""
+
+RetireAggregateKeysScriptSha = hashlib.sha1(RetireAggregateKeysScriptSource.encode("utf-8")).hexdigest()
+
+class RetireAggregateKeysScript:
+
+	# Deletes aggregate keys already persisted in MongoDb, atomically with the checks that no aggregator wrote them since
+
+	@staticmethod
+	async def Load(Redis : Redis):
+
+		Sha = await Redis.script_load(RetireAggregateKeysScriptSource)
+
+		logger.info(f"✅ Retire aggregate keys script v{RetireAggregateKeysScriptVersion} loaded ({Sha})")
+
+	@staticmethod
+	async def Retire(Redis : Redis, KeyList : List[str], ComparedAt : int) -> List[bytes]:
+
+		RedisKeyList : List[str] = \
+		[
+			GetRedisDirtyAggregateKeysSetName(),
+			GetRedisDumpingAggregateKeysSetName(),
+			GetRedisAggregateLastModifiedHashName(),
+			GetRedisRetiredAggregateKeysSetName()
+		]
+
+		for Key in KeyList:
+
+			# agg:{Day}:{Type}s
+			RedisKeyList.extend((Key, GetRedisDayAggregateKeysSetName(Key.split(":")[1])))
+
+		try:
+
+			return await Redis.evalsha(RetireAggregateKeysScriptSha, len(RedisKeyList), *RedisKeyList, ComparedAt)
+
+		except NoScriptError:
+
+			# Nothing was retired, it is safe to load the script and send it again
+			await RetireAggregateKeysScript.Load(Redis)
+
+			return await Redis.evalsha(RetireAggregateKeysScriptSha, len(RedisKeyList), *RedisKeyList, ComparedAt)
@@ -0,0 +1,272 @@
+
+import time
+
+from redis.asyncio import Redis
+from typing import List, Tuple, Any
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+from AppConfig import TransactionQueueBackend
+
+StreamPayloadFieldName = "Transaction"
+
+# Entry ids per XACK/XDEL command
+StreamAcknowledgeSliceSize = 1000
+
+class TransactionQueue:
+
+	# Subclasses must override AddPushCommands, PopBatch, GetAcknowledgeCommands and GetDepth
+
+	def __init__(self, Redis : Redis, QueueKey : str):
+
+		self.Redis = Redis
+		self.QueueKey = QueueKey
+
+	async def Initialize(self):
+
+		pass
+
+	async def Push(self, PayloadList : List[bytes | str], BatchSize : int = 1):
+
+		async with self.Redis.pipeline(transaction = False) as pipe:
+
+			self.AddPushCommands(pipe, PayloadList, BatchSize)
+
+			await pipe.execute()
+
+	def AddPushCommands(self, Pipe : Pipeline, PayloadList : List[bytes | str], BatchSize : int = 1):
+
+		raise NotImplementedError()
+
+	async def PopBatch(self, TransactionCkeckTimeout : float, BatchSize : int, BatchLingerTime : float) -> Tuple[List[bytes], List[Any]]:
+
+		raise NotImplementedError()
+
+	def AddAcknowledgeCommands(self, Pipe : Pipeline, AcknowledgeIdList : List[Any]):
+
+		for Command in self.GetAcknowledgeCommands(AcknowledgeIdList):
+
+			Pipe.execute_command(*Command)
+
+	def GetAcknowledgeCommands(self, AcknowledgeIdList : List[Any]) -> List[Tuple[Any, ...]]:
+
+		# (Command, Key, Arguments...) tuples, run by the aggregate batch script with the increments of the batch
+		raise NotImplementedError()
+
+	async def GetDepth(self) -> int:
+
+		raise NotImplementedError()
+
+class ListTransactionQueue(TransactionQueue):
+
+	async def Push(self, PayloadList : List[bytes | str], BatchSize : int = 1):
+
+		if len(PayloadList) == 1:
+
+			await self.Redis.lpush(self.QueueKey, PayloadList[0])
+
+			return
+
+		await super().Push(PayloadList, BatchSize)
+
+	def AddPushCommands(self, Pipe : Pipeline, PayloadList : List[bytes | str], BatchSize : int = 1):
+
+		for BatchStart in range(0, len(PayloadList), BatchSize):
+
+			Pipe.lpush(self.QueueKey, *PayloadList[BatchStart : BatchStart + BatchSize])
+
+	async def PopBatch(self, TransactionCkeckTimeout : float, BatchSize : int, BatchLingerTime : float) -> Tuple[List[bytes], List[Any]]:
+
+		# Block only for the first transaction, the rest of the batch is drained without waiting on an empty queue
+		RedisStoredTransaction = await self.Redis.brpop(self.QueueKey, timeout = TransactionCkeckTimeout)
+
+		if RedisStoredTransaction is None:
+
+			return [], []
+
+		_, TransactionPayload = RedisStoredTransaction
+
+		TransactionPayloadList = [TransactionPayload]
+
+		LingerDeadline = time.monotonic() + BatchLingerTime
+
+		while len(TransactionPayloadList) < BatchSize:
+
+			RemainingCount = BatchSize - len(TransactionPayloadList)
+
+			PoppedPayloadList = await self.Redis.rpop(self.QueueKey, RemainingCount)
+
+			if PoppedPayloadList:
+
+				TransactionPayloadList.extend(PoppedPayloadList)
+
+				continue
+
+			RemainingLingerTime = LingerDeadline - time.monotonic()
+
+			if RemainingLingerTime <= 0:
+
+				break
+
+			# BLMPOP returns as soon as anything is pushed, or None once the linger time is over
+			BlockingPopResult = await self.Redis.blmpop(RemainingLingerTime, 1, self.QueueKey, direction = "RIGHT", count = RemainingCount)
+
+			if BlockingPopResult is None:
+
+				break
+
+			_, PoppedPayloadList = BlockingPopResult
+
+			TransactionPayloadList.extend(PoppedPayloadList)
+
+		# Popped list items are gone from Redis, there is nothing to acknowledge
+		return TransactionPayloadList, []
+
+	def GetAcknowledgeCommands(self, AcknowledgeIdList : List[Any]) -> List[Tuple[Any, ...]]:
+
+		return []
+
+	async def GetDepth(self) -> int:
+
+		return await self.Redis.llen(self.QueueKey)
+
+class StreamTransactionQueue(TransactionQueue):
+
+	def __init__(self, Redis : Redis, QueueKey : str, GroupName : str, ConsumerName : str, PendingReclaimIdleTime : int):
+
+		super().__init__(Redis, QueueKey)
+
+		self.GroupName = GroupName
+		self.ConsumerName = ConsumerName
+		self.PendingReclaimIdleTime = PendingReclaimIdleTime
+		self.NextReclaimTime = 0.0
+
+	async def Initialize(self):
+
+		try:
+
+			await self.Redis.xgroup_create(self.QueueKey, self.GroupName, id = "0", mkstream = True)
+
+		except ResponseError as e:
+
+			# Group was already created by another worker
+			if "BUSYGROUP" not in str(e):
+
+				raise
+
+	async def Push(self, PayloadList : List[bytes | str], BatchSize : int = 1):
+
+		if len(PayloadList) == 1:
+
+			await self.Redis.xadd(self.QueueKey, { StreamPayloadFieldName : PayloadList[0] })
+
+			return
+
+		await super().Push(PayloadList, BatchSize)
+
+	def AddPushCommands(self, Pipe : Pipeline, PayloadList : List[bytes | str], BatchSize : int = 1):
+
+		for Payload in PayloadList:
+
+			Pipe.xadd(self.QueueKey, { StreamPayloadFieldName : Payload })
+
+	async def PopBatch(self, TransactionCkeckTimeout : float, BatchSize : int, BatchLingerTime : float) -> Tuple[List[bytes], List[Any]]:
+
+		EntryList = await self.ReclaimPendingEntries(BatchSize)
+
+		if len(EntryList) < BatchSize:
+
+			EntryList.extend(await self.ReadNewEntries(BatchSize - len(EntryList), int(TransactionCkeckTimeout * 1000)))
+
+		LingerDeadline = time.monotonic() + BatchLingerTime
+
+		while EntryList and len(EntryList) < BatchSize:
+
+			RemainingLingerTime = int((LingerDeadline - time.monotonic()) * 1000)
+
+			if RemainingLingerTime <= 0:
+
+				break
+
+			NewEntryList = await self.ReadNewEntries(BatchSize - len(EntryList), RemainingLingerTime)
+
+			if not NewEntryList:
+
+				break
+
+			EntryList.extend(NewEntryList)
+
+		TransactionPayloadList = []
+
+		AcknowledgeIdList = []
+
+		for EntryId, EntryFields in EntryList:
+
+			AcknowledgeIdList.append(EntryId)
+
+			# Entries deleted while pending can come back without fields, they only need to be acknowledged
+			if EntryFields:
+
+				TransactionPayloadList.append(EntryFields[StreamPayloadFieldName.encode('utf-8')])
+
+		return TransactionPayloadList, AcknowledgeIdList
+
+	def GetAcknowledgeCommands(self, AcknowledgeIdList : List[Any]) -> List[Tuple[Any, ...]]:
+
+		CommandList = []
+
+		# Acknowledged entries are deleted as well so the stream only holds unprocessed transactions,
+		# split in slices so the script never unpacks more arguments than the Lua stack holds
+		for SliceStart in range(0, len(AcknowledgeIdList), StreamAcknowledgeSliceSize):
+
+			AcknowledgeIdSlice = AcknowledgeIdList[SliceStart : SliceStart + StreamAcknowledgeSliceSize]
+
+			CommandList.append(("XACK", self.QueueKey, self.GroupName, *AcknowledgeIdSlice))
+
+			CommandList.append(("XDEL", self.QueueKey, *AcknowledgeIdSlice))
+
+		return CommandList
+
+	async def GetDepth(self) -> int:
+
+		# Acknowledged entries are deleted, the stream length counts new and pending transactions
+		return await self.Redis.xlen(self.QueueKey)
+
+	async def ReadNewEntries(self, Count : int, BlockTime : int) -> List[Tuple[bytes, dict]]:
+
+		StreamEntryList = await self.Redis.xreadgroup(self.GroupName, self.ConsumerName, { self.QueueKey : ">" }, count = Count, block = max(BlockTime, 1))
+
+		if not StreamEntryList:
+
+			return []
+
+		_, EntryList = StreamEntryList[0]
+
+		return list(EntryList)
+
+	async def ReclaimPendingEntries(self, Count : int) -> List[Tuple[bytes, dict]]:
+
+		# Entries delivered to a consumer that crashed before acknowledging are taken over once they are idle long enough
+		if time.monotonic() < self.NextReclaimTime:
+
+			return []
+
+		self.NextReclaimTime = time.monotonic() + self.PendingReclaimIdleTime / 1000
+
+		ReclaimResult = await self.Redis.xautoclaim(self.QueueKey, self.GroupName, self.ConsumerName, self.PendingReclaimIdleTime, start_id = "0-0", count = Count)
+
+		EntryList = list(ReclaimResult[1])
+
+		# More pending entries than a single batch, keep reclaiming on the next round
+		if ReclaimResult[0] not in (b"0-0", "0-0"):
+
+			self.NextReclaimTime = 0.0
+
+		return EntryList
+
+def CreateTransactionQueue(Redis : Redis, Backend : TransactionQueueBackend, QueueKey : str, GroupName : str = "", ConsumerName : str = "", PendingReclaimIdleTime : int = 0) -> TransactionQueue:
+
+	if Backend == TransactionQueueBackend.Stream:
+
+		return StreamTransactionQueue(Redis, QueueKey, GroupName, ConsumerName, PendingReclaimIdleTime)
+
+	return ListTransactionQueue(Redis, QueueKey)
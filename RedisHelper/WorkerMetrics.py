@@ -0,0 +1,52 @@
+import orjson
+import asyncio
+import logging
+
+from typing import Dict, List
+from redis.asyncio import Redis
+from HelperMethods import GetRedisWorkerMetricsKeyName
+from Monitoring.Metrics import PipelineMetrics, MetricsSnapshotDict
+
+logger = logging.getLogger("uvicorn")
+
+class WorkerMetrics:
+
+	# Recorded metrics of the worker processes, written to Redis by every process and rendered by /metrics of the API process
+
+	@staticmethod
+	async def Publish(Redis : Redis, ProcessName : str):
+
+		try:
+
+			# Overwritten, not merged, a restarted process starts from zero like a Prometheus counter reset
+			await Redis.set(GetRedisWorkerMetricsKeyName(ProcessName), orjson.dumps(PipelineMetrics.Registry.Snapshot()))
+
+		except Exception as e:
+
+			logger.info(f"⚠️ Metrics of {ProcessName} not published: {e}")
+
+	@staticmethod
+	async def PublishPeriodically(Redis : Redis, ProcessName : str, Interval : float):
+
+		while True:
+
+			await asyncio.sleep(Interval)
+
+			await WorkerMetrics.Publish(Redis, ProcessName)
+
+	@staticmethod
+	async def Load(Redis : Redis, ProcessNameList : List[str]) -> Dict[str, MetricsSnapshotDict]:
+
+		if not ProcessNameList:
+
+			return {}
+
+		SnapshotList = await Redis.mget([GetRedisWorkerMetricsKeyName(ProcessName) for ProcessName in ProcessNameList])
+
+		# A process that did not publish yet has no samples
+		return \
+		{
+			ProcessName : orjson.loads(Snapshot)
+			for ProcessName, Snapshot in zip(ProcessNameList, SnapshotList)
+			if Snapshot is not None
+		}